@@ -0,0 +1,294 @@
+# benchmark.py
+# Teste de carga do servidor HTTP de imagens.
+# Inicia o servidor.py localmente numa porta livre (ou usa um servidor já em execução com --url),
+# abre N conexões keep-alive simultâneas e envia uma mistura de requisições (galeria, CSS,
+# imagem pequena, imagem grande e arquivos inexistentes) durante um tempo fixo.
+# Ao final imprime um relatório JSON com vazão, latências p50/p95/p99 e taxa de erros,
+# por tipo de requisição e no total. Com vários --modo, cada motor é medido em sequência.
+#
+# Exemplos:
+#   python benchmark.py --conexoes 50 --duracao 10
+#   python benchmark.py --modo threads asyncio --conexoes 200 > resultado.json
+#   python benchmark.py --url http://192.168.0.10:8000 --conexoes 20
+
+import argparse
+import http.client                      # Cliente HTTP/1.1 com conexão persistente, sem dependências
+import json
+import os
+import random
+import signal                           # Ctrl+C no servidor iniciado pelo benchmark
+import subprocess                       # Executa o servidor.py em outro processo
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Pasta do servidor.py (o benchmark fica ao lado dele)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+image_folder = os.path.join(script_dir, "imagens")
+
+# Peso de cada tipo de requisição na mistura (proporção aproximada de um navegador abrindo a galeria)
+mistura_padrao = {
+    "index": 10,
+    "css": 10,
+    "imagem_pequena": 40,
+    "imagem_grande": 20,
+    "nao_encontrado": 20,
+}
+
+# Tempo máximo (em segundos) para o servidor iniciado pelo benchmark ficar pronto
+tempo_inicializacao = 15
+
+# ==========================
+# SERVIDOR LOCAL
+# ==========================
+
+# Inicia o servidor.py numa porta livre e espera a linha "Servidor rodando em host:porta"
+def iniciar_servidor(modo, argumentos_extras):
+    comando = [sys.executable, "-u", os.path.join(script_dir, "servidor.py"),
+               "--host", "127.0.0.1", "--porta", "0", "--modo", modo] + argumentos_extras
+    processo = subprocess.Popen(comando, cwd=script_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding="utf-8", errors="replace")
+
+    saida = []
+    pronto = threading.Event()
+    porta = []
+
+    # Lê a saída do servidor numa thread: a porta vem na primeira linha, e o resto precisa ser
+    # consumido para o servidor não travar escrevendo num pipe cheio
+    def ler_saida():
+        for linha in processo.stdout:
+            saida.append(linha.rstrip())
+            if not pronto.is_set() and linha.startswith("Servidor rodando em"):
+                porta.append(int(linha.split()[3].rsplit(":", 1)[1]))
+                pronto.set()
+        pronto.set()
+
+    threading.Thread(target=ler_saida, daemon=True).start()
+    if not pronto.wait(tempo_inicializacao) or not porta:
+        parar_servidor(processo)
+        raise RuntimeError("O servidor não iniciou:\n" + "\n".join(saida[-20:]))
+    return processo, f"http://127.0.0.1:{porta[0]}"
+
+
+# Encerra o servidor como um Ctrl+C (para ele imprimir as estatísticas e fechar o pool)
+def parar_servidor(processo):
+    if processo.poll() is not None:
+        return
+    if os.name == "nt":
+        processo.terminate()
+    else:
+        processo.send_signal(signal.SIGINT)
+    try:
+        processo.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+        processo.wait()
+
+# ==========================
+# MISTURA DE REQUISIÇÕES
+# ==========================
+
+# Caminho pedido e status esperado para cada tipo de requisição.
+# A imagem pequena e a grande são a menor e a maior da pasta imagens/.
+def montar_alvos():
+    imagens = sorted((e.stat().st_size, e.name) for e in os.scandir(image_folder)
+                     if e.name.lower().endswith((".jpg", ".jpeg", ".png")) and e.is_file())
+    if not imagens:
+        raise RuntimeError(f"Nenhuma imagem encontrada em {image_folder}")
+    return {
+        "index": ("/", 200),
+        "css": ("/style.css", 200),
+        "imagem_pequena": ("/" + imagens[0][1], 200),
+        "imagem_grande": ("/" + imagens[-1][1], 200),
+        "nao_encontrado": ("/nao_existe.jpg", 404),
+    }
+
+
+# Lê pesos no formato "index=10,css=10,imagem_grande=50" (tipos omitidos ficam com peso 0)
+def interpretar_mistura(texto):
+    if not texto:
+        return dict(mistura_padrao)
+    mistura = {}
+    for item in texto.split(","):
+        nome, _, peso = item.partition("=")
+        nome = nome.strip()
+        if nome not in mistura_padrao:
+            raise argparse.ArgumentTypeError(f"tipo desconhecido na mistura: {nome}")
+        mistura[nome] = float(peso or 1)
+    return mistura
+
+# ==========================
+# GERAÇÃO DE CARGA
+# ==========================
+
+# Resultados de um tipo de requisição
+class Resultado:
+
+    def __init__(self):
+        self.latencias = []     # Segundos, uma por requisição concluída
+        self.erros = 0          # Falhas de conexão ou status diferente do esperado
+        self.bytes = 0
+        self.status = {}        # código -> quantidade
+
+
+# Uma conexão keep-alive enviando requisições até `fim`. Cada thread guarda seus próprios
+# resultados (sem lock no caminho da medição); eles são somados no final.
+def trabalhador(url, alvos, tipos, pesos, inicio_medicao, fim, cabecalhos, resultados, semente):
+    sorteio = random.Random(semente)
+    partes = urlsplit(url)
+    conexao = None
+    while True:
+        agora = time.perf_counter()
+        if agora >= fim:
+            break
+        tipo = sorteio.choices(tipos, pesos)[0]
+        caminho, esperado = alvos[tipo]
+        if conexao is None:
+            conexao = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+
+        inicio = time.perf_counter()
+        try:
+            conexao.request("GET", caminho, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            corpo = resposta.read()
+            status = resposta.status
+            if resposta.will_close:
+                conexao.close()
+                conexao = None
+        except (OSError, http.client.HTTPException):
+            status = None
+            corpo = b""
+            conexao.close()
+            conexao = None
+        duracao = time.perf_counter() - inicio
+
+        # Requisições do aquecimento não entram no resultado
+        if inicio < inicio_medicao:
+            continue
+        resultado = resultados[tipo]
+        resultado.status[status] = resultado.status.get(status, 0) + 1
+        if status != esperado:
+            resultado.erros += 1
+            continue
+        resultado.latencias.append(duracao)
+        resultado.bytes += len(corpo)
+
+    if conexao is not None:
+        conexao.close()
+
+
+# Executa a carga contra `url` e devolve o relatório (dicionário)
+def medir(url, conexoes, duracao, aquecimento, mistura, comprimir):
+    alvos = montar_alvos()
+    tipos = [tipo for tipo, peso in mistura.items() if peso > 0]
+    pesos = [mistura[tipo] for tipo in tipos]
+    cabecalhos = {"Accept-Encoding": "gzip"} if comprimir else {}
+
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+    por_thread = [{tipo: Resultado() for tipo in tipos} for _ in range(conexoes)]
+    threads = [
+        threading.Thread(target=trabalhador, daemon=True,
+                         args=(url, alvos, tipos, pesos, inicio_medicao, fim, cabecalhos, por_thread[i], i))
+        for i in range(conexoes)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Soma os resultados de todas as threads, por tipo e no total
+    totais = {tipo: Resultado() for tipo in tipos + ["total"]}
+    for resultados in por_thread:
+        for tipo, resultado in resultados.items():
+            for destino in (totais[tipo], totais["total"]):
+                destino.latencias.extend(resultado.latencias)
+                destino.erros += resultado.erros
+                destino.bytes += resultado.bytes
+                for status, quantidade in resultado.status.items():
+                    destino.status[status] = destino.status.get(status, 0) + quantidade
+
+    return {
+        "url": url,
+        "conexoes": conexoes,
+        "duracao_s": duracao,
+        "mistura": {tipo: alvos[tipo][0] for tipo in tipos},
+        "resultados": {tipo: resumir(resultado, duracao) for tipo, resultado in totais.items()},
+    }
+
+
+# Vazão, percentis de latência e taxa de erros de um Resultado
+def resumir(resultado, duracao):
+    latencias = sorted(resultado.latencias)
+    total = len(latencias) + resultado.erros
+    return {
+        "requisicoes": total,
+        "requisicoes_por_s": round(len(latencias) / duracao, 1),
+        "mb_por_s": round(resultado.bytes / duracao / 1024 / 1024, 2),
+        "latencia_ms": {
+            "p50": percentil(latencias, 50),
+            "p95": percentil(latencias, 95),
+            "p99": percentil(latencias, 99),
+            "max": round(latencias[-1] * 1000, 3) if latencias else None,
+        },
+        "erros": resultado.erros,
+        "taxa_erros": round(resultado.erros / total, 4) if total else 0.0,
+        "status": {str(status): quantidade for status, quantidade in sorted(resultado.status.items(), key=str)},
+    }
+
+
+# Percentil pelo método do posto mais próximo, em milissegundos
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    posicao = max(0, -(-len(ordenadas) * p // 100) - 1)
+    return round(ordenadas[int(posicao)] * 1000, 3)
+
+# ==========================
+# PROGRAMA PRINCIPAL
+# ==========================
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor HTTP de imagens",
+                                     epilog="Argumentos após -- são repassados ao servidor.py "
+                                            "(ex: -- --cache-mb 16 --sem-miniaturas)")
+    parser.add_argument("--modo", nargs="+", default=["threads"], choices=["threads", "asyncio"],
+                        help="motor(es) do servidor a medir; vários são medidos em sequência")
+    parser.add_argument("--url", help="mede um servidor já em execução em vez de iniciar um local")
+    parser.add_argument("--conexoes", type=int, default=20, help="conexões keep-alive simultâneas")
+    parser.add_argument("--duracao", type=float, default=10, help="segundos de medição")
+    parser.add_argument("--aquecimento", type=float, default=2,
+                        help="segundos iniciais descartados (cache e miniaturas sendo preenchidos)")
+    parser.add_argument("--mistura", type=interpretar_mistura, default=None,
+                        help="pesos por tipo, ex: index=10,css=10,imagem_pequena=40,imagem_grande=20,nao_encontrado=20")
+    parser.add_argument("--gzip", action="store_true", help="envia Accept-Encoding: gzip (como um navegador)")
+    parser.add_argument("--saida", help="grava o JSON neste arquivo (além de imprimir)")
+    args, extras = parser.parse_known_args()
+    extras = [arg for arg in extras if arg != "--"]
+    mistura = args.mistura or dict(mistura_padrao)
+
+    relatorios = []
+    if args.url:
+        relatorios.append(medir(args.url.rstrip("/"), args.conexoes, args.duracao, args.aquecimento,
+                                mistura, args.gzip))
+    else:
+        for modo in args.modo:
+            print(f"⏱️ Medindo modo {modo} ({args.conexoes} conexões, {args.duracao:g}s)...", file=sys.stderr)
+            processo, url = iniciar_servidor(modo, ["--max-conexoes", str(max(512, args.conexoes * 2))] + extras)
+            try:
+                relatorio = medir(url, args.conexoes, args.duracao, args.aquecimento, mistura, args.gzip)
+            finally:
+                parar_servidor(processo)
+            relatorio["modo"] = modo
+            relatorios.append(relatorio)
+
+    texto = json.dumps(relatorios if len(relatorios) > 1 else relatorios[0], indent=2, ensure_ascii=False)
+    print(texto)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as file:
+            file.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
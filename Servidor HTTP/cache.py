@@ -0,0 +1,189 @@
+# cache.py
+# Cache em memória do conteúdo dos arquivos servidos (imagens, CSS e o modelo index.html).
+# Cada arquivo é lido do disco uma única vez; nas requisições seguintes basta um os.stat()
+# para confirmar que o arquivo não mudou (mesmo mtime e tamanho) e o conteúdo sai da memória.
+# Quando a soma dos arquivos passa do limite de bytes, os menos usados recentemente (LRU) saem.
+# Arquivos acima de limite_arquivo não têm o conteúdo carregado: a entrada guarda só os
+# metadados (dados = None) e o servidor envia o arquivo direto do disco com sendfile.
+# Cada entrada também guarda o ETag (hash do conteúdo), calculado uma única vez por versão do arquivo,
+# e as versões comprimidas (gzip, br, zstd) já geradas, que contam no mesmo limite de bytes.
+
+import hashlib                          # Hash do conteúdo para o ETag
+import mimetypes                        # Descobre o Content-type pela extensão do arquivo
+import os
+import stat                             # Para conferir se o caminho é um arquivo comum
+import threading                        # O cache é compartilhado por todos os workers
+from collections import OrderedDict     # Mantém a ordem de uso para o descarte LRU
+from email.utils import formatdate      # Data no formato HTTP para o cabeçalho Last-Modified
+
+from compressao import comprimir, etag_variante
+
+
+# Tudo o que é guardado sobre um arquivo: conteúdo e cabeçalhos já prontos para envio
+class EntradaCache:
+
+    __slots__ = ("caminho", "mtime_ns", "tamanho", "dados", "tipo", "etag", "modificado", "last_modified", "cabecalhos",
+                 "variantes")
+
+    def __init__(self, caminho, info, dados, etag):
+        self.caminho = caminho
+        self.mtime_ns = info.st_mtime_ns    # Usados para detectar se o arquivo mudou no disco
+        self.tamanho = info.st_size
+        self.dados = dados                  # Conteúdo do arquivo, ou None para arquivos grandes
+
+        # Cabeçalhos calculados uma única vez, e não a cada requisição
+        self.tipo = mimetypes.guess_type(caminho)[0] or "application/octet-stream"
+        self.etag = etag                    # ETag forte: hash do conteúdo entre aspas
+        self.modificado = int(info.st_mtime)  # Data de modificação em segundos (precisão do Last-Modified)
+        self.last_modified = formatdate(info.st_mtime, usegmt=True)
+        self.cabecalhos = [
+            ("ETag", etag),
+            ("Last-Modified", self.last_modified),
+        ]
+        # Codificação -> (conteúdo comprimido, ETag), ou None quando comprimir não diminuiu o tamanho
+        self.variantes = {}
+
+    # Confere se a entrada ainda corresponde ao arquivo descrito por um os.stat()
+    def valida(self, info):
+        return self.mtime_ns == info.st_mtime_ns and self.tamanho == info.st_size
+
+
+class CacheConteudo:
+
+    def __init__(self, limite_bytes, limite_arquivo=None):
+        self.limite_bytes = limite_bytes    # Orçamento total de memória para o conteúdo dos arquivos
+        self.limite_arquivo = limite_arquivo  # Acima deste tamanho o conteúdo não é carregado (None = sem limite)
+        self.bytes_usados = 0
+        self._itens = OrderedDict()         # caminho -> EntradaCache (o mais recente fica no fim)
+        self._lock = threading.Lock()
+
+        # Contadores de desempenho
+        self.acertos = 0        # Respostas servidas direto da memória
+        self.falhas = 0         # Arquivo precisou ser lido do disco
+        self.despejos = 0       # Entradas removidas para respeitar o limite de bytes
+        self.invalidacoes = 0   # Entradas descartadas porque o arquivo mudou ou sumiu
+        self.compressoes = 0    # Versões comprimidas geradas (cada uma é feita uma única vez)
+
+    # Devolve a EntradaCache do arquivo, ou None se ele não existir (ou não for um arquivo comum)
+    def obter(self, caminho):
+        try:
+            info = os.stat(caminho)
+        except (FileNotFoundError, NotADirectoryError):
+            self._remover(caminho)
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+
+        with self._lock:
+            entrada = self._itens.get(caminho)
+            if entrada is not None:
+                if entrada.valida(info):
+                    # Acerto: marca como usada recentemente e devolve sem tocar no disco
+                    self._itens.move_to_end(caminho)
+                    self.acertos += 1
+                    return entrada
+                # O arquivo mudou desde a leitura: descarta a versão antiga
+                self._descartar(caminho)
+                self.invalidacoes += 1
+            self.falhas += 1
+
+        # Falha: lê o arquivo fora do lock para não travar os outros workers.
+        # Arquivos grandes não são lidos: só os metadados ficam no cache.
+        if self.limite_arquivo is not None and info.st_size > self.limite_arquivo:
+            dados = None
+            etag = etag_arquivo(caminho)
+        else:
+            with open(caminho, "rb") as file:
+                dados = file.read()
+            etag = etag_conteudo(dados)
+        entrada = EntradaCache(caminho, info, dados, etag)
+        self._guardar(entrada)
+        return entrada
+
+    # Versão comprimida do conteúdo de uma entrada em memória, gerada na primeira vez que é pedida
+    # e reaproveitada enquanto o arquivo não mudar. Retorna (dados, etag) ou None se não compensar.
+    def variante(self, entrada, codificacao):
+        with self._lock:
+            if codificacao in entrada.variantes:
+                return entrada.variantes[codificacao]
+
+        # Comprime fora do lock (o nível máximo de compressão é lento para os outros workers esperarem)
+        comprimido = comprimir(entrada.dados, codificacao)
+        variante = None
+        if len(comprimido) < len(entrada.dados):
+            variante = (comprimido, etag_variante(entrada.etag, codificacao))
+
+        with self._lock:
+            # Dois workers podem ter comprimido ao mesmo tempo: vale a primeira versão guardada
+            if codificacao not in entrada.variantes:
+                entrada.variantes[codificacao] = variante
+                self.compressoes += 1
+                # Só conta no orçamento se a entrada ainda estiver no cache
+                if variante is not None and self._itens.get(entrada.caminho) is entrada:
+                    self.bytes_usados += len(comprimido)
+                    self._respeitar_limite()
+            return entrada.variantes[codificacao]
+
+    # Resumo dos contadores (para logs e métricas)
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "itens": len(self._itens),
+                "bytes_usados": self.bytes_usados,
+                "limite_bytes": self.limite_bytes,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "despejos": self.despejos,
+                "invalidacoes": self.invalidacoes,
+                "compressoes": self.compressoes,
+            }
+
+    def _guardar(self, entrada):
+        # Arquivos maiores que o orçamento inteiro são servidos, mas nunca guardados
+        if _custo(entrada) > self.limite_bytes:
+            return
+        with self._lock:
+            if entrada.caminho in self._itens:
+                self._descartar(entrada.caminho)
+            self._itens[entrada.caminho] = entrada
+            self.bytes_usados += _custo(entrada)
+            self._respeitar_limite()
+
+    # Remove os itens usados há mais tempo até caber no limite (deve ser chamado com o lock adquirido)
+    def _respeitar_limite(self):
+        while self.bytes_usados > self.limite_bytes:
+            antigo, _ = next(iter(self._itens.items()))
+            self._descartar(antigo)
+            self.despejos += 1
+
+    def _remover(self, caminho):
+        with self._lock:
+            if caminho in self._itens:
+                self._descartar(caminho)
+                self.invalidacoes += 1
+
+    # Remove uma entrada (deve ser chamado com o lock já adquirido)
+    def _descartar(self, caminho):
+        entrada = self._itens.pop(caminho)
+        self.bytes_usados -= _custo(entrada)
+
+
+# ETag forte a partir de um conteúdo em memória
+def etag_conteudo(dados):
+    return f'"{hashlib.blake2b(dados, digest_size=16).hexdigest()}"'
+
+
+# ETag forte de um arquivo grande, lido em blocos para não carregá-lo inteiro na memória
+def etag_arquivo(caminho):
+    resumo = hashlib.blake2b(digest_size=16)
+    with open(caminho, "rb") as file:
+        for bloco in iter(lambda: file.read(64 * 1024), b""):
+            resumo.update(bloco)
+    return f'"{resumo.hexdigest()}"'
+
+
+# Bytes que uma entrada ocupa no orçamento: conteúdo e versões comprimidas
+# (entradas só com metadados não contam)
+def _custo(entrada):
+    custo = len(entrada.dados) if entrada.dados is not None else 0
+    return custo + sum(len(variante[0]) for variante in entrada.variantes.values() if variante is not None)
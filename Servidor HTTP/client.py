@@ -1,5 +1,15 @@
 import requests  # Biblioteca para realizar requisições HTTP de forma simples
 import time      # Biblioteca para medir o tempo de execução (desempenho da requisição)
+import os        # Manipulação dos arquivos parciais (.part) no disco
+import json      # Estado do download parcial, salvo ao lado do arquivo .part
+import argparse  # Opções de linha de comando (retomar, segmentos, servidor...)
+import threading # Download de vários segmentos do mesmo arquivo em paralelo
+import re        # Extrai os nomes das imagens dos links da página da galeria
+import html      # Decodifica entidades HTML (&amp; ...) nos nomes encontrados na galeria
+import fnmatch   # Padrões como "img*.jpg" no modo em lote
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor, as_completed   # Downloads simultâneos no modo em lote
+from requests.adapters import HTTPAdapter                         # Tamanho do pool de conexões da sessão
 
 # ==========================
 # CONFIGURAÇÕES INICIAIS
@@ -12,67 +22,402 @@ server_ip = "26.93.244.10"
 # Montagem da URL base do servidor, utilizando a porta 8000 (padrão em muitos testes com servidores locais Python)
 server_url = f"http://{server_ip}:8000"
 
-# Lista simulada de imagens disponíveis no servidor (nomes dos arquivos JPEG)
+# Lista de imagens usada apenas se não for possível consultar a galeria do servidor
 imagens_disponiveis = [f"img{i}.jpg" for i in range(1, 11)]
 
-# Exibição no terminal das imagens disponíveis para download
-print("\nImagens disponíveis no servidor:")
-for img in imagens_disponiveis:
-    print(f"- {img}")
+# Tamanho de cada pedaço gravado no disco durante o download (em bytes)
+tamanho_bloco = 64 * 1024
+
+# Arquivos menores que isso não são divididos em segmentos (não compensa abrir várias conexões)
+tamanho_minimo_segmento = 256 * 1024
+
+# Downloads simultâneos no modo em lote (cada um usa uma conexão keep-alive do pool da sessão)
+downloads_paralelos = 4
+
+# ==========================
+# SESSÃO E LISTA DE IMAGENS
+# ==========================
+
+# Sessão HTTP com um pool de `conexoes` conexões keep-alive reaproveitadas entre os downloads
+# (o padrão do requests guarda só 10, e conexões além disso seriam abertas e fechadas a cada uso)
+def criar_sessao(conexoes):
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, conexoes))
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
+
+
+# Descobre as imagens disponíveis pelos links da página da galeria (<a href="/img1.jpg" ...>).
+# Se o servidor não responder, usa a lista fixa imagens_disponiveis.
+def descobrir_imagens(sessao):
+    try:
+        resposta = sessao.get(f"{server_url}/", timeout=10)
+        resposta.raise_for_status()
+    except requests.RequestException:
+        return list(imagens_disponiveis)
+    nomes = [unquote(html.unescape(nome)) for nome in re.findall(r'<a href="/([^"]+)"', resposta.text)]
+    return list(dict.fromkeys(nomes)) or list(imagens_disponiveis)
+
+
+# Troca padrões (img*.jpg, img[1-3].jpg) pelos nomes correspondentes entre os disponíveis,
+# mantendo a ordem e sem repetições
+def expandir_padroes(padroes, disponiveis):
+    nomes = []
+    for padrao in padroes:
+        if any(caractere in padrao for caractere in "*?["):
+            encontrados = fnmatch.filter(disponiveis, padrao)
+            if not encontrados:
+                print(f"⚠️ Nenhuma imagem corresponde a '{padrao}'")
+            nomes.extend(encontrados)
+        else:
+            nomes.append(padrao)
+    return list(dict.fromkeys(nomes))
+
+
+# Caminho local onde a imagem `nome` é gravada, dentro de `pasta`. Os nomes vêm da página da
+# galeria (ou do terminal): um nome com "../" ou um caminho absoluto é recusado com ValueError,
+# para nenhum download gravar fora da pasta de destino.
+def caminho_destino(pasta, nome):
+    pasta = os.path.realpath(pasta)
+    destino = os.path.realpath(os.path.join(pasta, nome))
+    if destino == pasta or os.path.commonpath([pasta, destino]) != pasta:
+        raise ValueError(f"Nome de imagem inválido: {nome}")
+    return destino
 
 # ==========================
-# INTERAÇÃO COM O USUÁRIO
+# ESTADO DO DOWNLOAD PARCIAL
 # ==========================
 
-# Solicitação de entrada do usuário para escolher uma imagem para baixar
-imagem_solicitada = input("\nDigite o nome da imagem que deseja baixar: ")
+# O arquivo em download fica como "<nome>.part" até terminar. Ao lado dele, "<nome>.part.json"
+# guarda o ETag da versão que está sendo baixada e quanto de cada segmento já foi gravado,
+# para que um download interrompido continue de onde parou.
+
+def caminho_estado(destino):
+    return destino + ".part.json"
+
+
+def carregar_estado(destino):
+    try:
+        with open(caminho_estado(destino), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def salvar_estado(destino, estado):
+    with open(caminho_estado(destino), "w", encoding="utf-8") as file:
+        json.dump(estado, file)
+
+
+# Divide o arquivo em `quantidade` segmentos [inicio, fim, baixados] de tamanhos parecidos
+def dividir_segmentos(tamanho, quantidade):
+    if quantidade <= 1 or tamanho < tamanho_minimo_segmento:
+        return [[0, tamanho - 1, 0]]
+    passo = -(-tamanho // quantidade)   # Divisão arredondada para cima
+    return [[inicio, min(inicio + passo, tamanho) - 1, 0] for inicio in range(0, tamanho, passo)]
+
+# ==========================
+# DOWNLOAD DE UM SEGMENTO
+# ==========================
+
+# Baixa o que falta de um segmento e grava na posição certa do arquivo .part.
+# Retorna False se o servidor avisou que o arquivo mudou (aí o download recomeça do zero).
+def baixar_segmento(sessao, url, parte, segmento, etag, parar):
+    inicio, fim, baixados = segmento
+    if inicio + baixados > fim:
+        return True
+
+    cabecalhos = {"Range": f"bytes={inicio + baixados}-{fim}"}
+    # If-Range: o servidor só envia o pedaço se o arquivo ainda for a mesma versão (mesmo ETag)
+    if etag:
+        cabecalhos["If-Range"] = etag
+
+    with sessao.get(url, headers=cabecalhos, stream=True, timeout=30) as resposta:
+        if resposta.status_code != 206:
+            # 200 = o arquivo mudou (ou o servidor ignorou o Range): o que já foi baixado não serve mais
+            resposta.raise_for_status()
+            return False
+
+        # Arquivo aberto sem buffer: o que foi contado em `baixados` já está de fato no disco
+        with open(parte, "r+b", buffering=0) as file:
+            file.seek(inicio + baixados)
+            for bloco in resposta.iter_content(tamanho_bloco):
+                if parar.is_set():
+                    break
+                file.write(bloco)
+                segmento[2] += len(bloco)
+    return True
+
+# ==========================
+# DOWNLOAD COMPLETO (COM RETOMADA E SEGMENTOS PARALELOS)
+# ==========================
+
+# Baixa `nome` do servidor para `destino`. Com retomar=True continua um .part existente;
+# com segmentos > 1 divide o arquivo em intervalos baixados em paralelo (Range).
+# Retorna (status_http, bytes_baixados_agora, tamanho_total).
+def baixar(nome, destino, segmentos=1, retomar=False):
+    url = f"{server_url}/{nome}"
+    parte = destino + ".part"
+    sessao = criar_sessao(segmentos)
+
+    # HEAD: descobre tamanho, ETag e se o servidor aceita pedidos parciais, sem baixar o arquivo
+    info = sessao.head(url, timeout=30)
+    if info.status_code != 200:
+        return info.status_code, 0, 0
+    tamanho = int(info.headers.get("Content-Length", 0))
+    etag = info.headers.get("ETag")
+    aceita_range = info.headers.get("Accept-Ranges") == "bytes"
+
+    # Sem suporte a Range: baixa o arquivo inteiro numa única conexão
+    if not aceita_range:
+        return baixar_inteiro(sessao, url, destino)
+
+    # Retoma o estado anterior apenas se for a mesma versão do arquivo (mesmo ETag e tamanho)
+    estado = carregar_estado(destino) if retomar else None
+    if not (estado and os.path.exists(parte) and estado["etag"] == etag and estado["tamanho"] == tamanho):
+        estado = {"etag": etag, "tamanho": tamanho, "segmentos": dividir_segmentos(tamanho, segmentos)}
+        # Reserva o espaço do arquivo inteiro para que cada segmento grave na sua posição
+        with open(parte, "wb") as file:
+            file.truncate(tamanho)
+        salvar_estado(destino, estado)
+
+    ja_baixado = sum(segmento[2] for segmento in estado["segmentos"])
+    if ja_baixado:
+        print(f"↩️ Retomando download: {ja_baixado / 1024:.2f} KB já estavam no disco")
+
+    # Um thread por segmento; todos compartilham a mesma sessão (pool de conexões keep-alive)
+    parar = threading.Event()
+    resultados = []
+    erros = []
+
+    def trabalhar(segmento):
+        try:
+            resultados.append(baixar_segmento(sessao, url, parte, segmento, etag, parar))
+        except Exception as e:
+            erros.append(e)
+            parar.set()
+
+    threads = [threading.Thread(target=trabalhar, args=(segmento,), daemon=True) for segmento in estado["segmentos"]]
+    try:
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.2)
+    except KeyboardInterrupt:
+        # Ctrl+C: para os segmentos e guarda o progresso para uma próxima execução com --retomar
+        parar.set()
+        for thread in threads:
+            thread.join()
+        salvar_estado(destino, estado)
+        print(f"\n⏸️ Download interrompido. Use --retomar para continuar '{nome}'.")
+        raise
+    finally:
+        salvar_estado(destino, estado)
+
+    if erros:
+        raise erros[0]
+
+    # O arquivo mudou no servidor durante o download: descarta o .part e recomeça do zero
+    if not all(resultados):
+        print("🔄 O arquivo mudou no servidor. Recomeçando o download...")
+        os.remove(caminho_estado(destino))
+        return baixar(nome, destino, segmentos, retomar=False)
+
+    # Download concluído: o .part vira o arquivo final e o estado é apagado
+    os.replace(parte, destino)
+    os.remove(caminho_estado(destino))
+    return 200, tamanho - ja_baixado, tamanho
+
+
+# Download simples, para servidores que não aceitam Range (gravado em blocos, sem guardar tudo na memória)
+def baixar_inteiro(sessao, url, destino):
+    with sessao.get(url, stream=True, timeout=30) as resposta:
+        if resposta.status_code != 200:
+            return resposta.status_code, 0, 0
+        total = 0
+        with open(destino, "wb") as file:
+            for bloco in resposta.iter_content(tamanho_bloco):
+                file.write(bloco)
+                total += len(bloco)
+    return 200, total, total
 
 # ==========================
-# ENVIO DA REQUISIÇÃO HTTP
+# MODO EM LOTE (VÁRIAS IMAGENS EM PARALELO)
 # ==========================
 
-# Captura do tempo de início para medir o tempo total da operação de download
-start_time = time.time()
+# Baixa uma imagem inteira gravando em blocos, medindo o tempo até o primeiro byte (TTFB:
+# pedido enviado até os cabeçalhos da resposta chegarem) e o tempo de transferência do corpo
+def baixar_medindo(sessao, nome, pasta):
+    destino = caminho_destino(pasta, nome)
+    parte = destino + ".part"
+    inicio = time.perf_counter()
+    # stream=True: o get() volta assim que os cabeçalhos chegam, e o corpo é lido aos poucos
+    with sessao.get(f"{server_url}/{nome}", stream=True, timeout=30) as resposta:
+        primeiro_byte = time.perf_counter()
+        resultado = {"nome": nome, "status": resposta.status_code, "bytes": 0,
+                     "ttfb": primeiro_byte - inicio, "transferencia": 0.0}
+        if resposta.status_code != 200:
+            return resultado
+        with open(parte, "wb") as file:
+            for bloco in resposta.iter_content(tamanho_bloco):
+                file.write(bloco)
+                resultado["bytes"] += len(bloco)
+    resultado["transferencia"] = time.perf_counter() - primeiro_byte
+    os.replace(parte, destino)
+    return resultado
+
+
+# Baixa várias imagens ao mesmo tempo (no máximo `paralelo`), todas pela mesma sessão,
+# e exibe um relatório com a vazão total e os tempos de cada arquivo
+def baixar_lote(nomes, pasta, paralelo):
+    sessao = criar_sessao(paralelo)
+    os.makedirs(pasta, exist_ok=True)
+    print(f"\n📦 Baixando {len(nomes)} imagens ({paralelo} em paralelo)...")
+
+    resultados = []
+    inicio = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=paralelo)
+    try:
+        futuros = {pool.submit(baixar_medindo, sessao, nome, pasta): nome for nome in nomes}
+        for futuro in as_completed(futuros):
+            try:
+                resultado = futuro.result()
+            except (requests.RequestException, OSError, ValueError) as e:
+                resultado = {"nome": futuros[futuro], "status": None, "bytes": 0,
+                             "ttfb": 0.0, "transferencia": 0.0, "erro": str(e)}
+            resultados.append(resultado)
+            simbolo = "✅" if resultado["status"] == 200 else "❌"
+            print(f"{simbolo} {resultado['nome']} ({resultado['status'] or resultado.get('erro')})")
+    except KeyboardInterrupt:
+        # Ctrl+C: não começa os downloads que ainda estavam na fila
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("\n⏸️ Lote interrompido.")
+        raise
+    pool.shutdown()
+    duracao = time.perf_counter() - inicio
+
+    exibir_relatorio(resultados, duracao)
+    return resultados
+
 
-# Envio de uma requisição HTTP GET para o servidor solicitando a imagem desejada
-# A URL completa tem o formato: http://<ip>:8000/<nome_da_imagem>
-resposta = requests.get(f"{server_url}/{imagem_solicitada}")
+# Relatório do lote: totais e uma linha por arquivo (na ordem do tempo até o primeiro byte)
+def exibir_relatorio(resultados, duracao):
+    sucesso = [r for r in resultados if r["status"] == 200]
+    total_kb = sum(r["bytes"] for r in sucesso) / 1024
+    velocidade = total_kb / duracao if duracao > 0 else 0
 
-# Cálculo da duração da requisição em segundos
-duration = time.time() - start_time
+    print(f"\n📊 {len(sucesso)} de {len(resultados)} imagens baixadas em {duracao:.3f}s "
+          f"— {total_kb:.2f} KB — {velocidade:.2f} KB/s no total")
+    if sucesso:
+        ttfbs = [r["ttfb"] * 1000 for r in sucesso]
+        print(f"⏱️ TTFB médio: {sum(ttfbs) / len(ttfbs):.1f} ms — máximo: {max(ttfbs):.1f} ms")
+
+    print(f"\n{'Imagem':<24}{'Status':>7}{'KB':>11}{'TTFB (ms)':>11}{'Transf. (ms)':>14}{'KB/s':>11}")
+    for r in sorted(resultados, key=lambda r: r["ttfb"]):
+        kb = r["bytes"] / 1024
+        kbps = kb / r["transferencia"] if r["transferencia"] > 0 else 0
+        print(f"{r['nome']:<24}{str(r['status'] or 'erro'):>7}{kb:>11.2f}{r['ttfb'] * 1000:>11.1f}"
+              f"{r['transferencia'] * 1000:>14.1f}{kbps:>11.1f}")
 
 # ==========================
 # ANÁLISE DA RESPOSTA HTTP
 # ==========================
 
-# Se a resposta for bem-sucedida (HTTP 200 OK)
-if resposta.status_code == 200:
-    # Cálculo do tamanho da imagem em kilobytes (KB)
-    tamanho_kb = len(resposta.content) / 1024
+def exibir_resultado(status_code, imagem, tamanho_bytes, duration):
+    # Se a resposta for bem-sucedida (HTTP 200 OK)
+    if status_code == 200:
+        # Cálculo do tamanho da imagem em kilobytes (KB)
+        tamanho_kb = tamanho_bytes / 1024
+
+        # Cálculo da velocidade de download em KB/s
+        velocidade = tamanho_kb / duration if duration > 0 else 0
+
+        # Feedback para o usuário com detalhes da transferência
+        print(f"\n✅ {status_code} OK - Imagem '{imagem}' baixada com sucesso!")
+        print(f"📅 Tempo: {duration:.3f}s — Tamanho: {tamanho_kb:.2f} KB — Velocidade: {velocidade:.2f} KB/s")
+
+    # Caso o recurso (imagem) não exista no servidor — erro 404 Not Found
+    elif status_code == 404:
+        print(f"\n❌ {status_code} Not Found - Imagem não encontrada no servidor.")
+
+    # Caso ocorra um erro interno no servidor — erros da faixa 5xx
+    elif status_code >= 500:
+        print(f"\n🚨 {status_code} Server Error - Problema no servidor.")
+
+    # Outros erros de cliente — erros da faixa 4xx
+    elif status_code >= 400:
+        print(f"\n⚠️ {status_code} Client Error - Requisição inválida.")
+
+    # Caso retorne algum outro código HTTP não previsto explicitamente
+    else:
+        print(f"\nℹ️ {status_code} Código HTTP inesperado.")
+
+# ==========================
+# PROGRAMA PRINCIPAL
+# ==========================
+
+def main():
+    global server_url
+
+    parser = argparse.ArgumentParser(description="Cliente HTTP da galeria de imagens")
+    parser.add_argument("imagens", nargs="*",
+                        help="nomes ou padrões das imagens (ex: img1.jpg 'img*.jpg'); se omitido, é perguntado no terminal")
+    parser.add_argument("--servidor", default=server_ip, help="IP do servidor HTTP")
+    parser.add_argument("--porta", type=int, default=8000, help="porta do servidor HTTP")
+    parser.add_argument("--retomar", action="store_true",
+                        help="continua um download interrompido a partir do arquivo .part")
+    parser.add_argument("--segmentos", type=int, default=1,
+                        help="divide a imagem em N intervalos baixados em paralelo")
+    parser.add_argument("--todas", action="store_true", help="baixa todas as imagens listadas na galeria")
+    parser.add_argument("--paralelo", type=int, default=downloads_paralelos,
+                        help="downloads simultâneos ao baixar várias imagens")
+    parser.add_argument("--destino", default=".", help="pasta onde as imagens são gravadas")
+    args = parser.parse_args()
+
+    server_url = f"http://{args.servidor}:{args.porta}"
+
+    # Vários nomes, padrões ou --todas: modo em lote, com downloads em paralelo
+    if args.todas or len(args.imagens) > 1 or any(c in "".join(args.imagens) for c in "*?["):
+        disponiveis = descobrir_imagens(requests.Session())
+        nomes = disponiveis if args.todas else expandir_padroes(args.imagens, disponiveis)
+        if nomes:
+            try:
+                baixar_lote(nomes, args.destino, args.paralelo)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    imagem_solicitada = args.imagens[0] if args.imagens else None
+    if not imagem_solicitada:
+        # Exibição no terminal das imagens disponíveis para download (lidas da galeria do servidor)
+        print("\nImagens disponíveis no servidor:")
+        for img in descobrir_imagens(requests.Session()):
+            print(f"- {img}")
 
-    # Cálculo da velocidade de download em KB/s
-    velocidade = tamanho_kb / duration if duration > 0 else 0
+        # Solicitação de entrada do usuário para escolher uma imagem para baixar
+        imagem_solicitada = input("\nDigite o nome da imagem que deseja baixar: ")
 
-    # Salvamento do conteúdo da imagem recebida no disco (modo binário)
-    with open(imagem_solicitada, "wb") as file:
-        file.write(resposta.content)
+    # Captura do tempo de início para medir o tempo total da operação de download
+    start_time = time.time()
 
-    # Feedback para o usuário com detalhes da transferência
-    print(f"\n✅ {resposta.status_code} OK - Imagem '{imagem_solicitada}' baixada com sucesso!")
-    print(f"📅 Tempo: {duration:.3f}s — Tamanho: {tamanho_kb:.2f} KB — Velocidade: {velocidade:.2f} KB/s")
+    # Download da imagem (o arquivo é gravado no disco em blocos, à medida que chega)
+    try:
+        os.makedirs(args.destino, exist_ok=True)
+        destino = caminho_destino(args.destino, imagem_solicitada)
+        status_code, baixados, _ = baixar(imagem_solicitada, destino, args.segmentos, args.retomar)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    except KeyboardInterrupt:
+        return
 
-# Caso o recurso (imagem) não exista no servidor — erro 404 Not Found
-elif resposta.status_code == 404:
-    print(f"\n❌ {resposta.status_code} Not Found - Imagem não encontrada no servidor.")
+    # Cálculo da duração da requisição em segundos
+    duration = time.time() - start_time
 
-# Caso ocorra um erro interno no servidor — erros da faixa 5xx
-elif resposta.status_code >= 500:
-    print(f"\n🚨 {resposta.status_code} Server Error - Problema no servidor.")
+    exibir_resultado(status_code, imagem_solicitada, baixados, duration)
 
-# Outros erros de cliente — erros da faixa 4xx
-elif resposta.status_code >= 400:
-    print(f"\n⚠️ {resposta.status_code} Client Error - Requisição inválida.")
 
-# Caso retorne algum outro código HTTP não previsto explicitamente
-else:
-    print(f"\nℹ️ {resposta.status_code} Código HTTP inesperado.")
+if __name__ == "__main__":
+    main()
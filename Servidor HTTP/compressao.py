@@ -0,0 +1,86 @@
+# compressao.py
+# Compressão das respostas de texto (HTML, CSS...) negociada pelo cabeçalho Accept-Encoding.
+# gzip vem da biblioteca padrão; brotli (pip install brotli) e zstd (pip install zstandard)
+# são usados quando estiverem instalados. O conteúdo é comprimido uma única vez por versão
+# do arquivo (o resultado fica no cache em memória) e nunca a cada requisição.
+# Tipos que já são comprimidos (JPEG, PNG...) são enviados sempre como estão.
+
+import gzip
+
+try:
+    import brotli                       # Dependência opcional: melhor taxa para texto
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard                    # Dependência opcional: taxa boa e descompressão rápida
+except ImportError:
+    zstandard = None
+
+# Conteúdos menores que isso não compensam a compressão (o cabeçalho gzip já ocupa ~20 bytes)
+TAMANHO_MINIMO = 256
+
+# Codificações disponíveis, na ordem de preferência do servidor
+CODIFICACOES = [nome for nome, modulo in (("br", brotli), ("zstd", zstandard), ("gzip", gzip)) if modulo]
+
+# Sufixo dos arquivos pré-comprimidos (ex: style.css.gz ao lado de style.css)
+EXTENSOES = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+# Tipos de texto que se beneficiam de compressão
+TIPOS_COMPRIMIVEIS = ("application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+
+# Verifica se um Content-type vale a pena ser comprimido (imagens JPEG/PNG já são comprimidas)
+def comprimivel(tipo):
+    if tipo is None:
+        return False
+    tipo = tipo.split(";")[0].strip().lower()
+    return tipo.startswith("text/") or tipo in TIPOS_COMPRIMIVEIS
+
+
+# Escolhe a melhor codificação aceita pelo cliente, ou None para enviar sem compressão.
+# Exemplo: "gzip, deflate, br;q=0.9" -> "br" se brotli estiver instalado, senão "gzip".
+def negociar(accept_encoding, disponiveis=CODIFICACOES):
+    if not accept_encoding:
+        return None
+
+    # Peso (q) de cada codificação pedida; sem ";q=" o peso é 1
+    pesos = {}
+    for item in accept_encoding.split(","):
+        nome, *parametros = [parte.strip() for parte in item.split(";")]
+        peso = 1.0
+        for parametro in parametros:
+            if parametro.lower().startswith("q="):
+                try:
+                    peso = float(parametro[2:])
+                except ValueError:
+                    peso = 0.0
+        pesos[nome.lower()] = peso
+    # "x-gzip" é um nome antigo do gzip ainda enviado por alguns clientes
+    if "x-gzip" in pesos and "gzip" not in pesos:
+        pesos["gzip"] = pesos["x-gzip"]
+
+    # Maior peso vence; em caso de empate vale a preferência do servidor. Peso 0 = recusado.
+    escolhida, melhor_peso = None, 0.0
+    for codificacao in disponiveis:
+        peso = pesos.get(codificacao, pesos.get("*", 0.0))
+        if peso > melhor_peso:
+            escolhida, melhor_peso = codificacao, peso
+    return escolhida
+
+
+# Comprime com o nível máximo: o custo só é pago uma vez por versão do conteúdo
+def comprimir(dados, codificacao):
+    if codificacao == "gzip":
+        # mtime=0 deixa o resultado determinístico (mesmo conteúdo, mesmos bytes)
+        return gzip.compress(dados, compresslevel=9, mtime=0)
+    if codificacao == "br":
+        return brotli.compress(dados, quality=11)
+    if codificacao == "zstd":
+        return zstandard.ZstdCompressor(level=19).compress(dados)
+    raise ValueError(f"Codificação não suportada: {codificacao}")
+
+
+# ETag de uma versão comprimida: cada representação precisa de um ETag diferente
+def etag_variante(etag, codificacao):
+    return f'{etag[:-1]}-{codificacao}"'
@@ -0,0 +1,130 @@
+# galeria.py
+# Página da galeria (index.html com as miniaturas) montada com antecedência.
+# Em vez de listar a pasta de imagens e montar o HTML a cada acesso a "/", a página é gerada
+# uma vez (junto com suas versões comprimidas: gzip, br e zstd) e só é refeita quando a pasta de imagens
+# ou o modelo index.html mudam. A verificação é feita por uma thread que consulta o mtime
+# dos dois de tempos em tempos (polling), fora do caminho das requisições.
+# Com miniaturas ativadas, cada imagem da página aponta para /thumb/<imagem> e o link leva
+# ao arquivo original.
+
+import os
+import re                               # Ordenação "natural" dos nomes (img2 antes de img10)
+import threading                        # Thread de monitoramento da pasta e do modelo
+from email.utils import formatdate      # Data no formato HTTP para o cabeçalho Last-Modified
+
+from cache import etag_conteudo
+from compressao import CODIFICACOES, comprimir, etag_variante    # Versões comprimidas da página
+
+# Extensões de arquivo exibidas na galeria
+EXTENSOES = ('.jpg', '.png', '.jpeg')
+
+
+# Uma versão pronta da página: HTML, HTML comprimido em cada codificação e os validadores de cada um
+class PaginaGaleria:
+
+    __slots__ = ("html", "etag", "variantes", "modificado", "last_modified")
+
+    def __init__(self, html, modificado):
+        self.html = html
+        self.etag = etag_conteudo(html)
+        # Codificação -> (HTML comprimido, ETag); cada representação tem um ETag diferente
+        self.variantes = {}
+        for codificacao in CODIFICACOES:
+            comprimido = comprimir(html, codificacao)
+            if len(comprimido) < len(html):
+                self.variantes[codificacao] = (comprimido, etag_variante(self.etag, codificacao))
+        self.modificado = int(modificado)
+        self.last_modified = formatdate(modificado, usegmt=True)
+
+
+class Galeria:
+
+    def __init__(self, modelo, pasta_imagens):
+        self.modelo = modelo                # Caminho do index.html com o marcador {{IMAGENS}}
+        self.pasta_imagens = pasta_imagens
+        self.usar_miniaturas = False        # Se True, as imagens da página usam /thumb/<imagem>
+        self.ao_mudar = None                # Função chamada quando a página é refeita (ex: gerar miniaturas)
+        self.reconstrucoes = 0              # Quantas vezes a página foi gerada
+        self._assinatura = None             # (mtime do modelo, mtime da pasta) da versão atual
+        self._pagina = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Página pronta para envio. Não acessa o disco, exceto na primeira chamada.
+    def atual(self):
+        pagina = self._pagina
+        if pagina is None:
+            self.verificar()
+            pagina = self._pagina
+        return pagina
+
+    # Confere se o modelo ou a pasta de imagens mudaram e, se sim, refaz a página
+    def verificar(self):
+        assinatura = (_mtime(self.modelo), _mtime(self.pasta_imagens))
+        if assinatura == self._assinatura:
+            return
+        with self._lock:
+            if assinatura != self._assinatura:
+                # Troca a página inteira de uma vez: as requisições veem a versão antiga ou a nova
+                self._pagina = self._montar(assinatura)
+                self._assinatura = assinatura
+                self.reconstrucoes += 1
+        if self.ao_mudar is not None:
+            self.ao_mudar()
+
+    # Inicia a thread que verifica mudanças a cada `intervalo` segundos
+    def monitorar(self, intervalo):
+        self.atual()
+        if self._thread is None and intervalo > 0:
+            self._thread = threading.Thread(target=self._laco, args=(intervalo,), daemon=True,
+                                            name="galeria-monitor")
+            self._thread.start()
+
+    def _laco(self, intervalo):
+        parar = threading.Event()
+        while not parar.wait(intervalo):
+            try:
+                self.verificar()
+            except OSError as e:
+                # Modelo apagado ou sendo trocado: mantém a página anterior e tenta de novo depois
+                print(f"⚠️ Não foi possível atualizar a galeria: {e}")
+
+    def _montar(self, assinatura):
+        try:
+            # Lista todos os arquivos da pasta de imagens com extensão JPG, PNG ou JPEG
+            imagens = [e.name for e in os.scandir(self.pasta_imagens) if e.name.endswith(EXTENSOES) and e.is_file()]
+        except FileNotFoundError:
+            # Caso a pasta de imagens não exista, evita erro e define uma lista vazia
+            imagens = []
+
+        # Ordem determinística: a mesma pasta sempre gera a mesma página (e o mesmo ETag)
+        imagens.sort(key=_chave_natural)
+
+        # Lê o conteúdo do arquivo HTML
+        with open(self.modelo, "r", encoding="utf-8") as file:
+            html = file.read()
+
+        # Para cada imagem encontrada, cria um bloco HTML com a miniatura clicável (o link abre o original)
+        prefixo = "/thumb/" if self.usar_miniaturas else "/"
+        imagens_html = "".join(
+            f'<div class="img-box"><a href="/{img}" target="_blank"><img src="{prefixo}{img}" alt="{img}"></a></div>'
+            for img in imagens
+        )
+
+        # Substitui o marcador {{IMAGENS}} no HTML pelos blocos gerados
+        pagina = html.replace("{{IMAGENS}}", imagens_html).encode()
+        modificado = max(m for m in assinatura if m is not None) / 1e9
+        return PaginaGaleria(pagina, modificado)
+
+
+# mtime (em nanossegundos) de um caminho, ou None se ele não existir
+def _mtime(caminho):
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+# "img10.jpg" -> ["img", 10, ".jpg"], para que os números sejam comparados como números
+def _chave_natural(nome):
+    return [int(parte) if parte.isdigit() else parte.lower() for parte in re.split(r"(\d+)", nome)]
@@ -0,0 +1,150 @@
+# metricas.py
+# Instrumentação do servidor HTTP: contadores e histogramas de latência expostos em /metrics
+# no formato texto do Prometheus, e um log de acesso opcional (uma linha JSON por requisição).
+# A latência é medida pelos motores (motores.py e MeuServidor) do momento em que a requisição
+# foi lida até o último byte ser entregue ao socket, ou seja, inclui o envio da resposta.
+# Nada aqui escreve no terminal ou em disco durante a requisição: o log de acesso vai para uma
+# fila e é gravado por uma thread separada.
+
+import bisect                           # Localiza o intervalo (bucket) do histograma de cada latência
+import json                             # Linhas do log de acesso em JSON
+import queue                            # Fila entre as requisições e a thread que grava o log
+import sys
+import threading
+import time
+
+# Limites superiores (em segundos) dos intervalos do histograma de latência
+INTERVALOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metricas:
+
+    def __init__(self):
+        self.log = None                 # LogAcesso opcional (None = sem log de acesso)
+        self._lock = threading.Lock()
+        self._requisicoes = {}          # (rota, status) -> quantidade
+        self._histogramas = {}          # rota -> [quantidade por intervalo..., acima do último]
+        self._soma_duracao = {}         # rota -> soma das latências (segundos)
+        self._bytes = {}                # rota -> bytes de corpo enviados
+        self._conexoes = 0              # Conexões abertas sendo atendidas agora
+        self._inicio = time.time()
+
+    # Chamado pelos motores quando uma conexão começa (+1) ou termina (-1) de ser atendida
+    def conexao(self, delta):
+        with self._lock:
+            self._conexoes += delta
+
+    # Chamado pelos motores depois que a resposta foi escrita no socket
+    def resposta(self, cliente, metodo, caminho, rota, status, enviados, duracao):
+        with self._lock:
+            chave = (rota, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            histograma = self._histogramas.get(rota)
+            if histograma is None:
+                histograma = self._histogramas[rota] = [0] * (len(INTERVALOS) + 1)
+            histograma[bisect.bisect_left(INTERVALOS, duracao)] += 1
+            self._soma_duracao[rota] = self._soma_duracao.get(rota, 0.0) + duracao
+            self._bytes[rota] = self._bytes.get(rota, 0) + enviados
+
+        if self.log is not None:
+            self.log.registrar({
+                "hora": time.time(),
+                "cliente": cliente,
+                "metodo": metodo,
+                "caminho": caminho,
+                "rota": rota,
+                "status": status,
+                "bytes": enviados,
+                "duracao_ms": round(duracao * 1000, 3),
+            })
+
+    # Texto no formato de exposição do Prometheus. `adicionais` é uma lista de
+    # (nome, tipo, ajuda, valor) com métricas de outros módulos (cache, galeria...).
+    def exportar(self, adicionais=()):
+        with self._lock:
+            requisicoes = sorted(self._requisicoes.items())
+            histogramas = {rota: list(valores) for rota, valores in self._histogramas.items()}
+            somas = dict(self._soma_duracao)
+            enviados = sorted(self._bytes.items())
+            conexoes = self._conexoes
+
+        linhas = [
+            "# HELP http_requisicoes_total Requisições atendidas, por rota e código de status.",
+            "# TYPE http_requisicoes_total counter",
+        ]
+        linhas += [f'http_requisicoes_total{{rota="{rota}",status="{status}"}} {quantidade}'
+                   for (rota, status), quantidade in requisicoes]
+
+        linhas += [
+            "# HELP http_duracao_requisicao_segundos Tempo da leitura da requisição até o fim do envio da resposta.",
+            "# TYPE http_duracao_requisicao_segundos histogram",
+        ]
+        for rota in sorted(histogramas):
+            # O formato do Prometheus usa contagens acumuladas: cada intervalo inclui os anteriores
+            acumulado = 0
+            for limite, quantidade in zip(INTERVALOS + ("+Inf",), histogramas[rota]):
+                acumulado += quantidade
+                linhas.append(f'http_duracao_requisicao_segundos_bucket{{rota="{rota}",le="{limite}"}} {acumulado}')
+            linhas.append(f'http_duracao_requisicao_segundos_sum{{rota="{rota}"}} {somas[rota]:.6f}')
+            linhas.append(f'http_duracao_requisicao_segundos_count{{rota="{rota}"}} {acumulado}')
+
+        linhas += [
+            "# HELP http_bytes_enviados_total Bytes de corpo enviados, por rota.",
+            "# TYPE http_bytes_enviados_total counter",
+        ]
+        linhas += [f'http_bytes_enviados_total{{rota="{rota}"}} {total}' for rota, total in enviados]
+
+        fixas = [
+            ("http_conexoes_abertas", "gauge", "Conexões sendo atendidas neste momento.", conexoes),
+            ("http_inicio_segundos", "gauge", "Horário (epoch) em que o servidor foi iniciado.", self._inicio),
+        ]
+        if self.log is not None:
+            fixas.append(("http_log_descartados_total", "counter",
+                          "Linhas do log de acesso descartadas porque a fila estava cheia.", self.log.descartados))
+
+        for nome, tipo, ajuda, valor in fixas + list(adicionais):
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {valor}"]
+        return ("\n".join(linhas) + "\n").encode("utf-8")
+
+
+# Log de acesso gravado fora do caminho das requisições: cada resposta só coloca um dicionário
+# na fila; uma thread converte para JSON e escreve no arquivo (ou no terminal, com "-").
+class LogAcesso:
+
+    def __init__(self, destino, tamanho_fila=10000):
+        self.destino = destino
+        self.descartados = 0            # Se a fila encher (disco lento), as linhas são descartadas
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = threading.Thread(target=self._gravar, daemon=True, name="log-acesso")
+        self._thread.start()
+
+    # Nunca bloqueia a requisição: com a fila cheia a linha é descartada e contada
+    def registrar(self, registro):
+        try:
+            self._fila.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+
+    # Espera a thread gravar o que ainda está na fila (chamado ao encerrar o servidor)
+    def encerrar(self):
+        self._fila.put(None)
+        self._thread.join(timeout=5)
+
+    def _gravar(self):
+        if self.destino == "-":
+            arquivo = sys.stdout
+        else:
+            arquivo = open(self.destino, "a", encoding="utf-8")
+        try:
+            while True:
+                registro = self._fila.get()
+                if registro is None:
+                    break
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                # Só força a escrita quando a fila esvazia: sob carga as linhas saem em lote
+                if self._fila.empty():
+                    arquivo.flush()
+        finally:
+            arquivo.flush()
+            if arquivo is not sys.stdout:
+                arquivo.close()
@@ -0,0 +1,170 @@
+# miniaturas.py
+# Geração das miniaturas usadas na página da galeria (/thumb/<imagem>).
+# As imagens originais são reduzidas em processos separados (ProcessPoolExecutor), para não
+# disputar a CPU com o atendimento HTTP. Cada miniatura é gravada numa pasta de cache com o
+# nome igual ao hash do conteúdo original + parâmetros de redução: se a mesma imagem aparecer
+# de novo (ou o servidor reiniciar), a miniatura já pronta é reaproveitada.
+# Requer a biblioteca Pillow (pip install pillow); sem ela a galeria usa as imagens originais.
+
+import hashlib                          # Hash do conteúdo original (nome da miniatura no cache)
+import json                             # Índice nome -> miniatura, salvo na pasta do cache
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image               # Dependência opcional para redimensionar as imagens
+except ImportError:
+    Image = None
+
+from galeria import EXTENSOES
+
+
+# Executado dentro de um processo do pool: calcula o hash do original e gera a miniatura
+# (se ainda não existir no cache). Retorna o caminho da miniatura.
+def gerar_miniatura(origem, pasta_cache, tamanho, qualidade):
+    resumo = hashlib.blake2b(digest_size=16)
+    with open(origem, "rb") as file:
+        for bloco in iter(lambda: file.read(64 * 1024), b""):
+            resumo.update(bloco)
+    # Os parâmetros entram no hash: mudar o tamanho ou a qualidade gera outra miniatura
+    resumo.update(f"{tamanho}:{qualidade}".encode())
+    destino = os.path.join(pasta_cache, resumo.hexdigest() + ".jpg")
+
+    if not os.path.exists(destino):
+        with Image.open(origem) as imagem:
+            imagem.draft("RGB", (tamanho, tamanho))     # JPEG: decodifica já em escala reduzida
+            imagem = imagem.convert("RGB")
+            imagem.thumbnail((tamanho, tamanho))
+            # Grava num arquivo temporário e renomeia: quem lê nunca vê uma miniatura pela metade
+            temporario = f"{destino}.{os.getpid()}.tmp"
+            imagem.save(temporario, "JPEG", quality=qualidade, optimize=True)
+        os.replace(temporario, destino)
+    return destino
+
+
+class Miniaturas:
+
+    def __init__(self, pasta_imagens, pasta_cache, tamanho=300, qualidade=80):
+        self.pasta_imagens = pasta_imagens
+        self.pasta_cache = pasta_cache
+        self.tamanho = tamanho          # Lado máximo da miniatura, em pixels
+        self.qualidade = qualidade      # Qualidade JPEG (1 a 95)
+        self.disponivel = Image is not None
+        self.geradas = 0                # Miniaturas geradas (ou reaproveitadas) desde o início
+
+        self._prontas = {}              # nome da imagem -> (mtime_ns, tamanho, arquivo da miniatura no cache)
+        self._pendentes = set()         # Imagens com geração em andamento
+        # Reentrante: se a geração já tiver terminado quando o callback é registrado (em _agendar,
+        # com o lock adquirido), _concluida roda na mesma thread e adquire o lock de novo
+        self._lock = threading.RLock()
+        self._pool = None
+
+    # Cria o pool de processos, carrega o índice salvo e agenda as miniaturas que faltam
+    def iniciar(self, processos=None):
+        if not self.disponivel:
+            print("⚠️ Pillow não instalado: a galeria vai usar as imagens originais (pip install pillow)")
+            return
+        os.makedirs(self.pasta_cache, exist_ok=True)
+        self._carregar_indice()
+        self._pool = ProcessPoolExecutor(max_workers=processos)
+        self.sincronizar()
+
+    def encerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # Caminho da miniatura pronta de uma imagem, ou None se ainda não existir.
+    # Confere a data e o tamanho da imagem original a cada pedido (como CacheConteudo.obter): uma
+    # imagem sobrescrita no lugar não muda a data da pasta, então sincronizar() não seria chamado.
+    # Miniatura desatualizada: agenda uma nova e, até ela ficar pronta, devolve None.
+    def caminho(self, nome):
+        with self._lock:
+            pronta = self._prontas.get(nome)
+        if not pronta:
+            return None
+        origem = os.path.join(self.pasta_imagens, nome)
+        try:
+            info = os.stat(origem)
+        except OSError:
+            return None
+        if pronta[:2] != (info.st_mtime_ns, info.st_size):
+            with self._lock:
+                self._agendar(nome, origem, info)
+            return None
+        return os.path.join(self.pasta_cache, pronta[2])
+
+    # Confere a pasta de imagens e agenda no pool as miniaturas novas ou desatualizadas.
+    # Não espera a geração terminar (é chamado na inicialização e quando a pasta muda).
+    def sincronizar(self):
+        if self._pool is None:
+            return
+        try:
+            entradas = [e for e in os.scandir(self.pasta_imagens) if e.name.endswith(EXTENSOES) and e.is_file()]
+        except FileNotFoundError:
+            entradas = []
+
+        with self._lock:
+            # Esquece imagens que foram apagadas
+            nomes = {e.name for e in entradas}
+            for nome in list(self._prontas):
+                if nome not in nomes:
+                    del self._prontas[nome]
+
+            for entrada in entradas:
+                info = entrada.stat()
+                pronta = self._prontas.get(entrada.name)
+                if (pronta and pronta[:2] == (info.st_mtime_ns, info.st_size)
+                        and os.path.exists(os.path.join(self.pasta_cache, pronta[2]))):
+                    continue
+                self._agendar(entrada.name, entrada.path, info)
+
+    # Envia a geração da miniatura ao pool, se ela já não estiver em andamento.
+    # Deve ser chamado com o lock adquirido.
+    def _agendar(self, nome, origem, info):
+        if self._pool is None or nome in self._pendentes:
+            return
+        self._pendentes.add(nome)
+        futuro = self._pool.submit(gerar_miniatura, origem, self.pasta_cache, self.tamanho, self.qualidade)
+        futuro.add_done_callback(lambda f: self._concluida(f, nome, info))
+
+    def estatisticas(self):
+        with self._lock:
+            return {"prontas": len(self._prontas), "pendentes": len(self._pendentes), "geradas": self.geradas}
+
+    # Chamado (numa thread do pool) quando um processo termina uma miniatura
+    def _concluida(self, futuro, nome, info):
+        with self._lock:
+            self._pendentes.discard(nome)
+            if futuro.cancelled():
+                return
+            erro = futuro.exception()
+            if erro is not None:
+                print(f"⚠️ Não foi possível gerar a miniatura de '{nome}': {erro}")
+                return
+            self._prontas[nome] = (info.st_mtime_ns, info.st_size, os.path.basename(futuro.result()))
+            self.geradas += 1
+            self._salvar_indice()
+
+    # O índice evita recalcular o hash de todas as imagens a cada reinício do servidor
+    def _caminho_indice(self):
+        return os.path.join(self.pasta_cache, "indice.json")
+
+    def _carregar_indice(self):
+        try:
+            with open(self._caminho_indice(), "r", encoding="utf-8") as file:
+                indice = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        parametros = indice.get("parametros")
+        if parametros != [self.tamanho, self.qualidade]:
+            return
+        self._prontas = {nome: tuple(valor) for nome, valor in indice.get("imagens", {}).items()}
+
+    # Deve ser chamado com o lock adquirido
+    def _salvar_indice(self):
+        indice = {"parametros": [self.tamanho, self.qualidade], "imagens": self._prontas}
+        temporario = self._caminho_indice() + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as file:
+            json.dump(indice, file)
+        os.replace(temporario, self._caminho_indice())
@@ -0,0 +1,420 @@
+# motores.py
+# Motores de atendimento do servidor HTTP de imagens.
+# O servidor.py decide O QUE responder (função montar_resposta); este módulo decide COMO
+# as conexões são aceitas e atendidas. Há dois motores, escolhidos na inicialização:
+#   - "threads": HTTPServer com um pool limitado de threads (uma conexão por worker; com todos
+#                ocupados, a conexão ociosa mais antiga é encerrada para atender uma nova)
+#   - "asyncio": laço de eventos (selectors) que mantém milhares de conexões ociosas
+#                baratas e só ocupa uma thread do pool enquanto monta a resposta
+# Ambos falam HTTP/1.1 com conexões persistentes (keep-alive) e Content-Length correto.
+# Corpos grandes chegam como TrechoArquivo e são enviados direto do disco para o socket
+# com sendfile (sem passar pela memória do Python). Um corpo também pode ser uma lista de
+# pedaços (bytes e TrechoArquivo), como nas respostas multipart/byteranges.
+# Se o atributo `metricas` do servidor for definido (ver metricas.py), os motores informam
+# as conexões abertas e a latência de cada resposta, medida até o fim da escrita no socket.
+
+import asyncio                                  # Laço de eventos do motor assíncrono
+import io                                       # Para reaproveitar o parser de cabeçalhos da biblioteca padrão
+import os                                       # os.sendfile (cópia zero entre arquivo e socket)
+import socket                                   # Criação do socket de escuta
+import threading                                # Semáforo que limita as conexões simultâneas
+import time                                     # Latência de cada requisição (métricas)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack                # Fecha todos os arquivos abertos para uma resposta
+from email.utils import formatdate              # Data no formato exigido pelo cabeçalho "Date"
+from http import HTTPStatus                     # Frases padrão dos códigos de status ("OK", "Not Found"...)
+from http.client import HTTPException, parse_headers  # Mesmo parser usado pelo BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+# Tamanho máximo aceito para a linha de requisição + cabeçalhos (em bytes)
+LIMITE_CABECALHOS = 64 * 1024
+
+# Rótulo nas métricas das requisições recusadas antes de chegar a uma rota (malformadas, cabeçalhos
+# grandes demais, método não suportado), nos dois motores
+ROTA_RECUSADA = "recusada"
+
+# Tamanho do bloco usado quando o sendfile não está disponível (leitura em pedaços fixos)
+TAMANHO_BLOCO = 64 * 1024
+
+# Motor "threads" com todos os workers ocupados: uma conexão keep-alive ociosa há pelo menos este
+# tempo (segundos) é encerrada para dar lugar a uma conexão nova. Conexões que acabaram de responder
+# não são fechadas, porque o próximo pedido delas pode já estar a caminho.
+OCIOSIDADE_MINIMA = 1.0
+
+# Buffer de leitura reaproveitado por cada thread no modo sem sendfile (memória constante por worker)
+_buffers = threading.local()
+
+
+# =====================================================
+# CORPO ENVIADO DIRETO DO DISCO
+# =====================================================
+
+# Indica que o corpo da resposta é um trecho de um arquivo em disco, e não bytes em memória
+class TrechoArquivo:
+
+    def __init__(self, caminho, inicio, tamanho):
+        self.caminho = caminho
+        self.inicio = inicio      # Posição (em bytes) do primeiro byte a enviar
+        self.tamanho = tamanho    # Quantidade de bytes a enviar
+
+    # Permite usar len() tanto em pedaços em memória quanto em trechos de arquivo
+    def __len__(self):
+        return self.tamanho
+
+
+# O corpo de uma Resposta como lista de pedaços (bytes, memoryview ou TrechoArquivo)
+def partes_do_corpo(corpo):
+    if isinstance(corpo, list):
+        return corpo
+    return [corpo]
+
+
+# Tamanho total do corpo, usado no Content-Length
+def tamanho_corpo(corpo):
+    return sum(len(parte) for parte in partes_do_corpo(corpo))
+
+
+# Abre (uma única vez cada) os arquivos usados pelos pedaços do corpo.
+# Os arquivos ficam registrados na pilha e são fechados quando ela for encerrada.
+def abrir_arquivos(partes, pilha):
+    arquivos = {}
+    for parte in partes:
+        if isinstance(parte, TrechoArquivo) and parte.caminho not in arquivos:
+            arquivos[parte.caminho] = pilha.enter_context(open(parte.caminho, "rb"))
+    return arquivos
+
+
+# Envia um trecho de arquivo por um socket bloqueante. Retorna quantos bytes foram enviados.
+def enviar_arquivo(sock, arquivo, inicio, tamanho):
+    # Com os.sendfile o kernel copia do cache de páginas direto para o socket.
+    # socket.sendfile usa os.sendfile por baixo e ainda respeita o timeout do socket.
+    if hasattr(os, "sendfile"):
+        return sock.sendfile(arquivo, inicio, tamanho)
+
+    # Sem sendfile: lê em blocos de tamanho fixo sempre no mesmo buffer da thread
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(TAMANHO_BLOCO)
+    visao = memoryview(buffer)
+    arquivo.seek(inicio)
+    enviado = 0
+    while enviado < tamanho:
+        lido = arquivo.readinto(visao[:min(TAMANHO_BLOCO, tamanho - enviado)])
+        if not lido:
+            break
+        sock.sendall(visao[:lido])
+        enviado += lido
+    return enviado
+
+
+# =====================================================
+# MOTOR 1: POOL DE THREADS (uma conexão por worker)
+# =====================================================
+
+class ServidorPoolThreads(HTTPServer):
+
+    # Permite reiniciar o servidor logo após fechá-lo, sem esperar o TIME_WAIT da porta
+    allow_reuse_address = True
+
+    # Objeto Metricas (opcional) que recebe as conexões abertas e as respostas enviadas
+    metricas = None
+
+    def __init__(self, endereco, handler, max_workers, max_conexoes):
+        # Fila de conexões pendentes no kernel (listen backlog)
+        self.request_queue_size = max_conexoes
+
+        # Pool fixo de threads: nunca haverá mais que max_workers conexões sendo atendidas ao mesmo tempo
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http-worker")
+
+        # Cada conexão aceita ocupa um worker durante toda a sua vida (inclusive o tempo ocioso do
+        # keep-alive), então aceitar mais conexões que workers só deixaria as excedentes paradas na
+        # fila do pool, atrás de conexões ociosas. O limite é o menor dos dois valores; quando ele
+        # é atingido, o laço de accept para e os clientes aguardam na fila do kernel.
+        self.vagas = threading.BoundedSemaphore(min(max_conexoes, max_workers))
+
+        # Conexões esperando a próxima requisição (keep-alive) -> instante em que ficaram ociosas,
+        # da mais antiga para a mais nova
+        self._ociosas = {}
+        self._lock_ociosas = threading.Lock()
+
+        super().__init__(endereco, handler)
+
+    # Chamado pelo serve_forever() para cada conexão aceita: entrega a conexão ao pool
+    def process_request(self, request, client_address):
+        # Sem worker livre: em vez de esperar até o keep-alive de alguém expirar (até keepalive_timeout),
+        # encerra a conexão ociosa há mais tempo para dar lugar a esta. Um navegador reabre a
+        # conexão quando precisar, pagando só um novo handshake TCP.
+        if not self.vagas.acquire(blocking=False):
+            self._encerrar_ociosa()
+            while not self.vagas.acquire(timeout=0.05):
+                self._encerrar_ociosa()
+        try:
+            self.pool.submit(self._atender, request, client_address)
+        except RuntimeError:
+            # O pool já foi encerrado (servidor desligando): apenas descarta a conexão
+            self.vagas.release()
+            self.shutdown_request(request)
+
+    # Executado dentro de um worker: atende todas as requisições da conexão (keep-alive)
+    def _atender(self, request, client_address):
+        if self.metricas is not None:
+            self.metricas.conexao(+1)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.vagas.release()
+            if self.metricas is not None:
+                self.metricas.conexao(-1)
+
+    # Chamado pelo handler antes de cada requisição: bloqueia até o cliente mandar o próximo pedido,
+    # fechar a conexão ou o keep-alive expirar (TimeoutError), com a conexão marcada como ociosa
+    def esperar_requisicao(self, handler):
+        with self._lock_ociosas:
+            self._ociosas[handler.connection] = time.monotonic()
+        try:
+            # peek() só devolve quando há dados no buffer (ou fim da conexão), sem consumir nada
+            handler.rfile.peek(1)
+        finally:
+            with self._lock_ociosas:
+                self._ociosas.pop(handler.connection, None)
+
+    # Fecha o lado de leitura da conexão ociosa mais antiga (se ela estiver ociosa há pelo menos
+    # OCIOSIDADE_MINIMA): o peek() dela retorna vazio e o worker encerra a conexão.
+    # Um pedido que já estava no buffer ainda é respondido normalmente.
+    def _encerrar_ociosa(self):
+        with self._lock_ociosas:
+            if not self._ociosas:
+                return
+            conexao, desde = next(iter(self._ociosas.items()))
+            if time.monotonic() - desde < OCIOSIDADE_MINIMA:
+                return
+            del self._ociosas[conexao]
+            try:
+                conexao.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ==========================================================
+# MOTOR 2: ASYNCIO (selectors + pool de threads para montar respostas)
+# ==========================================================
+
+class ServidorAsyncio:
+
+    def __init__(self, endereco, montar_resposta, max_workers, max_conexoes, keepalive_timeout):
+        # Função do servidor.py que recebe (caminho, cabeçalhos) e devolve uma Resposta
+        self.montar_resposta = montar_resposta
+        self.max_workers = max_workers
+        self.max_conexoes = max_conexoes
+        self.keepalive_timeout = keepalive_timeout
+        self.metricas = None    # Objeto Metricas (opcional), ver metricas.py
+
+        # O socket é criado aqui (e não dentro do laço) para que server_address já
+        # contenha a porta real mesmo quando a porta pedida for 0 (porta efêmera)
+        self.socket = socket.create_server(endereco, backlog=max_conexoes)
+        self.server_address = self.socket.getsockname()
+
+        self._laco = None
+        self._parar = None
+
+    def serve_forever(self):
+        asyncio.run(self._principal())
+
+    # Pode ser chamado de outra thread para encerrar o serve_forever()
+    def shutdown(self):
+        if self._laco is not None:
+            self._laco.call_soon_threadsafe(self._parar.set)
+
+    def server_close(self):
+        self.socket.close()
+
+    async def _principal(self):
+        self._laco = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+
+        # Pool onde as respostas são montadas (leitura de disco não pode travar o laço de eventos)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="http-worker")
+
+        # Limite de conexões atendidas simultaneamente; as excedentes esperam por uma vaga
+        self._vagas = asyncio.Semaphore(self.max_conexoes)
+
+        servidor = await asyncio.start_server(self._conexao, sock=self.socket, limit=LIMITE_CABECALHOS)
+        try:
+            # Aceita conexões até alguém chamar shutdown() (o Ctrl+C cancela esta espera)
+            await self._parar.wait()
+        finally:
+            servidor.close()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # Corrotina executada para cada conexão TCP aceita
+    async def _conexao(self, leitor, escritor):
+        # Desliga o algoritmo de Nagle: cabeçalhos e corpo saem em escritas separadas e, sem isso,
+        # o corpo espera o ACK atrasado do cliente (~40 ms por resposta pequena). O asyncio só faz
+        # isso sozinho quando o socket de escuta foi criado com proto=IPPROTO_TCP.
+        escritor.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        async with self._vagas:
+            if self.metricas is not None:
+                self.metricas.conexao(+1)
+            try:
+                # Atende requisições em sequência enquanto o cliente mantiver a conexão aberta
+                while await self._requisicao(leitor, escritor):
+                    pass
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Cliente fechou a conexão no meio de uma requisição/resposta
+                pass
+            finally:
+                escritor.close()
+                if self.metricas is not None:
+                    self.metricas.conexao(-1)
+
+    # Lê e responde UMA requisição. Retorna True se a conexão deve continuar aberta.
+    async def _requisicao(self, leitor, escritor):
+        # Espera a próxima requisição; conexões ociosas por mais que keepalive_timeout são fechadas
+        try:
+            bruto = await asyncio.wait_for(leitor.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.IncompleteReadError:
+            # Conexão fechada pelo cliente entre duas requisições (fim normal do keep-alive)
+            return False
+        except asyncio.LimitOverrunError:
+            await self._recusar(escritor, 431, time.perf_counter())
+            return False
+        # A latência é medida a partir daqui (requisição lida) até o último byte entregue ao socket
+        inicio = time.perf_counter()
+
+        # Separa a linha de requisição ("GET /img1.jpg HTTP/1.1") dos cabeçalhos
+        linha, _, resto = bruto.partition(b"\r\n")
+        partes = linha.decode("iso-8859-1").split()
+        if len(partes) != 3 or not partes[2].startswith("HTTP/"):
+            await self._recusar(escritor, 400, inicio)
+            return False
+        metodo, caminho, versao = partes
+        try:
+            cabecalhos = parse_headers(io.BytesIO(resto))
+        except HTTPException:
+            # Linha de cabeçalho longa demais ou cabeçalhos demais (o BaseHTTPRequestHandler também responde 431)
+            await self._recusar(escritor, 431, inicio, metodo, caminho)
+            return False
+
+        # Descarta um eventual corpo enviado pelo cliente para não confundir a próxima requisição
+        tamanho_corpo = cabecalhos.get("Content-Length")
+        if tamanho_corpo:
+            try:
+                await leitor.readexactly(int(tamanho_corpo))
+            except ValueError:
+                await self._recusar(escritor, 400, inicio, metodo, caminho)
+                return False
+
+        # Regras de persistência: HTTP/1.1 mantém por padrão, HTTP/1.0 só com "Connection: keep-alive"
+        conexao = (cabecalhos.get("Connection") or "").lower()
+        if versao == "HTTP/1.1":
+            manter = conexao != "close"
+        else:
+            manter = conexao == "keep-alive"
+
+        # HEAD é igual ao GET, mas só com os cabeçalhos (usado para descobrir o tamanho de um arquivo)
+        if metodo not in ("GET", "HEAD"):
+            await self._recusar(escritor, 501, inicio, metodo, caminho)
+            return False
+
+        # Monta a resposta numa thread do pool (pode ler arquivos do disco)
+        resposta = await self._laco.run_in_executor(self._pool, self.montar_resposta, caminho, cabecalhos)
+        partes = partes_do_corpo(resposta.corpo) if metodo == "GET" else []
+        status, enviados = resposta.status, 0
+
+        with ExitStack() as pilha:
+            # Os arquivos são abertos antes dos cabeçalhos: se algum sumiu depois do stat, responde 404
+            try:
+                arquivos = abrir_arquivos(partes, pilha)
+            except OSError:
+                await self._erro(escritor, 404)
+                status, partes, manter = 404, None, False
+
+            if partes is not None:
+                escritor.write(serializar_cabecalhos(resposta, manter))
+                for parte in partes:
+                    if isinstance(parte, TrechoArquivo):
+                        enviado = await self._enviar_trecho(escritor, arquivos[parte.caminho], parte)
+                        enviados += enviado
+                        # Se o arquivo encolheu durante o envio, o Content-Length prometido não foi
+                        # cumprido: a única saída correta é fechar a conexão
+                        if enviado != parte.tamanho:
+                            manter = False
+                            break
+                    else:
+                        escritor.write(parte)
+                        enviados += len(parte)
+                await escritor.drain()
+
+        if self.metricas is not None:
+            cliente = escritor.get_extra_info("peername")
+            self.metricas.resposta(cliente[0] if cliente else "-", metodo, caminho, resposta.rota, status,
+                                   enviados, time.perf_counter() - inicio)
+        return manter
+
+    # Envia um trecho de arquivo sem carregá-lo na memória. Retorna quantos bytes foram enviados.
+    async def _enviar_trecho(self, escritor, arquivo, trecho):
+        try:
+            # loop.sendfile espera o buffer do transporte esvaziar e usa os.sendfile
+            # quando o transporte é um socket TCP comum
+            return await self._laco.sendfile(escritor.transport, arquivo, trecho.inicio, trecho.tamanho,
+                                             fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            return await self._enviar_em_blocos(escritor, arquivo, trecho)
+
+    # Alternativa ao sendfile: blocos de tamanho fixo lidos sempre no mesmo buffer
+    async def _enviar_em_blocos(self, escritor, arquivo, trecho):
+        buffer = bytearray(TAMANHO_BLOCO)
+        visao = memoryview(buffer)
+        arquivo.seek(trecho.inicio)
+        enviado = 0
+        while enviado < trecho.tamanho:
+            lido = await self._laco.run_in_executor(
+                self._pool, arquivo.readinto, visao[:min(TAMANHO_BLOCO, trecho.tamanho - enviado)])
+            if not lido:
+                break
+            # write() copia para o buffer do transporte o que não couber no socket, então o
+            # buffer de leitura pode ser reaproveitado logo depois do drain()
+            escritor.write(visao[:lido])
+            await escritor.drain()
+            enviado += lido
+        return enviado
+
+    # Recusa uma requisição antes de montar a resposta, registrando nas métricas como o motor de
+    # threads faz com os erros do BaseHTTPRequestHandler (MeuServidor.send_error)
+    async def _recusar(self, escritor, status, inicio, metodo="-", caminho="-"):
+        await self._erro(escritor, status)
+        if self.metricas is not None:
+            cliente = escritor.get_extra_info("peername")
+            self.metricas.resposta(cliente[0] if cliente else "-", metodo, caminho, ROTA_RECUSADA, status, 0,
+                                   time.perf_counter() - inicio)
+
+    # Responde com um erro simples e sem corpo, fechando a conexão em seguida
+    async def _erro(self, escritor, status):
+        linha = f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        escritor.write((linha + "Content-Length: 0\r\nConnection: close\r\n\r\n").encode("latin-1"))
+        await escritor.drain()
+
+
+# Gera a linha de status e os cabeçalhos de uma Resposta no formato HTTP/1.1
+def serializar_cabecalhos(resposta, manter_conexao):
+    linhas = [
+        f"HTTP/1.1 {resposta.status} {HTTPStatus(resposta.status).phrase}",
+        f"Date: {formatdate(usegmt=True)}",
+        f"Connection: {'keep-alive' if manter_conexao else 'close'}",
+    ]
+    if resposta.tipo is not None:
+        linhas.append(f"Content-type: {resposta.tipo}")
+    # Uma resposta 304 não tem corpo, e o Content-Length nela descreveria o conteúdo original
+    if resposta.status != 304:
+        linhas.append(f"Content-Length: {tamanho_corpo(resposta.corpo)}")
+    linhas.extend(f"{nome}: {valor}" for nome, valor in resposta.cabecalhos)
+    return ("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1")
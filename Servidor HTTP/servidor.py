@@ -1,12 +1,52 @@
-# Importa a classe base para criar um manipulador de requisições HTTP e o servidor em si
-from http.server import BaseHTTPRequestHandler, HTTPServer
+# Importa a classe base para criar um manipulador de requisições HTTP
+from http.server import BaseHTTPRequestHandler
+
+# Funções para separar o caminho da query string e decodificar/codificar caracteres como "%20"
+from urllib.parse import urlsplit, unquote, quote
 
 # Importa a biblioteca para trabalhar com caminhos de arquivos (como construir caminhos, verificar existência, etc.)
 import os
 
-# Importa a biblioteca para medir o tempo (usado para calcular o tempo de leitura das imagens)
+# Leitura das opções de linha de comando (motor, número de workers, limites...)
+import argparse
+
+# Para exibir o erro completo no terminal quando uma requisição falhar (HTTP 500)
+import traceback
+
+# Interpreta a data enviada pelo navegador no cabeçalho If-Modified-Since
+from email.utils import parsedate_to_datetime
+from datetime import timezone
+
+# Gera a fronteira aleatória que separa as partes de uma resposta multipart/byteranges
+import secrets
+
+# Mede a latência de cada requisição no motor de threads (métricas)
 import time
 
+# Motores de atendimento (pool de threads e asyncio) — ver motores.py
+import motores
+
+# Corpo de resposta enviado direto do disco (sendfile) — ver motores.py
+from motores import TrechoArquivo, enviar_arquivo, partes_do_corpo, tamanho_corpo, abrir_arquivos
+
+# Fecha todos os arquivos abertos para uma resposta, mesmo em caso de erro
+from contextlib import ExitStack
+
+# Cache em memória do conteúdo dos arquivos (LRU com invalidação por mtime) — ver cache.py
+from cache import CacheConteudo
+
+# Página da galeria montada com antecedência e refeita só quando algo muda — ver galeria.py
+from galeria import Galeria
+
+# Miniaturas das imagens geradas num pool de processos, com cache em disco — ver miniaturas.py
+from miniaturas import Miniaturas
+
+# Compressão das respostas de texto negociada pelo Accept-Encoding — ver compressao.py
+from compressao import negociar, comprimivel, EXTENSOES, TAMANHO_MINIMO
+
+# Contadores, histogramas de latência (/metrics) e log de acesso assíncrono — ver metricas.py
+from metricas import Metricas, LogAcesso
+
 # ===============================
 # CONFIGURAÇÃO BÁSICA DO SERVIDOR
 # ===============================
@@ -17,133 +57,641 @@ host = "0.0.0.0"
 # Porta em que o servidor vai ficar escutando requisições HTTP
 port = 8000
 
+# Motor de atendimento padrão: "threads" (pool de threads) ou "asyncio" (laço de eventos)
+modo = "threads"
+
+# Número máximo de threads atendendo requisições ao mesmo tempo
+max_workers = 64
+
+# Número máximo de conexões abertas simultaneamente (as excedentes aguardam na fila do kernel).
+# No motor "threads" cada conexão ocupa um worker, então o limite efetivo é max_workers.
+max_conexoes = 512
+
+# Tempo (em segundos) que uma conexão keep-alive ociosa fica aberta esperando a próxima requisição
+keepalive_timeout = 15
+
+# Memória máxima (em MB) usada pelo cache de conteúdo dos arquivos
+cache_mb = 64
+
+# Arquivos maiores que este tamanho (em KB) não são carregados na memória:
+# são enviados direto do disco para o socket com sendfile
+limite_sendfile_kb = 256
+
+# Tempo (em segundos) que o navegador pode reutilizar cada tipo de conteúdo sem consultar o servidor.
+# Com 0 o navegador sempre revalida (If-None-Match), recebendo 304 se nada mudou.
+max_age = {
+    "imagens": 86400,   # Imagens quase nunca mudam: 1 dia
+    "css": 3600,        # Folha de estilo: 1 hora
+    "index": 0,         # Página da galeria: sempre revalida (muda quando entram imagens novas)
+}
+
+# De quantos em quantos segundos a pasta de imagens e o index.html são verificados
+# para refazer a página da galeria
+intervalo_galeria = 2
+
+# Miniaturas na galeria: lado máximo em pixels e quantos processos geram as miniaturas
+# (None = um por núcleo). Exige a biblioteca Pillow; sem ela a galeria usa as imagens originais.
+usar_miniaturas = True
+miniaturas_px = 300
+processos_miniaturas = None
+
+# Máximo de intervalos aceitos num único cabeçalho Range (acima disso o arquivo vai inteiro)
+max_intervalos = 16
+
+# Arquivo do log de acesso (uma linha JSON por requisição, gravada em segundo plano).
+# None = sem log de acesso; "-" = escreve no terminal.
+log_acesso = None
+
 # Descobre o caminho completo (absoluto) da pasta onde está este script Python
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 # Define os caminhos completos para as pastas de HTML/CSS e imagens
 base_folder = os.path.join(script_dir, "site")      # Pasta onde está o index.html e style.css
 image_folder = os.path.join(script_dir, "imagens")  # Pasta onde estão armazenadas as imagens
+thumb_folder = os.path.join(script_dir, ".cache_miniaturas")  # Miniaturas geradas (nome = hash do original)
 
-# ======================================================
-# CLASSE RESPONSÁVEL POR LIDAR COM CADA REQUISIÇÃO HTTP
-# ======================================================
+# Cache compartilhado por todas as requisições (o tamanho é ajustado em main() pela opção --cache-mb)
+cache = CacheConteudo(cache_mb * 1024 * 1024, limite_sendfile_kb * 1024)
 
-class MeuServidor(BaseHTTPRequestHandler):
+# Página da galeria pronta para envio (o monitoramento de mudanças começa em criar_servidor)
+galeria = Galeria(os.path.join(base_folder, "index.html"), image_folder)
 
-    # Método executado automaticamente quando o servidor recebe uma requisição HTTP do tipo GET
-    def do_GET(self):
-
-        # =====================================================
-        # CASO O USUÁRIO PEÇA A PÁGINA PRINCIPAL (HOME / INDEX)
-        # =====================================================
-        if self.path == "/" or self.path == "/index.html":
-            # Caminho completo para o arquivo index.html
-            file_path = os.path.join(base_folder, "index.html")
+# Gerador de miniaturas (o pool de processos só é criado em criar_servidor)
+miniaturas = Miniaturas(image_folder, thumb_folder, miniaturas_px)
 
-            # Envia um cabeçalho de resposta HTTP 200 (OK) e define o tipo de conteúdo como HTML
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
+# Métricas de todas as requisições, expostas em /metrics (os motores registram cada resposta)
+metricas = Metricas()
 
-            try:
-                # Lista todos os arquivos da pasta de imagens com extensão JPG, PNG ou JPEG
-                imagens = [f for f in os.listdir(image_folder) if f.endswith(('.jpg', '.png', '.jpeg'))]
-            except FileNotFoundError:
-                # Caso a pasta de imagens não exista, evita erro e define uma lista vazia
-                imagens = []
-
-            # Lê o conteúdo do arquivo HTML
-            html = open(file_path, "r", encoding="utf-8").read()
-
-            # Para cada imagem encontrada, cria um bloco HTML com a imagem clicável
-            imagens_html = "".join(
-                f'<div class="img-box"><a href="/{img}" target="_blank"><img src="/{img}" alt="{img}"></a></div>'
-                for img in imagens
-            )
-
-            # Substitui o marcador {{IMAGENS}} no HTML pelos blocos gerados dinamicamente
-            self.wfile.write(html.replace("{{IMAGENS}}", imagens_html).encode())
-            return
+# ======================================================
+# RESPOSTA HTTP MONTADA (INDEPENDENTE DO MOTOR)
+# ======================================================
 
-        # =============================================
-        # CASO O USUÁRIO PEÇA UM ARQUIVO CSS (estilo)
-        # =============================================
-        elif self.path.endswith(".css"):
-            # Constrói o caminho completo do CSS solicitado
-            file_path = os.path.join(base_folder, self.path.lstrip("/"))
-
-            # Verifica se o arquivo CSS realmente existe
-            if os.path.exists(file_path):
-                # Envia resposta HTTP com cabeçalho tipo CSS
-                self.send_response(200)
-                self.send_header("Content-type", "text/css")
-                self.end_headers()
-
-                # Abre o arquivo CSS e envia o conteúdo como resposta
-                with open(file_path, "rb") as file:
-                    self.wfile.write(file.read())
-            else:
-                # Caso o CSS solicitado não exista, envia erro 404
-                self.send_error(404, "Arquivo CSS não encontrado.")
-            return
+# Guarda tudo o que será enviado ao cliente. Os dois motores (threads e asyncio)
+# recebem este objeto e cuidam apenas de escrevê-lo no socket.
+class Resposta:
 
-        # ===============================================
-        # CASO O USUÁRIO PEÇA UMA IMAGEM ESPECÍFICA
-        # ===============================================
+    def __init__(self, status, tipo, corpo, cabecalhos=None):
+        self.status = status                  # Código HTTP (200, 404, ...)
+        self.tipo = tipo                      # Valor do cabeçalho Content-type (None = não enviar)
+        self.corpo = corpo                    # Conteúdo: bytes, TrechoArquivo ou lista desses pedaços
+        self.cabecalhos = cabecalhos or []    # Cabeçalhos extras: lista de pares (nome, valor)
+        self.rota = None                      # Rótulo da rota nas métricas (preenchido por montar_resposta)
 
-        # Remove a barra inicial do caminho (ex: "/img1.jpg" vira "img1.jpg")
-        image_name = self.path.lstrip("/")
+# ======================================================
+# CACHE DO NAVEGADOR (ETag, Last-Modified, Cache-Control)
+# ======================================================
 
-        # Constrói o caminho completo da imagem solicitada
-        image_path = os.path.join(image_folder, image_name)
+# Valor do cabeçalho Cache-Control para um tempo de validade em segundos
+def cache_control(segundos):
+    if segundos <= 0:
+        return "no-cache"
+    return f"public, max-age={segundos}"
+
+
+# Verifica se a cópia que o navegador já tem ainda é válida (resposta 304 Not Modified)
+def nao_modificado(cabecalhos, etag, modificado):
+    # If-None-Match tem prioridade sobre If-Modified-Since
+    if_none_match = cabecalhos.get("If-None-Match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Lista de ETags separadas por vírgula; a comparação ignora o prefixo fraco "W/"
+        return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+    if_modified_since = cabecalhos.get("If-Modified-Since")
+    if if_modified_since and modificado is not None:
+        try:
+            data = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            # Data malformada: ignora o cabeçalho e envia o conteúdo completo
+            return False
+        if data.tzinfo is None:
+            data = data.replace(tzinfo=timezone.utc)
+        return modificado <= data.timestamp()
+    return False
 
-        # Verifica se o arquivo da imagem existe e é um arquivo comum
-        if os.path.exists(image_path) and os.path.isfile(image_path):
-            # Marca o tempo de início da leitura do arquivo
-            start_time = time.time()
 
-            # Calcula o tamanho do arquivo em kilobytes
-            file_size = os.path.getsize(image_path) / 1024
+# ======================================================
+# DOWNLOADS PARCIAIS (Range / If-Range)
+# ======================================================
 
-            # Lê todo o conteúdo binário da imagem
-            with open(image_path, "rb") as file:
-                data = file.read()
+# Interpreta o cabeçalho Range ("bytes=0-99,200-" ...) para um arquivo com `tamanho` bytes.
+# Retorna a lista de intervalos (inicio, fim) inclusivos, já ordenados e unidos;
+# [] se nenhum intervalo pode ser atendido (resposta 416);
+# None se o cabeçalho for inválido e deve ser ignorado (resposta 200 completa).
+def interpretar_range(valor, tamanho):
+    unidade, _, especificacao = valor.partition("=")
+    if unidade.strip().lower() != "bytes" or not especificacao:
+        return None
+
+    intervalos = []
+    for item in especificacao.split(","):
+        inicio, separador, fim = item.strip().partition("-")
+        if not separador:
+            return None
+        try:
+            if inicio == "":
+                # "-500": os últimos 500 bytes do arquivo
+                sufixo = int(fim)
+                if sufixo < 0:
+                    return None
+                if sufixo == 0 or tamanho == 0:
+                    continue
+                intervalos.append((max(0, tamanho - sufixo), tamanho - 1))
+            else:
+                # "100-" (até o fim) ou "100-199"
+                inicio = int(inicio)
+                fim = int(fim) if fim else None
+                if inicio < 0 or (fim is not None and fim < inicio):
+                    return None
+                if inicio >= tamanho:
+                    continue
+                intervalos.append((inicio, tamanho - 1 if fim is None else min(fim, tamanho - 1)))
+        except ValueError:
+            return None
+
+    # Muitos intervalos num só pedido são tratados como abuso: envia o arquivo inteiro
+    if len(intervalos) > max_intervalos:
+        return None
+
+    # Ordena e junta intervalos sobrepostos ou vizinhos
+    unidos = []
+    for inicio, fim in sorted(intervalos):
+        if unidos and inicio <= unidos[-1][1] + 1:
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fim))
+        else:
+            unidos.append((inicio, fim))
+    return unidos
+
+
+# If-Range: o download parcial só continua se o cliente ainda tem a MESMA versão do arquivo
+def if_range_valido(cabecalhos, entrada):
+    valor = cabecalhos.get("If-Range")
+    if valor is None:
+        return True
+    valor = valor.strip()
+    if valor.startswith('"'):
+        # Comparação forte de ETag
+        return valor == entrada.etag
+    if valor.startswith("W/"):
+        # ETags fracas nunca valem para If-Range
+        return False
+    # Caso contrário é uma data, que precisa ser exatamente o Last-Modified atual
+    return valor == entrada.last_modified
+
+
+# Um pedaço do conteúdo da entrada: fatia da memória (sem cópia) ou trecho do arquivo em disco
+def trecho_da_entrada(entrada, inicio, fim):
+    if entrada.dados is not None:
+        return memoryview(entrada.dados)[inicio:fim + 1]
+    return TrechoArquivo(entrada.caminho, inicio, fim - inicio + 1)
+
+
+# Resposta 206 para um ou mais intervalos de uma entrada do cache
+def resposta_parcial(entrada, tipo, intervalos, extras):
+    # Um intervalo: o corpo é só o trecho pedido e o Content-Range diz onde ele fica
+    if len(intervalos) == 1:
+        inicio, fim = intervalos[0]
+        extras = extras + [("Content-Range", f"bytes {inicio}-{fim}/{entrada.tamanho}")]
+        return Resposta(206, tipo, trecho_da_entrada(entrada, inicio, fim), extras)
+
+    # Vários intervalos: multipart/byteranges, cada parte com seus próprios cabeçalhos
+    fronteira = secrets.token_hex(12)
+    partes = []
+    for inicio, fim in intervalos:
+        partes.append((f"\r\n--{fronteira}\r\n"
+                       f"Content-Type: {tipo}\r\n"
+                       f"Content-Range: bytes {inicio}-{fim}/{entrada.tamanho}\r\n\r\n").encode("latin-1"))
+        partes.append(trecho_da_entrada(entrada, inicio, fim))
+    partes.append(f"\r\n--{fronteira}--\r\n".encode("latin-1"))
+    return Resposta(206, f"multipart/byteranges; boundary={fronteira}", partes, extras)
+
+
+# Corpo da resposta para uma entrada do cache: o conteúdo em memória ou,
+# para arquivos grandes, o arquivo inteiro a ser enviado com sendfile
+def corpo_da_entrada(entrada):
+    if entrada.dados is not None:
+        return entrada.dados
+    return TrechoArquivo(entrada.caminho, 0, entrada.tamanho)
+
+
+# Versão comprimida de uma entrada na codificação pedida: (corpo, etag), ou None para enviar o original.
+# Primeiro procura um arquivo pré-comprimido ao lado do original (ex: style.css.gz), que não
+# custa CPU nenhuma; senão comprime o conteúdo em memória uma única vez e guarda no cache.
+def variante_comprimida(entrada, codificacao):
+    irmao = cache.obter(entrada.caminho + EXTENSOES[codificacao])
+    # Um .gz mais antigo que o original está desatualizado e é ignorado
+    if irmao is not None and irmao.mtime_ns >= entrada.mtime_ns:
+        return corpo_da_entrada(irmao), irmao.etag
+
+    if entrada.dados is None or entrada.tamanho < TAMANHO_MINIMO:
+        return None
+    return cache.variante(entrada, codificacao)
+
+
+# Resposta para um arquivo do cache: 304 se o navegador já tem esta versão,
+# 206/416 para pedidos com Range, senão 200 com o conteúdo completo
+def responder_entrada(entrada, cabecalhos, rota, tipo=None):
+    tipo = tipo or entrada.tipo
+    extras = [
+        ("Cache-Control", cache_control(max_age[rota])),
+        ("Accept-Ranges", "bytes"),     # Avisa que o cliente pode pedir partes do arquivo
+    ]
+
+    # Texto (CSS, HTML...) pode sair comprimido; imagens JPEG/PNG já são comprimidas e vão como estão
+    if comprimivel(tipo):
+        extras.append(("Vary", "Accept-Encoding"))  # A resposta depende do Accept-Encoding do pedido
+        # Pedidos com Range recebem o original: os intervalos se referem ao conteúdo sem compressão
+        codificacao = None if cabecalhos.get("Range") else negociar(cabecalhos.get("Accept-Encoding"))
+        comprimida = variante_comprimida(entrada, codificacao) if codificacao else None
+        if comprimida is not None:
+            corpo, etag = comprimida
+            extras = [("ETag", etag), ("Last-Modified", entrada.last_modified),
+                      ("Content-Encoding", codificacao)] + extras
+            if nao_modificado(cabecalhos, etag, entrada.modificado):
+                return Resposta(304, None, b"", extras)
+            return Resposta(200, tipo, corpo, extras)
+
+    extras = entrada.cabecalhos + extras
+    if nao_modificado(cabecalhos, entrada.etag, entrada.modificado):
+        return Resposta(304, None, b"", extras)
+
+    pedido = cabecalhos.get("Range")
+    if pedido and if_range_valido(cabecalhos, entrada):
+        intervalos = interpretar_range(pedido, entrada.tamanho)
+        if intervalos == []:
+            # Nenhum intervalo dentro do arquivo: 416 informando o tamanho real
+            extras = extras + [("Content-Range", f"bytes */{entrada.tamanho}")]
+            return Resposta(416, None, b"", extras)
+        if intervalos:
+            return resposta_parcial(entrada, tipo, intervalos, extras)
+
+    return Resposta(200, tipo, corpo_da_entrada(entrada), extras)
 
-            # Calcula o tempo gasto na leitura
-            duration = time.time() - start_time
+# ======================================================
+# MONTAGEM DA RESPOSTA PARA CADA CAMINHO PEDIDO
+# ======================================================
 
-            # Calcula a velocidade de leitura (KB/s)
-            speed = file_size / duration if duration > 0 else 0
+# Recebe o caminho pedido (ex: "/img1.jpg") e os cabeçalhos da requisição e devolve uma Resposta
+def montar_resposta(caminho, cabecalhos):
+    # Ignora a query string (ex: "/img1.jpg?v=2") e decodifica caracteres especiais
+    path = unquote(urlsplit(caminho).path)
+    rota = nome_rota(path)
+    try:
+        resposta = rotear(path, rota, cabecalhos)
+    except Exception:
+        # Qualquer falha inesperada vira um erro 500, sem derrubar a conexão nem o servidor
+        traceback.print_exc()
+        resposta = Resposta(500, "text/html", b"<h1>500 - Erro interno no servidor</h1>")
+    resposta.rota = rota
+    return resposta
+
+
+# Junta o caminho pedido (já decodificado, ex: "/img1.jpg") à pasta `raiz` e confere que o
+# resultado continua dentro dela. Como o caminho passa por unquote(), "/%2e%2e/servidor.py"
+# chega aqui como "/../servidor.py": sem esta verificação qualquer arquivo legível da máquina
+# poderia ser baixado. Links simbólicos também são resolvidos antes da comparação.
+# Retorna o caminho real do arquivo, ou None se o pedido deve ser recusado (404).
+def caminho_seguro(raiz, nome):
+    # NUL faria os.stat() falhar com ValueError; a barra invertida é separador no Windows
+    if "\0" in nome or "\\" in nome:
+        return None
+    raiz = os.path.realpath(raiz)
+    candidato = os.path.realpath(os.path.join(raiz, nome.lstrip("/")))
+    if os.path.commonpath([raiz, candidato]) != raiz:
+        return None
+    return candidato
+
+
+# Classifica o caminho pedido numa das rotas do servidor. O nome também é o rótulo usado
+# nas métricas (poucos valores fixos, e não um por arquivo).
+def nome_rota(path):
+    if path == "/" or path == "/index.html":
+        return "index"
+    if path == "/metrics":
+        return "metrics"
+    if path.startswith("/thumb/"):
+        return "thumb"
+    if path.endswith(".css"):
+        return "css"
+    return "imagens"
+
+
+def rotear(path, rota, cabecalhos):
+
+    # =====================================================
+    # CASO O USUÁRIO PEÇA A PÁGINA PRINCIPAL (HOME / INDEX)
+    # =====================================================
+    if rota == "index":
+        # A página já está pronta na memória (é refeita só quando a pasta de imagens ou o modelo mudam)
+        pagina = galeria.atual()
+
+        # Navegadores que aceitam compressão recebem a versão comprimida, gerada junto com a página
+        extras = [
+            ("Cache-Control", cache_control(max_age["index"])),
+            ("Last-Modified", pagina.last_modified),
+            ("Vary", "Accept-Encoding"),    # A resposta depende do Accept-Encoding do pedido
+        ]
+        codificacao = negociar(cabecalhos.get("Accept-Encoding"))
+        if codificacao in pagina.variantes:
+            corpo, etag = pagina.variantes[codificacao]
+            extras.append(("Content-Encoding", codificacao))
+        else:
+            etag, corpo = pagina.etag, pagina.html
+        extras.append(("ETag", etag))
+
+        if nao_modificado(cabecalhos, etag, pagina.modificado):
+            return Resposta(304, None, b"", extras)
+        return Resposta(200, "text/html", corpo, extras)
+
+    # =============================================
+    # MÉTRICAS DO SERVIDOR (formato do Prometheus)
+    # =============================================
+    elif rota == "metrics":
+        return Resposta(200, "text/plain; version=0.0.4; charset=utf-8", metricas.exportar(metricas_adicionais()),
+                        [("Cache-Control", "no-store")])
+
+    # =============================================
+    # CASO O USUÁRIO PEÇA UMA MINIATURA (/thumb/img1.jpg)
+    # =============================================
+    elif rota == "thumb":
+        nome = path[len("/thumb/"):]
+
+        # A miniatura pronta é um arquivo comum do cache em disco: passa pelo mesmo cache em memória
+        miniatura = miniaturas.caminho(nome)
+        entrada = cache.obter(miniatura) if miniatura else None
+        if entrada is not None:
+            return responder_entrada(entrada, cabecalhos, "imagens", "image/jpeg")
+
+        # Miniatura ainda não gerada (ou Pillow ausente): redireciona para a imagem original,
+        # sem deixar o navegador guardar esse redirecionamento
+        original = caminho_seguro(image_folder, nome)
+        if original is not None and os.path.isfile(original):
+            return Resposta(307, None, b"", [("Location", "/" + quote(nome)), ("Cache-Control", "no-store")])
+        return Resposta(404, "text/html", b"<h1>404 - Imagem nao encontrada</h1>")
+
+    # =============================================
+    # CASO O USUÁRIO PEÇA UM ARQUIVO CSS (estilo)
+    # =============================================
+    elif rota == "css":
+        # Constrói o caminho completo do CSS solicitado (None se ele sair da pasta do site)
+        file_path = caminho_seguro(base_folder, path)
+
+        # Busca o CSS no cache; None significa que o arquivo não existe
+        entrada = cache.obter(file_path) if file_path else None
+        if entrada is not None:
+            return responder_entrada(entrada, cabecalhos, "css", "text/css")
+
+        # Caso o CSS solicitado não exista, envia erro 404
+        return Resposta(404, "text/html", "<h1>404 - Arquivo CSS não encontrado</h1>".encode())
+
+    # ===============================================
+    # CASO O USUÁRIO PEÇA UMA IMAGEM ESPECÍFICA
+    # ===============================================
+
+    # Constrói o caminho completo da imagem solicitada (ex: "/img1.jpg" vira ".../imagens/img1.jpg");
+    # None se o caminho tentar sair da pasta de imagens
+    image_path = caminho_seguro(image_folder, path)
+
+    # Busca a imagem no cache: um os.stat() confirma que ela existe e não mudou;
+    # o conteúdo só é lido do disco na primeira vez (ou depois de alterado).
+    # Imagens grandes não ficam na memória e seguem pelo caminho do sendfile.
+    entrada = cache.obter(image_path) if image_path else None
+    if entrada is not None:
+        # Envia os dados da imagem (ou 304) com o Content-type e os cabeçalhos pré-calculados
+        return responder_entrada(entrada, cabecalhos, "imagens")
+
+    # ====================================================
+    # CASO O USUÁRIO PEÇA UM ARQUIVO QUE NÃO FOI ENCONTRADO
+    # ====================================================
+    return Resposta(404, "text/html", b"<h1>404 - Imagem nao encontrada</h1>")
+
+
+# Métricas dos outros módulos (cache, galeria e miniaturas) no formato (nome, tipo, ajuda, valor)
+def metricas_adicionais():
+    estatisticas = cache.estatisticas()
+    consultas = estatisticas["acertos"] + estatisticas["falhas"]
+    adicionais = [
+        ("cache_acertos_total", "counter", "Arquivos servidos direto da memória.", estatisticas["acertos"]),
+        ("cache_falhas_total", "counter", "Arquivos que precisaram ser lidos do disco.", estatisticas["falhas"]),
+        ("cache_despejos_total", "counter", "Entradas removidas para respeitar o limite de memória.",
+         estatisticas["despejos"]),
+        ("cache_invalidacoes_total", "counter", "Entradas descartadas porque o arquivo mudou ou sumiu.",
+         estatisticas["invalidacoes"]),
+        ("cache_compressoes_total", "counter", "Versões comprimidas geradas.", estatisticas["compressoes"]),
+        ("cache_taxa_acertos", "gauge", "Fração das consultas ao cache atendidas da memória.",
+         f"{estatisticas['acertos'] / consultas if consultas else 0:.4f}"),
+        ("cache_itens", "gauge", "Arquivos no cache.", estatisticas["itens"]),
+        ("cache_bytes_usados", "gauge", "Bytes ocupados pelo cache.", estatisticas["bytes_usados"]),
+        ("cache_limite_bytes", "gauge", "Limite de bytes do cache.", estatisticas["limite_bytes"]),
+        ("galeria_reconstrucoes_total", "counter", "Vezes que a página da galeria foi gerada.",
+         galeria.reconstrucoes),
+    ]
+    if miniaturas.disponivel:
+        estatisticas = miniaturas.estatisticas()
+        adicionais += [
+            ("miniaturas_prontas", "gauge", "Miniaturas prontas no cache em disco.", estatisticas["prontas"]),
+            ("miniaturas_pendentes", "gauge", "Miniaturas sendo geradas.", estatisticas["pendentes"]),
+        ]
+    return adicionais
 
-            # Envia cabeçalhos HTTP informando que o conteúdo é uma imagem
-            self.send_response(200)
-            self.send_header("Content-type", "image/jpeg")
-            self.end_headers()
+# ======================================================
+# CLASSE RESPONSÁVEL POR LIDAR COM CADA REQUISIÇÃO HTTP (motor "threads")
+# ======================================================
 
-            # Envia os dados da imagem para o navegador
-            self.wfile.write(data)
+class MeuServidor(BaseHTTPRequestHandler):
 
-            # Exibe no terminal do servidor informações úteis (debug/log)
-            print(f"📤 Servido '{image_name}' em {duration:.3f}s — Velocidade: {speed:.2f} KB/s")
+    # Fala HTTP/1.1: a conexão continua aberta entre requisições (keep-alive),
+    # desde que toda resposta informe o Content-Length
+    protocol_version = "HTTP/1.1"
+
+    # Tempo máximo de espera por dados do cliente; libera o worker de conexões ociosas
+    timeout = keepalive_timeout
+
+    # Cabeçalhos e corpo são escritos separadamente: sem TCP_NODELAY o corpo de respostas pequenas
+    # fica retido pelo algoritmo de Nagle até o ACK atrasado do cliente (~40 ms)
+    disable_nagle_algorithm = True
+
+    # Antes de ler cada requisição espera por ela no motor, que pode encerrar esta conexão se ela
+    # estiver ociosa enquanto uma conexão nova aguarda um worker livre
+    def handle_one_request(self):
+        try:
+            self.server.esperar_requisicao(self)
+        except (TimeoutError, ConnectionError):
+            # Keep-alive expirou sem nova requisição, ou o cliente desistiu da conexão ociosa
+            self.close_connection = True
+            return
+        # Início da requisição, para a latência dos erros respondidos pelo próprio BaseHTTPRequestHandler
+        self.inicio = time.perf_counter()
+        super().handle_one_request()
 
-        # ====================================================
-        # CASO O USUÁRIO PEÇA UM ARQUIVO QUE NÃO FOI ENCONTRADO
-        # ====================================================
-        else:
-            self.send_response(404)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
-            self.wfile.write(b"<h1>404 - Imagem nao encontrada</h1>")
+    # Método executado automaticamente quando o servidor recebe uma requisição HTTP do tipo GET
+    def do_GET(self):
+        self.atender(com_corpo=True)
+
+    # HEAD: mesmos cabeçalhos do GET, sem o corpo (usado pelo cliente para descobrir o tamanho)
+    def do_HEAD(self):
+        self.atender(com_corpo=False)
+
+    # Monta e envia a resposta, registrando nas métricas o tempo total (inclusive a escrita no socket)
+    def atender(self, com_corpo):
+        inicio = time.perf_counter()
+        resposta = montar_resposta(self.path, self.headers)
+        status, enviados = self.enviar(resposta, com_corpo)
+        if self.server.metricas is not None:
+            self.server.metricas.resposta(self.client_address[0], self.command, self.path, resposta.rota, status,
+                                          enviados, time.perf_counter() - inicio)
+
+    # Escreve a Resposta no socket: linha de status, cabeçalhos e corpo.
+    # Pedaços em memória vão pelo wfile; trechos de arquivo vão direto do disco com sendfile,
+    # com memória constante por requisição. Retorna (status enviado, bytes de corpo enviados).
+    def enviar(self, resposta, com_corpo=True):
+        partes = partes_do_corpo(resposta.corpo) if com_corpo else []
+        enviados = 0
+        with ExitStack() as pilha:
+            # Os arquivos são abertos antes dos cabeçalhos: se algum sumiu depois do stat, ainda dá para responder 404
+            try:
+                arquivos = abrir_arquivos(partes, pilha)
+            except OSError:
+                return self.enviar(Resposta(404, "text/html", b"<h1>404 - Imagem nao encontrada</h1>"), com_corpo)
+
+            self.enviar_cabecalhos(resposta)
+            for parte in partes:
+                if isinstance(parte, TrechoArquivo):
+                    enviado = enviar_arquivo(self.connection, arquivos[parte.caminho], parte.inicio, parte.tamanho)
+                    enviados += enviado
+                    # Arquivo encolheu durante o envio: o Content-Length não foi cumprido, fecha a conexão
+                    if enviado != parte.tamanho:
+                        self.close_connection = True
+                        break
+                else:
+                    self.wfile.write(parte)
+                    enviados += len(parte)
+        return resposta.status, enviados
+
+    # Requisições recusadas pelo BaseHTTPRequestHandler antes de chegar a do_GET (malformadas, cabeçalhos
+    # grandes demais, método não suportado) também entram nas métricas, como no motor asyncio
+    def send_error(self, code, message=None, explain=None):
+        super().send_error(code, message, explain)
+        if self.server.metricas is not None:
+            metodo, caminho = getattr(self, "command", None) or "-", getattr(self, "path", "-")
+            self.server.metricas.resposta(self.client_address[0], metodo, caminho, motores.ROTA_RECUSADA, code, 0,
+                                          time.perf_counter() - self.inicio)
+
+    # O registro de cada requisição fica a cargo das métricas e do log de acesso (--log-acesso):
+    # escrever uma linha no terminal por requisição trava os workers sob carga
+    def log_request(self, code="-", size="-"):
+        pass
+
+    def enviar_cabecalhos(self, resposta):
+        self.send_response(resposta.status)
+        if resposta.tipo is not None:
+            self.send_header("Content-type", resposta.tipo)
+        # Uma resposta 304 não tem corpo, e o Content-Length nela descreveria o conteúdo original
+        if resposta.status != 304:
+            self.send_header("Content-Length", str(tamanho_corpo(resposta.corpo)))
+        for nome, valor in resposta.cabecalhos:
+            self.send_header(nome, valor)
+        # Avisa o cliente quando a conexão será fechada após esta resposta
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
 
 # ===================================================
 # INICIALIZAÇÃO DO SERVIDOR: COMEÇA A ESCUTAR CONEXÕES
 # ===================================================
 
-# Cria uma instância do servidor HTTP, indicando o IP, porta e a classe que lida com as requisições
-server = HTTPServer((host, port), MeuServidor)
-
-# Mensagem no terminal dizendo que o servidor está no ar
-print(f"Servidor rodando em {host}:{port}")
-
-# Inicia o servidor em modo contínuo, aguardando conexões para sempre
-server.serve_forever()
+# Cria o servidor com o motor escolhido ("threads" ou "asyncio")
+def criar_servidor(endereco, modo, max_workers, max_conexoes, keepalive_timeout):
+    # Gera as miniaturas que faltam em segundo plano; a galeria passa a apontar para /thumb/
+    # e avisa o gerador sempre que a pasta de imagens mudar
+    if usar_miniaturas and miniaturas.disponivel:
+        galeria.usar_miniaturas = True
+        galeria.ao_mudar = miniaturas.sincronizar
+        miniaturas.iniciar(processos_miniaturas)
+
+    # Gera a página da galeria agora e passa a acompanhar mudanças na pasta de imagens
+    galeria.monitorar(intervalo_galeria)
+
+    # Log de acesso gravado por uma thread própria, fora do caminho das requisições
+    if log_acesso and metricas.log is None:
+        metricas.log = LogAcesso(log_acesso)
+
+    if modo == "asyncio":
+        servidor = motores.ServidorAsyncio(endereco, montar_resposta, max_workers, max_conexoes, keepalive_timeout)
+    else:
+        # No motor de threads o timeout de keep-alive é aplicado ao socket de cada conexão
+        MeuServidor.timeout = keepalive_timeout
+        servidor = motores.ServidorPoolThreads(endereco, MeuServidor, max_workers, max_conexoes)
+    servidor.metricas = metricas
+    return servidor
+
+
+def main():
+    global intervalo_galeria, usar_miniaturas, processos_miniaturas, log_acesso
+
+    parser = argparse.ArgumentParser(description="Servidor HTTP da galeria de imagens")
+    parser.add_argument("--host", default=host, help="endereço IP de escuta")
+    parser.add_argument("--porta", type=int, default=port, help="porta de escuta (0 = porta livre qualquer)")
+    parser.add_argument("--modo", choices=["threads", "asyncio"], default=modo,
+                        help="motor de atendimento das conexões")
+    parser.add_argument("--workers", type=int, default=max_workers,
+                        help="número máximo de threads atendendo requisições")
+    parser.add_argument("--max-conexoes", type=int, default=max_conexoes,
+                        help="número máximo de conexões simultâneas (no modo threads, no máximo --workers)")
+    parser.add_argument("--keepalive", type=float, default=keepalive_timeout,
+                        help="segundos que uma conexão ociosa fica aberta")
+    parser.add_argument("--cache-mb", type=float, default=cache_mb,
+                        help="memória máxima (MB) do cache de conteúdo dos arquivos")
+    parser.add_argument("--limite-sendfile-kb", type=float, default=limite_sendfile_kb,
+                        help="arquivos acima deste tamanho (KB) são enviados com sendfile, sem passar pela memória")
+    parser.add_argument("--max-age-imagens", type=int, default=max_age["imagens"],
+                        help="segundos que o navegador pode reutilizar as imagens sem revalidar")
+    parser.add_argument("--max-age-css", type=int, default=max_age["css"],
+                        help="segundos que o navegador pode reutilizar o CSS sem revalidar")
+    parser.add_argument("--max-age-index", type=int, default=max_age["index"],
+                        help="segundos que o navegador pode reutilizar a página da galeria sem revalidar")
+    parser.add_argument("--intervalo-galeria", type=float, default=intervalo_galeria,
+                        help="segundos entre as verificações de mudança na pasta de imagens (0 = nunca)")
+    parser.add_argument("--sem-miniaturas", action="store_true",
+                        help="usa as imagens originais na galeria, sem gerar miniaturas")
+    parser.add_argument("--miniaturas-px", type=int, default=miniaturas_px,
+                        help="lado máximo (em pixels) das miniaturas da galeria")
+    parser.add_argument("--processos-miniaturas", type=int, default=processos_miniaturas,
+                        help="processos usados para gerar miniaturas (padrão: um por núcleo)")
+    parser.add_argument("--log-acesso", default=log_acesso, metavar="ARQUIVO",
+                        help="grava uma linha JSON por requisição neste arquivo (\"-\" = terminal)")
+    args = parser.parse_args()
+
+    intervalo_galeria = args.intervalo_galeria
+    usar_miniaturas = not args.sem_miniaturas
+    processos_miniaturas = args.processos_miniaturas
+    log_acesso = args.log_acesso
+    miniaturas.tamanho = args.miniaturas_px
+    max_age["imagens"] = args.max_age_imagens
+    max_age["css"] = args.max_age_css
+    max_age["index"] = args.max_age_index
+
+    cache.limite_bytes = int(args.cache_mb * 1024 * 1024)
+    cache.limite_arquivo = int(args.limite_sendfile_kb * 1024)
+
+    server = criar_servidor((args.host, args.porta), args.modo, args.workers, args.max_conexoes, args.keepalive)
+
+    # Mensagem no terminal dizendo que o servidor está no ar (com a porta real, útil quando --porta 0)
+    print(f"Servidor rodando em {args.host}:{server.server_address[1]} (modo {args.modo})", flush=True)
+
+    # Inicia o servidor em modo contínuo, aguardando conexões até Ctrl+C
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Servidor encerrado.")
+        print(f"📊 Cache: {cache.estatisticas()}")
+    finally:
+        server.server_close()
+        miniaturas.encerrar()
+        if metricas.log is not None:
+            metricas.log.encerrar()
+
+
+if __name__ == "__main__":
+    main()
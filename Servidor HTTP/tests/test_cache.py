@@ -0,0 +1,100 @@
+# Testes do CacheConteudo (cache.py): acertos, invalidação por mtime/tamanho, descarte LRU e
+# arquivos grandes guardados só com os metadados
+import os
+
+import pytest
+
+from cache import CacheConteudo, etag_conteudo
+
+
+def escrever(caminho, dados, mtime_ns=None):
+    caminho.write_bytes(dados)
+    if mtime_ns is not None:
+        os.utime(caminho, ns=(mtime_ns, mtime_ns))
+    return str(caminho)
+
+
+def test_segunda_leitura_vem_da_memoria(tmp_path):
+    cache = CacheConteudo(1024)
+    caminho = escrever(tmp_path / "a.css", b"body {}")
+    primeira = cache.obter(caminho)
+    assert primeira.dados == b"body {}"
+    assert primeira.tipo == "text/css"
+    assert primeira.etag == etag_conteudo(b"body {}")
+    assert cache.obter(caminho) is primeira
+    assert (cache.falhas, cache.acertos) == (1, 1)
+
+
+def test_arquivo_alterado_no_mesmo_tamanho(tmp_path):
+    cache = CacheConteudo(1024)
+    caminho = escrever(tmp_path / "a.txt", b"antes", mtime_ns=1_000_000_000)
+    assert cache.obter(caminho).dados == b"antes"
+    # Mesmo tamanho, outra data de modificação: a entrada antiga não vale mais
+    escrever(tmp_path / "a.txt", b"depoi", mtime_ns=2_000_000_000)
+    entrada = cache.obter(caminho)
+    assert entrada.dados == b"depoi"
+    assert cache.invalidacoes == 1
+    assert cache.bytes_usados == 5
+
+
+def test_arquivo_alterado_com_mesma_data(tmp_path):
+    cache = CacheConteudo(1024)
+    caminho = escrever(tmp_path / "a.txt", b"curto", mtime_ns=1_000_000_000)
+    cache.obter(caminho)
+    escrever(tmp_path / "a.txt", b"mais comprido", mtime_ns=1_000_000_000)
+    assert cache.obter(caminho).dados == b"mais comprido"
+
+
+def test_arquivo_apagado_sai_do_cache(tmp_path):
+    cache = CacheConteudo(1024)
+    caminho = escrever(tmp_path / "a.txt", b"x" * 10)
+    cache.obter(caminho)
+    os.remove(caminho)
+    assert cache.obter(caminho) is None
+    assert cache.estatisticas()["itens"] == 0
+    assert cache.bytes_usados == 0
+
+
+def test_pasta_nao_e_arquivo(tmp_path):
+    assert CacheConteudo(1024).obter(str(tmp_path)) is None
+
+
+def test_descarte_do_menos_usado(tmp_path):
+    cache = CacheConteudo(250)
+    a = escrever(tmp_path / "a", b"a" * 100)
+    b = escrever(tmp_path / "b", b"b" * 100)
+    c = escrever(tmp_path / "c", b"c" * 100)
+    cache.obter(a)
+    cache.obter(b)
+    cache.obter(a)                      # "a" passa a ser o usado mais recentemente
+    cache.obter(c)                      # não cabe: sai "b"
+    assert cache.despejos == 1
+    assert cache.bytes_usados == 200
+    acertos = cache.acertos
+    cache.obter(a)
+    cache.obter(c)
+    assert cache.acertos == acertos + 2
+    cache.obter(b)
+    assert cache.falhas == 4
+
+
+def test_arquivo_maior_que_o_orcamento_nao_e_guardado(tmp_path):
+    cache = CacheConteudo(10)
+    caminho = escrever(tmp_path / "grande", b"g" * 100)
+    assert cache.obter(caminho).dados == b"g" * 100
+    assert cache.estatisticas()["itens"] == 0
+    assert cache.bytes_usados == 0
+
+
+@pytest.mark.parametrize("tamanho", [0, 1, 64 * 1024, 200_000])
+def test_arquivo_grande_so_com_metadados(tmp_path, tamanho):
+    # Acima de limite_arquivo o conteúdo fica no disco (sendfile), mas o ETag é o mesmo
+    dados = bytes(range(256)) * (tamanho // 256) + b"z" * (tamanho % 256)
+    cache = CacheConteudo(1024 * 1024, limite_arquivo=0 if tamanho else -1)
+    entrada = cache.obter(escrever(tmp_path / "video.bin", dados))
+    assert entrada.dados is None
+    assert entrada.tamanho == tamanho
+    assert entrada.etag == etag_conteudo(dados)
+    # Só metadados: não ocupa o orçamento, mas continua no cache
+    assert cache.bytes_usados == 0
+    assert cache.obter(entrada.caminho) is entrada
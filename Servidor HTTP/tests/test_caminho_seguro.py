@@ -0,0 +1,65 @@
+# Testes de servidor.caminho_seguro: o caminho pedido (já decodificado) não pode sair da pasta servida
+import os
+
+import pytest
+
+from servidor import caminho_seguro
+
+
+@pytest.fixture
+def raiz(tmp_path):
+    pasta = tmp_path / "imagens"
+    pasta.mkdir()
+    (pasta / "img1.jpg").write_bytes(b"jpg")
+    (tmp_path / "segredo.txt").write_text("não sair da pasta")
+    return str(pasta)
+
+
+def test_arquivo_dentro_da_pasta(raiz):
+    esperado = os.path.realpath(os.path.join(raiz, "img1.jpg"))
+    assert caminho_seguro(raiz, "img1.jpg") == esperado
+    # A barra inicial do caminho da URL é ignorada
+    assert caminho_seguro(raiz, "/img1.jpg") == esperado
+
+
+def test_arquivo_inexistente_continua_dentro(raiz):
+    # Quem chama confere se o arquivo existe (404); aqui só importa que não sai da pasta
+    assert caminho_seguro(raiz, "nao_existe.jpg") == os.path.realpath(os.path.join(raiz, "nao_existe.jpg"))
+
+
+@pytest.mark.parametrize("nome", [
+    "../segredo.txt",
+    "/../segredo.txt",
+    "img1.jpg/../../segredo.txt",
+    "/../../../../etc/passwd",
+    "..",
+])
+def test_recusa_subir_de_pasta(raiz, nome):
+    assert caminho_seguro(raiz, nome) is None
+
+
+def test_caminho_absoluto_nao_escapa(raiz):
+    # "//etc/passwd" viraria um caminho absoluto no os.path.join sem o lstrip("/")
+    assert caminho_seguro(raiz, "//etc/passwd") == os.path.realpath(os.path.join(raiz, "etc/passwd"))
+
+
+def test_pasta_vizinha_com_mesmo_prefixo(raiz, tmp_path):
+    # "imagens2" começa com "imagens": uma comparação por prefixo de texto deixaria passar
+    vizinha = tmp_path / "imagens2"
+    vizinha.mkdir()
+    (vizinha / "x.jpg").write_bytes(b"x")
+    assert caminho_seguro(raiz, "../imagens2/x.jpg") is None
+
+
+@pytest.mark.parametrize("nome", ["img1.jpg\0.png", "..\\segredo.txt", "sub\\img1.jpg"])
+def test_recusa_nul_e_barra_invertida(raiz, nome):
+    assert caminho_seguro(raiz, nome) is None
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sem links simbólicos")
+def test_link_simbolico_para_fora(raiz, tmp_path):
+    try:
+        os.symlink(tmp_path / "segredo.txt", os.path.join(raiz, "atalho.jpg"))
+    except OSError:
+        pytest.skip("sem permissão para criar links simbólicos")
+    assert caminho_seguro(raiz, "atalho.jpg") is None
@@ -0,0 +1,28 @@
+# Testes de client.caminho_destino: os nomes vindos da galeria não podem gravar fora de --destino
+import os
+
+import pytest
+
+# client.py usa o requests (pip install requests)
+pytest.importorskip("requests")
+
+from client import caminho_destino
+
+
+def test_nome_simples(tmp_path):
+    assert caminho_destino(str(tmp_path), "img1.jpg") == os.path.join(os.path.realpath(tmp_path), "img1.jpg")
+
+
+@pytest.mark.parametrize("nome", ["../img1.jpg", "../../etc/passwd", "/etc/passwd", "fotos/../../x.jpg", ".", ""])
+def test_nome_fora_da_pasta(tmp_path, nome):
+    with pytest.raises(ValueError):
+        caminho_destino(str(tmp_path / "destino"), nome)
+
+
+# Um link simbólico dentro da pasta que aponta para fora também é recusado
+def test_link_para_fora(tmp_path):
+    pasta = tmp_path / "destino"
+    pasta.mkdir()
+    os.symlink(tmp_path, pasta / "atalho")
+    with pytest.raises(ValueError):
+        caminho_destino(str(pasta), "atalho/img1.jpg")
@@ -0,0 +1,100 @@
+# Testes da compressão das respostas (compressao.py): negociação do Accept-Encoding, ida e volta
+# de cada codificação e as versões comprimidas guardadas no cache
+import gzip
+
+import pytest
+
+import compressao
+from cache import CacheConteudo
+from compressao import comprimir, comprimivel, etag_variante, negociar
+
+TODAS = ["br", "zstd", "gzip"]
+
+
+@pytest.mark.parametrize("accept_encoding, esperado", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("x-gzip", "gzip"),                         # nome antigo do gzip
+    ("gzip, deflate, br", "br"),                # empate: vale a preferência do servidor
+    ("gzip, br;q=0.9", "gzip"),                 # maior peso vence
+    ("br;q=0, gzip", "gzip"),                   # peso 0 = recusado
+    ("*", "br"),
+    ("*;q=0.5, zstd", "zstd"),
+    ("*, br;q=0", "zstd"),
+    ("gzip;q=abc, zstd;q=0.1", "zstd"),         # peso inválido conta como 0
+    ("gzip ; q=0.8 , zstd ; q=0.9", "zstd"),
+])
+def test_negociar(accept_encoding, esperado):
+    assert negociar(accept_encoding, TODAS) == esperado
+
+
+def test_negociar_so_com_o_que_esta_disponivel():
+    assert negociar("br, zstd, gzip", ["gzip"]) == "gzip"
+    assert negociar("br", ["gzip"]) is None
+
+
+@pytest.mark.parametrize("tipo, esperado", [
+    ("text/html", True),
+    ("text/css; charset=utf-8", True),
+    ("application/json", True),
+    ("image/svg+xml", True),
+    ("image/jpeg", False),
+    ("application/octet-stream", False),
+    (None, False),
+])
+def test_comprimivel(tipo, esperado):
+    assert comprimivel(tipo) is esperado
+
+
+def descomprimir(dados, codificacao):
+    if codificacao == "gzip":
+        return gzip.decompress(dados)
+    if codificacao == "br":
+        return compressao.brotli.decompress(dados)
+    return compressao.zstandard.ZstdDecompressor().decompress(dados)
+
+
+@pytest.mark.parametrize("codificacao", compressao.CODIFICACOES)
+@pytest.mark.parametrize("dados", [b"", b"a", "ação çé\n".encode("utf-8") * 500, bytes(range(256)) * 40])
+def test_ida_e_volta(codificacao, dados):
+    assert descomprimir(comprimir(dados, codificacao), codificacao) == dados
+
+
+def test_gzip_deterministico():
+    # mtime=0: o mesmo conteúdo gera sempre os mesmos bytes (e o mesmo ETag)
+    assert comprimir(b"x" * 1000, "gzip") == comprimir(b"x" * 1000, "gzip")
+
+
+def test_codificacao_desconhecida():
+    with pytest.raises(ValueError):
+        comprimir(b"x", "deflate")
+
+
+def test_etag_da_variante():
+    assert etag_variante('"abc"', "gzip") == '"abc-gzip"'
+
+
+def test_variante_guardada_no_cache(tmp_path):
+    caminho = tmp_path / "style.css"
+    caminho.write_bytes(b"body { color: red; }\n" * 200)
+    cache = CacheConteudo(1024 * 1024)
+    entrada = cache.obter(str(caminho))
+    dados, etag = cache.variante(entrada, "gzip")
+    assert gzip.decompress(dados) == entrada.dados
+    assert etag == etag_variante(entrada.etag, "gzip")
+    # Gerada uma única vez e contada no orçamento do cache
+    assert cache.variante(entrada, "gzip") == (dados, etag)
+    assert cache.compressoes == 1
+    assert cache.bytes_usados == len(entrada.dados) + len(dados)
+
+
+def test_variante_que_nao_diminui(tmp_path):
+    caminho = tmp_path / "pequeno.css"
+    caminho.write_bytes(b"a{}")
+    cache = CacheConteudo(1024)
+    entrada = cache.obter(str(caminho))
+    assert cache.variante(entrada, "gzip") is None
+    assert cache.bytes_usados == 3
@@ -0,0 +1,59 @@
+# Testes dos dois motores (motores.py) com requisições que nunca chegam a montar_resposta:
+# ambos respondem com o código certo e registram a recusa nas métricas
+import socket
+import threading
+
+import pytest
+
+import motores
+import servidor
+from metricas import Metricas
+
+
+def montar_resposta(caminho, cabecalhos):
+    resposta = servidor.Resposta(200, "text/plain", b"ok")
+    resposta.rota = "teste"
+    return resposta
+
+
+@pytest.fixture(params=["threads", "asyncio"])
+def motor(request):
+    if request.param == "asyncio":
+        instancia = motores.ServidorAsyncio(("127.0.0.1", 0), montar_resposta, 2, 10, 5)
+    else:
+        instancia = motores.ServidorPoolThreads(("127.0.0.1", 0), servidor.MeuServidor, 2, 10)
+    instancia.metricas = Metricas()
+    thread = threading.Thread(target=instancia.serve_forever, daemon=True)
+    thread.start()
+    yield instancia
+    instancia.shutdown()
+    thread.join(5)
+    instancia.server_close()
+
+
+# Envia a requisição e lê até o servidor fechar a conexão (depois de registrar a resposta)
+def enviar(motor, bruto):
+    with socket.create_connection(motor.server_address[:2], timeout=5) as conexao:
+        conexao.sendall(bruto)
+        resposta = b""
+        while True:
+            parte = conexao.recv(4096)
+            if not parte:
+                break
+            resposta += parte
+    return int(resposta.split(b" ")[1])
+
+
+def recusadas(motor):
+    texto = motor.metricas.exportar().decode("utf-8")
+    return [linha for linha in texto.splitlines() if linha.startswith('http_requisicoes_total{rota="recusada"')]
+
+
+@pytest.mark.parametrize("bruto, status", [
+    (b"GET / x HTTP/1.1\r\n\r\n", 400),                                          # Linha de requisição malformada
+    (b"GET / HTTP/1.1\r\n" + b"X-A: 1\r\n" * 150 + b"\r\n", 431),                # Cabeçalhos demais
+    (b"POST / HTTP/1.1\r\nContent-Length: 0\r\n\r\n", 501),                     # Método não suportado
+])
+def test_requisicao_recusada(motor, bruto, status):
+    assert enviar(motor, bruto) == status
+    assert recusadas(motor) == [f'http_requisicoes_total{{rota="recusada",status="{status}"}} 1']
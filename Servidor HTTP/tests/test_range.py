@@ -0,0 +1,84 @@
+# Testes dos downloads parciais: interpretar_range (cabeçalho Range) e if_range_valido (If-Range)
+from types import SimpleNamespace
+
+import pytest
+
+import servidor
+from servidor import if_range_valido, interpretar_range
+
+TAMANHO = 1000
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-500", [(500, 999)]),
+    ("bytes=-2000", [(0, 999)]),                # sufixo maior que o arquivo: o arquivo inteiro
+    ("bytes=900-5000", [(900, 999)]),           # fim além do arquivo é cortado
+    ("bytes=999-999", [(999, 999)]),
+    ("Bytes=0-0", [(0, 0)]),                    # a unidade não diferencia maiúsculas
+    ("bytes= 0-1 , 3-4", [(0, 1), (3, 4)]),
+])
+def test_intervalos_validos(valor, esperado):
+    assert interpretar_range(valor, TAMANHO) == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("bytes=0-10,5-20,21-30,50-60", [(0, 30), (50, 60)]),   # sobrepostos e vizinhos são unidos
+    ("bytes=50-60,0-10", [(0, 10), (50, 60)]),             # saem em ordem
+    ("bytes=0-,-10", [(0, 999)]),
+    ("bytes=1000-,0-1", [(0, 1)]),                         # o intervalo impossível é ignorado
+])
+def test_varios_intervalos(valor, esperado):
+    assert interpretar_range(valor, TAMANHO) == esperado
+
+
+@pytest.mark.parametrize("valor, tamanho", [
+    ("bytes=1000-", TAMANHO),
+    ("bytes=5000-6000", TAMANHO),
+    ("bytes=-0", TAMANHO),
+    ("bytes=0-", 0),
+    ("bytes=-5", 0),
+])
+def test_nada_a_atender_e_416(valor, tamanho):
+    assert interpretar_range(valor, tamanho) == []
+
+
+@pytest.mark.parametrize("valor", [
+    "items=0-1",
+    "bytes",
+    "bytes=",
+    "bytes=abc",
+    "bytes=1",
+    "bytes=5-1",
+    "bytes=--1",
+    "bytes=0-1;x",
+    "bytes=0-1,,2-3",
+    "bytes=-1-2",
+])
+def test_cabecalho_invalido_e_ignorado(valor):
+    assert interpretar_range(valor, TAMANHO) is None
+
+
+def test_limite_de_intervalos():
+    intervalos = ",".join(f"{i * 10}-{i * 10}" for i in range(servidor.max_intervalos))
+    assert len(interpretar_range(f"bytes={intervalos}", TAMANHO)) == servidor.max_intervalos
+    # Um a mais é tratado como abuso: resposta 200 com o arquivo inteiro
+    assert interpretar_range(f"bytes={intervalos},999-999", TAMANHO) is None
+
+
+ENTRADA = SimpleNamespace(etag='"abc123"', last_modified="Wed, 21 Oct 2015 07:28:00 GMT")
+
+
+@pytest.mark.parametrize("cabecalhos, valido", [
+    ({}, True),
+    ({"If-Range": '"abc123"'}, True),
+    ({"If-Range": ' "abc123" '}, True),
+    ({"If-Range": '"outro"'}, False),
+    ({"If-Range": 'W/"abc123"'}, False),        # ETags fracas nunca valem para If-Range
+    ({"If-Range": "Wed, 21 Oct 2015 07:28:00 GMT"}, True),
+    ({"If-Range": "Wed, 21 Oct 2015 07:28:01 GMT"}, False),
+    ({"If-Range": "data inválida"}, False),
+])
+def test_if_range(cabecalhos, valido):
+    assert if_range_valido(cabecalhos, ENTRADA) is valido
@@ -1,9 +1,19 @@
-import base64
-import time
+import argparse
+import os
+import tempfile  # Arquivos grandes são enviados em blocos a partir de um arquivo temporário
 import threading
+import time
 import uuid  # Para gerar client_id único
+from concurrent.futures import TimeoutError as TempoEsgotado
+
+import compressao  # Compressão opcional das mensagens (zlib, zstd)
+import protocolo  # Formato das mensagens (binário ou o antigo "nome;base64;client_id")
+import tarefas  # Uploads assíncronos acompanhados por Server-Sent Events
+import transferencia  # Envio e recebimento de arquivos grandes em blocos
+import transformacoes  # Transformações disponíveis no servidor (lista exibida na página)
+from correlacao import Correlacionador, Lotado  # Associa cada resposta ao upload que a pediu
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for
 import paho.mqtt.client as mqtt
 
 # ==================================================================
@@ -11,6 +21,19 @@ import paho.mqtt.client as mqtt
 # ==================================================================
 BROKER = "26.93.244.10"       # Endereço IP do broker MQTT
 PORT = 1883                    # Porta padrão do broker MQTT
+LEGADO = False                 # True: envia no formato antigo "nome;base64;client_id" (servidores não atualizados)
+MAX_PENDENTES = 32             # Uploads aguardando resposta ao mesmo tempo (acima disso: 503)
+TEMPO_RESPOSTA = 10            # Segundos de espera pela resposta do servidor MQTT (depois: 504)
+TENTATIVAS_RESPOSTA = 5        # Pedidos de reenvio dos blocos da resposta que não chegaram
+ESPERA_EVENTOS = 15            # Segundos sem eventos até mandar um comentário (mantém a conexão SSE aberta)
+COMPRESSAO = None              # Codec das mensagens ("zlib", "zstd"; None = sem compressão, ver compressao.py)
+
+# Texto exibido para cada etapa avisada pelo servidor MQTT (mensagens ANDAMENTO, ver servidor.py)
+ETAPAS_SERVIDOR = {
+    "cache": "consultando o cache",
+    "transformacao": "transformando o arquivo",
+    "envio": "enviando a resposta",
+}
 
 # Gera um identificador único para cada instância do cliente web,
 # facilitando a comunicação privada entre servidor e cliente.
@@ -28,9 +51,12 @@ app = Flask(__name__)
 # Cria instância do cliente MQTT com ID único
 mqtt_client = mqtt.Client(client_id=client_id)
 
-# Dicionário global para armazenar resposta recebida pelo MQTT
-# Este objeto será atualizado pelo callback on_message.
-response_data = {}
+# Uploads aguardando resposta, cada um com o seu ID (metadados["id"], devolvido pelo servidor).
+# O callback on_message entrega cada resposta ao upload certo, mesmo com vários ao mesmo tempo.
+pedidos = Correlacionador(MAX_PENDENTES)
+
+# Uploads em blocos em andamento (transferencia -> transferencia.Envio), para repassar as confirmações
+envios = {}
 
 # ==================================================================
 # Callbacks do MQTT
@@ -54,25 +80,92 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """
     Chamado quando uma mensagem é recebida em qualquer tópico subscrito.
-    Processa o payload que contém "<filename>;<base64_content>".
+    Processa o payload no formato binário de protocolo.py (ou o antigo "<filename>;<base64_content>").
 
     :param msg.topic: tópico que recebeu a mensagem
     :param msg.payload: conteúdo da mensagem em bytes
     """
     print(f"📩 Mensagem recebida no tópico {msg.topic}")
     try:
-        # Separa nome do arquivo e conteúdo codificado em base64
-        filename, b64 = msg.payload.decode().split(";", 1)
-        # Decodifica o conteúdo de volta para texto
-        content = base64.b64decode(b64).decode()
-        # Atualiza o dicionário global para sinalizar recebimento
-        response_data["filename"] = filename
-        response_data["content"] = content
-        response_data["received"] = True
+        # Separa nome do arquivo e conteúdo
+        resposta = protocolo.decodificar(msg.payload)
+        if resposta.tipo == protocolo.TIPO_ANDAMENTO:
+            repassar_andamento(resposta)
+            return
+        # Confirmações do servidor para um arquivo que estamos enviando em blocos
+        envio = envios.get(resposta.meta.get("transferencia"))
+        if envio is not None and not envio.completa:
+            envio.tratar(resposta)
+            return
+        if resposta.tipo in protocolo.TIPOS_TRANSFERENCIA:
+            receber_bloco(resposta)
+            return
+        # Respostas do formato antigo não têm ID: o upload foi registrado com o nome do arquivo enviado
+        ident = resposta.meta.get("id") or resposta.nome[len(transformacoes.obter().prefixo):]
+        if resposta.tipo == protocolo.TIPO_ERRO:
+            # O servidor não conseguiu processar o arquivo
+            pedidos.falhar(ident, RuntimeError(resposta.meta.get("erro", "Erro no servidor MQTT")))
+        elif not pedidos.resolver(ident, resposta):
+            print(f"⚠️ Resposta sem upload aguardando (tempo esgotado?): {resposta.nome}")
     except Exception as e:
         # Em caso de erro, imprime no terminal para depuração
         print(f"❌ Erro ao processar mensagem: {e}")
 
+
+def repassar_andamento(resposta):
+    """
+    Repassa ao navegador um aviso de andamento do servidor MQTT (pedidos com metadados["andamento"]):
+    a mudança de etapa vira um evento "etapa" e os bytes já processados um "progresso" da fase "servidor".
+
+    :param resposta: protocolo.Quadro do tipo ANDAMENTO
+    """
+    tarefa = tarefas.obter(resposta.meta.get("id"))
+    if tarefa is None:
+        return
+    etapa = resposta.meta.get("etapa")
+    if "feito" in resposta.meta:
+        tarefa.publicar("progresso", fase="servidor", feito=resposta.meta["feito"], total=resposta.meta.get("total"))
+    else:
+        tarefa.etapa("processando", f"Servidor MQTT: {ETAPAS_SERVIDOR.get(etapa, etapa)}")
+
+
+def receber_bloco(resposta):
+    """
+    Trata uma mensagem da resposta em blocos (INICIO, BLOCO..., FIM) de um upload assíncrono.
+    Cada bloco é repassado ao navegador assim que os anteriores tiverem chegado; no FIM, os blocos
+    que não chegaram são pedidos de novo ao servidor.
+
+    :param resposta: protocolo.Quadro recebido
+    """
+    ident = resposta.meta.get("id")
+    tarefa = tarefas.obter(ident)
+    if tarefa is None or pedidos.obter(ident) is None:
+        return
+
+    if resposta.tipo == protocolo.TIPO_INICIO:
+        tarefa.iniciar_blocos(transferencia.quantidade_blocos(resposta.meta["tamanho"],
+                                                              resposta.meta["tamanho_bloco"]))
+        tarefa.etapa("recebendo", f"Recebendo {resposta.nome} ({resposta.meta['tamanho']} bytes)")
+    elif resposta.tipo == protocolo.TIPO_BLOCO:
+        resposta.limite = transferencia.TAMANHO_BLOCO_MAXIMO
+        tarefa.bloco(resposta.meta["indice"], resposta.conteudo)
+    elif resposta.tipo == protocolo.TIPO_FIM:
+        faltantes = tarefa.faltantes()
+        if faltantes is None:
+            pedidos.falhar(ident, RuntimeError("O início da resposta não chegou. Envie o arquivo de novo."))
+        elif faltantes and tarefa.tentativas < TENTATIVAS_RESPOSTA:
+            # Pede ao servidor só os blocos que não chegaram (no modo cluster, à instância que respondeu)
+            tarefa.tentativas += 1
+            instancia = resposta.meta.get("instancia")
+            topico = transferencia.topico_direto(TOPIC_UPLOAD, instancia) if instancia else TOPIC_UPLOAD
+            mqtt_client.publish(topico, protocolo.codificar(
+                resposta.nome, tarefa.recebidos(), protocolo.TIPO_FALTANTES,
+                {"transferencia": resposta.meta["transferencia"]}), qos=1)
+        elif faltantes:
+            pedidos.falhar(ident, RuntimeError(f"Resposta incompleta: {len(faltantes)} blocos não chegaram"))
+        else:
+            pedidos.resolver(ident, resposta)
+
 # Atribui as funções de callback ao cliente MQTT
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
@@ -87,55 +180,260 @@ mqtt_client.loop_start()
 def index():
     """
     Rota principal que renderiza a página HTML.
-    Passa o client_id para o JavaScript poder referenciar os tópicos.
+    Passa o client_id para o JavaScript poder referenciar os tópicos,
+    e as transformações que o usuário pode escolher.
     """
-    return render_template("index.html", client_id=client_id)
+    return render_template("index.html", client_id=client_id,
+                           transformacoes=list(transformacoes.TRANSFORMACOES), padrao=transformacoes.PADRAO)
 
 @app.route('/upload', methods=['POST'])
 def upload():
     """
     Rota que recebe o arquivo do usuário via POST.
-    Codifica o conteúdo em base64 e publica no tópico de upload.
-    Aguarda a resposta do servidor via MQTT e retorna JSON.
+    Monta a mensagem com protocolo.py e publica no tópico de upload.
+    Aguarda a resposta do servidor via MQTT (sem bloquear os outros uploads) e retorna JSON.
+
+    Com ?modo=eventos, retorna na hora (202) o ID da tarefa; o andamento e o conteúdo
+    transformado chegam aos poucos por /eventos/<tarefa>.
     """
-    # Lê o arquivo enviado pelo formulário
     file = request.files['file']
-    content = file.read().decode()  # Lê e decodifica para string
-    # Codifica o conteúdo em base64 para transmissão segura
-    encoded = base64.b64encode(content.encode()).decode()
-    # Payload: "nome_do_arquivo;base64_conteudo;client_id"
-    payload = f"{file.filename};{encoded};{client_id}"
-
-    # Reinicializa o estado de resposta
-    response_data.clear()
-    response_data["received"] = False
-
-    print(f"📤 Enviando arquivo: {file.filename} para tópico: {TOPIC_UPLOAD}")
-    start_time = time.time()
-    # Publica a mensagem MQTT
-    mqtt_client.publish(TOPIC_UPLOAD, payload)
-
-    # Espera a resposta até timeout (10 segundos)
-    timeout = 10
-    while not response_data.get("received") and time.time() - start_time < timeout:
-        time.sleep(0.1)
-
-    # Se recebeu resposta, calcula duração e retorna JSON
-    if response_data.get("received"):
-        duration = round(time.time() - start_time, 2)
-        print(f"✅ Resposta recebida em {duration} segundos")
-        return jsonify({
-            "filename": response_data["filename"],
-            "content": response_data["content"],
-            "duration": duration
-        })
+    assincrono = request.args.get("modo") == "eventos"
+
+    # Reserva uma vaga entre os uploads pendentes; o formato antigo não leva ID,
+    # então o upload é identificado pelo nome do arquivo
+    try:
+        ident, futuro = pedidos.novo(file.filename if LEGADO else None, espera=0)
+    except Lotado:
+        # Muitos uploads aguardando resposta, retorna 503 (Service Unavailable)
+        return jsonify({"error": "Servidor ocupado, tente novamente em instantes"}), 503, {"Retry-After": "1"}
+    except ValueError:
+        # Formato antigo: já existe um upload deste arquivo aguardando resposta, retorna 409 (Conflict)
+        return jsonify({"error": f"'{file.filename}' já está sendo processado"}), 409
+
+    # Metadados do pedido (formato binário). "tempos": o servidor devolve o tempo de cada etapa
+    # do processamento, repassado ao navegador junto com o tempo total.
+    meta = {"client_id": client_id, "id": ident, "tempos": True}
+    transformacao = request.form.get("transformacao")
+    if transformacao and transformacao != transformacoes.PADRAO:
+        meta["transformacao"] = transformacao
+    if COMPRESSAO:
+        # A resposta vem comprimida mesmo que o upload seja pequeno demais para ir comprimido
+        meta["compressao"] = COMPRESSAO
+
+    if assincrono:
+        return iniciar_tarefa(file, ident, futuro, meta)
+
+    # Lê o arquivo enviado pelo formulário
+    content = file.read()  # Bytes do arquivo (vão sem base64 no formato binário)
+    if LEGADO:
+        # Payload: "nome_do_arquivo;base64_conteudo;client_id"
+        payload = protocolo.codificar_legado(file.filename, content, client_id)
     else:
-        # Em caso de timeout, retorna erro 504 (Gateway Timeout)
+        # Transformação escolhida na página (o servidor recusa nomes desconhecidos)
+        payload = protocolo.codificar(file.filename, content, meta=meta, codec=COMPRESSAO)
+
+    print(f"📤 Enviando arquivo: {file.filename} para tópico: {TOPIC_UPLOAD} (pedido {ident})")
+    # Publica a mensagem MQTT
+    if mqtt_client.publish(TOPIC_UPLOAD, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+        pedidos.cancelar(ident)
+        return jsonify({"error": "Sem conexão com o broker MQTT"}), 502
+
+    # Espera a resposta deste upload: on_message resolve o futuro assim que ela chega
+    try:
+        resposta = futuro.result(timeout=TEMPO_RESPOSTA)
+    except TempoEsgotado:
+        # Em caso de timeout, libera a vaga e retorna erro 504 (Gateway Timeout)
+        pedidos.cancelar(ident)
         return jsonify({"error": "Timeout esperando resposta do servidor MQTT"}), 504
+    except Exception as e:
+        # O servidor respondeu com erro, retorna 502 (Bad Gateway)
+        return jsonify({"error": str(e)}), 502
+
+    duration = round(futuro.duracao, 3)
+    print(f"✅ Resposta recebida em {duration * 1000:.1f} ms (pedido {ident})")
+    try:
+        # Decodifica o conteúdo de volta para texto
+        content = str(resposta.conteudo, "utf-8")
+    except UnicodeDecodeError:
+        return jsonify({"error": "Resposta do servidor não é texto UTF-8"}), 502
+    return jsonify({
+        "filename": resposta.nome,
+        "content": content,
+        "duration": duration,
+        "server_timings": resposta.meta.get("tempos")
+    })
+
+
+@app.route('/eventos/<ident>')
+def eventos(ident):
+    """
+    Fluxo Server-Sent Events de uma tarefa criada por /upload?modo=eventos:
+    etapas, progresso, pedaços do conteúdo transformado e, no final, "fim" ou "erro".
+    Um EventSource que reconectar (cabeçalho Last-Event-ID) recebe só os eventos que perdeu.
+    """
+    tarefa = tarefas.obter(ident)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa desconhecida ou expirada"}), 404
+    try:
+        # Um ID negativo faria eventos[inicio:] repetir o final da lista
+        inicio = max(0, int(request.headers.get("Last-Event-ID", -1)) + 1)
+    except ValueError:
+        inicio = 0
+
+    def fluxo():
+        posicao = inicio
+        while True:
+            novos, terminada = tarefa.ler(posicao, ESPERA_EVENTOS)
+            for tipo, dados in novos:
+                yield tarefas.formatar(posicao, tipo, dados)
+                posicao += 1
+            if terminada:
+                return
+            if not novos:
+                # Comentário SSE: o navegador ignora, mas proxies não fecham a conexão parada
+                yield ": aguardando\n\n"
+
+    return Response(fluxo(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ==================================================================
+# Uploads assíncronos
+# ==================================================================
+def iniciar_tarefa(file, ident, futuro, meta):
+    """
+    Publica o upload sem esperar a resposta e retorna o ID da tarefa (202).
+    Arquivos grandes vão em blocos (transferencia.py) numa thread própria, com o progresso
+    publicado como eventos; os pequenos numa única mensagem, como no modo síncrono.
+
+    :param file: arquivo recebido pelo Flask
+    :param ident: ID do pedido (também o ID da tarefa)
+    :param futuro: Future do pedido, resolvido pelo on_message
+    :param meta: metadados do pedido
+    """
+    tarefa = tarefas.criar(ident)
+    # O servidor avisa cada etapa do processamento no tópico de resposta (repassar_andamento)
+    meta["andamento"] = True
+    file.stream.seek(0, os.SEEK_END)
+    tamanho = file.stream.tell()
+    file.stream.seek(0)
+    tarefa.etapa("recebido", f"{file.filename} recebido pelo app web ({tamanho} bytes)")
+    futuro.add_done_callback(lambda f: concluir_tarefa(tarefa, f))
+    vigiar_tarefa(tarefa)
+
+    if not LEGADO and tamanho > transferencia.LIMITE_MENSAGEM_UNICA:
+        # O Envio lê os blocos do disco conforme a janela anda
+        descritor, caminho = tempfile.mkstemp(suffix=".txt")
+        os.close(descritor)
+        file.save(caminho)
+        threading.Thread(target=enviar_em_blocos, args=(tarefa, caminho, file.filename, meta), daemon=True).start()
+    else:
+        content = file.read()
+        if LEGADO:
+            payload = protocolo.codificar_legado(file.filename, content, client_id)
+        else:
+            payload = protocolo.codificar(file.filename, content, meta=meta, codec=COMPRESSAO)
+        if mqtt_client.publish(TOPIC_UPLOAD, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+            pedidos.falhar(ident, RuntimeError("Sem conexão com o broker MQTT"))
+        else:
+            tarefa.etapa("processando", "Aguardando o servidor MQTT")
+
+    print(f"📤 Tarefa {ident}: {file.filename} ({tamanho} bytes) para tópico: {TOPIC_UPLOAD}")
+    return jsonify({"tarefa": ident, "eventos": url_for("eventos", ident=ident)}), 202
+
+
+def enviar_em_blocos(tarefa, caminho, filename, meta):
+    """
+    Envia um arquivo grande em blocos (roda numa thread própria: o Envio espera as confirmações).
+
+    :param tarefa: tarefas.Tarefa que recebe o progresso
+    :param caminho: arquivo temporário com o upload (apagado no final)
+    :param filename: nome do arquivo enviado pelo usuário
+    :param meta: metadados do pedido
+    """
+    envio = transferencia.Envio(mqtt_client, TOPIC_UPLOAD, caminho, filename,
+                                transferencia.identificador(client_id, caminho), meta=meta, codec=COMPRESSAO)
+    envios[envio.transferencia] = envio
+
+    def progresso(confirmados, total):
+        tarefa.publicar("progresso", fase="envio", feito=confirmados, total=total)
+
+    try:
+        tarefa.etapa("enviando", f"Enviando ao servidor MQTT em {envio.blocos} blocos")
+        envio.executar(progresso)
+        tarefa.etapa("processando", "Arquivo entregue, aguardando o servidor MQTT")
+    except Exception as e:
+        pedidos.falhar(tarefa.ident, RuntimeError(f"Falha no envio: {e}"))
+    finally:
+        envios.pop(envio.transferencia, None)
+        os.remove(caminho)
+
+
+def concluir_tarefa(tarefa, futuro):
+    """
+    Chamado quando o pedido termina (resposta, erro ou tempo esgotado): repassa o conteúdo de uma
+    resposta numa única mensagem (a resposta em blocos já foi repassada bloco a bloco) e encerra a tarefa.
+
+    :param tarefa: tarefas.Tarefa do pedido
+    :param futuro: Future do pedido
+    """
+    if futuro.cancelled():
+        tarefa.falhar("Timeout esperando resposta do servidor MQTT")
+        return
+    erro = futuro.exception()
+    if erro is not None:
+        tarefa.falhar(str(erro))
+        return
+    resposta = futuro.result()
+    if resposta.tipo == protocolo.TIPO_RESPOSTA:
+        tarefa.etapa("recebendo", f"Recebendo {resposta.nome}")
+        for bloco in resposta.blocos(tarefas.TAMANHO_PEDACO):
+            tarefa.dados(bloco)
+    print(f"✅ Tarefa {tarefa.ident} concluída em {futuro.duracao * 1000:.1f} ms")
+    # Na resposta em blocos, os tempos do servidor vêm nos metadados de todas as mensagens (inclusive o FIM)
+    tarefa.concluir(filename=resposta.nome, duration=round(futuro.duracao, 3),
+                    server_timings=resposta.meta.get("tempos"))
+
+
+def vigiar_tarefa(tarefa):
+    """
+    Cancela o pedido da tarefa depois de TEMPO_RESPOSTA segundos sem nenhum evento
+    (o prazo recomeça a cada bloco enviado ou recebido, então arquivos grandes não expiram no meio).
+
+    :param tarefa: tarefas.Tarefa do pedido
+    """
+    def conferir():
+        if pedidos.obter(tarefa.ident) is None:
+            return
+        restante = tarefa.ultima_atividade + TEMPO_RESPOSTA - time.monotonic()
+        if restante <= 0:
+            pedidos.cancelar(tarefa.ident)
+        else:
+            agendar(restante)
+
+    def agendar(espera):
+        temporizador = threading.Timer(espera, conferir)
+        temporizador.daemon = True
+        temporizador.start()
+
+    agendar(TEMPO_RESPOSTA)
 
 # ==================================================================
 # Execução da aplicação
 # ==================================================================
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Interface web para envio de arquivos ao servidor MQTT")
+    parser.add_argument("--legado", action="store_true",
+                        help="envia no formato antigo 'nome;base64;client_id'")
+    parser.add_argument("--max-pendentes", type=int, default=MAX_PENDENTES,
+                        help="uploads aguardando resposta ao mesmo tempo (acima disso responde 503)")
+    parser.add_argument("--tempo-resposta", type=float, default=TEMPO_RESPOSTA,
+                        help="segundos de espera pela resposta do servidor MQTT (depois responde 504)")
+    parser.add_argument("--compressao", nargs="?", const=compressao.PADRAO, choices=compressao.DISPONIVEIS,
+                        help=f"comprime os uploads e pede as respostas comprimidas (sem valor: {compressao.PADRAO})")
+    args = parser.parse_args()
+    LEGADO = args.legado
+    COMPRESSAO = None if LEGADO else args.compressao
+    TEMPO_RESPOSTA = args.tempo_resposta
+    pedidos = Correlacionador(args.max_pendentes)
     # Inicia o servidor Flask em modo de depuração (debug)
     app.run(debug=True)
@@ -0,0 +1,453 @@
+# benchmark.py
+# Teste de carga do caminho completo do servidor MQTT: upload -> servidor.py -> download.
+# Inicia um broker local (o Mosquitto, se estiver instalado, ou o broker_local.py dentro deste
+# processo) e o servidor.py, ou usa um broker e um servidor já em execução com --broker.
+# Simula N clientes, cada um com a sua conexão, publicando em arquivo/upload/<id> arquivos de texto
+# com tamanhos sorteados de uma distribuição e esperando a resposta em arquivo/download/<id>.
+# Cada pedido leva um ID (metadados["id"]) e o tempo de ida e volta é medido até a resposta com o
+# mesmo ID chegar. Ao final imprime um relatório JSON com vazão, latências p50/p95/p99 e perdas
+# (pedidos sem resposta dentro de --tempo-limite), por tamanho e no total. Com vários --modo, cada
+# modo do servidor é medido em sequência.
+#
+# Exemplos:
+#   python benchmark.py --clientes 20 --duracao 10
+#   python benchmark.py --modo threads processos --tamanhos 1KB=70,64KB=25,1MB=5 > resultado.json
+#   python benchmark.py --clientes 50 --taxa 20 --em-voo 4          (50 x 20 = 1000 pedidos/s)
+#   python benchmark.py --broker 192.168.0.10:1883 --clientes 10    (servidor já em execução)
+#   python benchmark.py -- --workers 8 --cache-mb 0                 (argumentos para o servidor.py)
+#   python benchmark.py --compressao zlib --tamanhos 64KB           (pedidos e respostas comprimidos)
+
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import shutil                           # Procura o executável do Mosquitto
+import signal                           # Ctrl+C no servidor iniciado pelo benchmark
+import socket
+import subprocess                       # Executa o servidor.py (e o Mosquitto) em outro processo
+import sys
+import tempfile                         # Pasta de trabalho do servidor (arquivos CAPS_ e cache)
+import threading
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+
+import compressao
+import protocolo
+import transformacoes
+from broker_local import BrokerLocal
+from correlacao import Correlacionador
+
+# Pasta do servidor.py (o benchmark fica ao lado dele)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Distribuição padrão dos tamanhos dos arquivos (tamanho -> peso)
+tamanhos_padrao = "1KB=60,16KB=30,256KB=10"
+
+# Tempo máximo (em segundos) para o broker e o servidor iniciados pelo benchmark ficarem prontos
+tempo_inicializacao = 15
+
+# Texto usado para gerar os arquivos (com acentos, para exercitar o UTF-8 de vários bytes)
+amostra_texto = "Redes de Computadores 1: publicação, assinatura e transformação de arquivos. "
+
+# ==========================
+# BROKER E SERVIDOR LOCAIS
+# ==========================
+
+def porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Espera a porta aceitar conexões
+def esperar_porta(porta, limite):
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", porta), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+# Inicia o Mosquitto (se instalado) ou o broker_local.py. Devolve (descrição, porta, função para parar).
+def iniciar_broker(usar_mosquitto, perda):
+    executavel = shutil.which("mosquitto") if usar_mosquitto and not perda else None
+    if executavel:
+        porta = porta_livre()
+        processo = subprocess.Popen([executavel, "-p", str(porta)], stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+        if not esperar_porta(porta, time.monotonic() + tempo_inicializacao):
+            processo.kill()
+            raise RuntimeError("O Mosquitto não iniciou")
+
+        def parar():
+            processo.terminate()
+            processo.wait()
+        return "mosquitto", porta, parar
+
+    broker = BrokerLocal(perda=perda)
+    return "broker_local", broker.iniciar(), broker.parar
+
+
+# Inicia o servidor.py numa pasta temporária e espera a linha "Subscrito ao tópico"
+def iniciar_servidor(host, porta, modo, argumentos_extras, pasta):
+    comando = [sys.executable, "-u", os.path.join(script_dir, "servidor.py"),
+               "--broker", host, "--porta", str(porta), "--modo", modo] + argumentos_extras
+    processo = subprocess.Popen(comando, cwd=pasta, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding="utf-8", errors="replace")
+
+    saida = []
+    pronto = threading.Event()
+
+    # Lê a saída do servidor numa thread: o resto precisa ser consumido para o servidor
+    # não travar escrevendo num pipe cheio (ele imprime uma linha por mensagem)
+    def ler_saida():
+        for linha in processo.stdout:
+            saida.append(linha.rstrip())
+            del saida[:-50]
+            if "Subscrito ao tópico" in linha:
+                pronto.set()
+        pronto.set()
+
+    threading.Thread(target=ler_saida, daemon=True).start()
+    if not pronto.wait(tempo_inicializacao) or processo.poll() is not None:
+        parar_servidor(processo)
+        raise RuntimeError("O servidor não iniciou:\n" + "\n".join(saida[-20:]))
+    return processo
+
+
+# Encerra o servidor como um Ctrl+C (para ele imprimir as estatísticas e fechar o pool)
+def parar_servidor(processo):
+    if processo.poll() is not None:
+        return
+    if os.name == "nt":
+        processo.terminate()
+    else:
+        processo.send_signal(signal.SIGINT)
+    try:
+        processo.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+        processo.wait()
+
+# ==========================
+# DISTRIBUIÇÃO DE TAMANHOS
+# ==========================
+
+# "512", "16KB", "1MB" -> bytes
+def interpretar_tamanho(texto):
+    texto = texto.strip().upper()
+    for sufixo, fator in (("KB", 1024), ("MB", 1024 * 1024), ("K", 1024), ("M", 1024 * 1024), ("B", 1)):
+        if texto.endswith(sufixo):
+            return int(float(texto[:-len(sufixo)]) * fator)
+    return int(texto)
+
+
+# Lê pesos no formato "1KB=60,16KB=30,256KB=10" (um tamanho sem peso fica com peso 1)
+def interpretar_tamanhos(texto):
+    distribuicao = {}
+    for item in texto.split(","):
+        tamanho, _, peso = item.partition("=")
+        try:
+            distribuicao[tamanho.strip()] = (interpretar_tamanho(tamanho), float(peso or 1))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"tamanho inválido na distribuição: {item}")
+    return distribuicao
+
+
+# Conteúdo de cada tamanho, gerado uma vez (cortado numa divisa de caractere UTF-8)
+def gerar_conteudos(distribuicao):
+    conteudos = {}
+    for nome, (tamanho, _) in distribuicao.items():
+        bloco = amostra_texto.encode("utf-8")
+        dados = (bloco * (tamanho // len(bloco) + 1))[:tamanho]
+        conteudos[nome] = dados.decode("utf-8", errors="ignore").encode("utf-8")
+    return conteudos
+
+# ==========================
+# CLIENTES SIMULADOS
+# ==========================
+
+# Resultados de um tamanho de arquivo
+class Resultado:
+
+    def __init__(self):
+        self.latencias = []     # Segundos, uma por resposta recebida
+        self.erros = 0          # Respostas de erro do servidor
+        self.sem_resposta = 0   # Pedidos sem resposta dentro do tempo limite (perdidos)
+        self.bytes_enviados = 0
+        self.bytes_recebidos = 0
+
+
+# Um cliente com a sua conexão MQTT: publica pedidos até `fim` e espera as respostas.
+# Com `taxa` > 0 publica `taxa` pedidos por segundo; com 0, publica um novo assim que uma
+# resposta chega. Nos dois casos, no máximo `em_voo` pedidos ficam aguardando resposta.
+# Cada cliente guarda seus próprios resultados (sem lock no caminho da medição); eles são somados no final.
+def cliente_simulado(config, indice, limites, resultados, conectados, largada, erros_conexao):
+    sorteio = random.Random(indice)
+    client_id = f"bench_{config.prefixo}_{indice}"
+    topico_upload = f"arquivo/upload/{client_id}"
+    pedidos = Correlacionador()
+    assinado = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe(f"arquivo/download/{client_id}", qos=config.qos)
+
+    def on_subscribe(client, userdata, mid, granted_qos):
+        assinado.set()
+
+    def on_message(client, userdata, msg):
+        try:
+            resposta = protocolo.decodificar(msg.payload, verificar=False)
+        except protocolo.ErroProtocolo:
+            return
+        ident = resposta.meta.get("id")
+        if resposta.tipo == protocolo.TIPO_ERRO:
+            pedidos.falhar(ident, RuntimeError(resposta.meta.get("erro")))
+        else:
+            pedidos.resolver(ident, len(msg.payload))
+
+    client = mqtt.Client(client_id=client_id)
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    try:
+        client.connect(config.host, config.porta, 60)
+    except OSError as e:
+        erros_conexao.append(str(e))
+        conectados.wait()
+        return
+    client.loop_start()
+    assinado.wait(tempo_inicializacao)
+    # Todos os clientes começam juntos, depois de conectados e assinados
+    conectados.wait()
+    largada.wait()
+    inicio_medicao, fim = limites["medicao"], limites["fim"]
+
+    nomes = list(config.distribuicao)
+    pesos = [peso for _, peso in config.distribuicao.values()]
+    meta_base = {"transformacao": config.transformacao} if config.transformacao != transformacoes.PADRAO else {}
+    if config.compressao:
+        meta_base["compressao"] = config.compressao
+    em_voo = set()
+    proximo_envio = time.perf_counter() + sorteio.random() / config.taxa if config.taxa else 0
+    contador = 0
+
+    while True:
+        agora = time.perf_counter()
+
+        # Pedidos concluídos (resposta, erro ou tempo esgotado)
+        for futuro in [f for f in em_voo if agora - f.inicio > config.tempo_limite]:
+            pedidos.cancelar(futuro.ident)
+        for futuro in [f for f in em_voo if f.done()]:
+            em_voo.discard(futuro)
+            # Pedidos do aquecimento não entram no resultado
+            if futuro.inicio < inicio_medicao:
+                continue
+            resultado = resultados[futuro.tamanho]
+            resultado.bytes_enviados += futuro.bytes
+            if futuro.cancelled():
+                resultado.sem_resposta += 1
+            elif futuro.exception() is not None:
+                resultado.erros += 1
+            else:
+                resultado.latencias.append(futuro.duracao)
+                resultado.bytes_recebidos += futuro.result()
+
+        if agora >= fim and not em_voo:
+            break
+
+        if agora < fim and len(em_voo) < config.em_voo and agora >= proximo_envio:
+            nome = sorteio.choices(nomes, pesos)[0]
+            conteudo = config.conteudos[nome]
+            if not config.repetir:
+                # Uma linha única no início: o cache de resultados do servidor não é usado
+                contador += 1
+                conteudo = f"{client_id} {contador}\n".encode("utf-8") + conteudo
+            ident, futuro = pedidos.novo()
+            futuro.tamanho = nome
+            payload = protocolo.codificar(f"bench_{contador}.txt", conteudo, meta=dict(meta_base, id=ident),
+                                          codec=config.compressao)
+            futuro.bytes = len(payload)         # Bytes que passam pelo broker (comprimidos ou não)
+            client.publish(topico_upload, payload, qos=config.qos)
+            em_voo.add(futuro)
+            if config.taxa:
+                proximo_envio += 1 / config.taxa
+            continue
+
+        # Espera a próxima resposta, o próximo envio ou o próximo pedido a expirar
+        prazos = [min(f.inicio for f in em_voo) + config.tempo_limite] if em_voo else []
+        if agora < fim:
+            prazos.append(fim)
+            if len(em_voo) < config.em_voo:
+                prazos.append(proximo_envio)
+        espera = max(0.0, min(prazos) - agora) if prazos else 0.1
+        if em_voo:
+            concurrent.futures.wait(em_voo, timeout=espera, return_when=concurrent.futures.FIRST_COMPLETED)
+        else:
+            time.sleep(espera)
+
+    client.loop_stop()
+    client.disconnect()
+
+
+# Executa a carga e devolve o relatório (dicionário)
+def medir(config):
+    por_cliente = [{nome: Resultado() for nome in config.distribuicao} for _ in range(config.clientes)]
+    conectados = threading.Barrier(config.clientes + 1)
+    largada = threading.Event()
+    limites = {}
+    erros_conexao = []
+
+    threads = [
+        threading.Thread(target=cliente_simulado, daemon=True,
+                         args=(config, i, limites, por_cliente[i], conectados, largada, erros_conexao))
+        for i in range(config.clientes)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # O relógio só começa quando todos os clientes estiverem conectados e assinados
+    conectados.wait()
+    agora = time.perf_counter()
+    limites["medicao"] = agora + config.aquecimento
+    limites["fim"] = agora + config.aquecimento + config.duracao
+    largada.set()
+    for thread in threads:
+        thread.join()
+    if erros_conexao:
+        raise RuntimeError(f"Falha ao conectar ao broker: {erros_conexao[0]}")
+
+    # Soma os resultados de todos os clientes, por tamanho e no total
+    totais = {nome: Resultado() for nome in list(config.distribuicao) + ["total"]}
+    for resultados in por_cliente:
+        for nome, resultado in resultados.items():
+            for destino in (totais[nome], totais["total"]):
+                destino.latencias.extend(resultado.latencias)
+                destino.erros += resultado.erros
+                destino.sem_resposta += resultado.sem_resposta
+                destino.bytes_enviados += resultado.bytes_enviados
+                destino.bytes_recebidos += resultado.bytes_recebidos
+
+    return {
+        "broker": f"{config.host}:{config.porta}",
+        "clientes": config.clientes,
+        "duracao_s": config.duracao,
+        "taxa_por_cliente": config.taxa,
+        "em_voo_por_cliente": config.em_voo,
+        "qos": config.qos,
+        "transformacao": config.transformacao,
+        "compressao": config.compressao,
+        "tamanhos": {nome: tamanho for nome, (tamanho, _) in config.distribuicao.items()},
+        "resultados": {nome: resumir(resultado, config.duracao) for nome, resultado in totais.items()
+                       if nome == "total" or len(config.distribuicao) > 1},
+    }
+
+
+# Vazão, percentis de latência e perdas de um Resultado
+def resumir(resultado, duracao):
+    latencias = sorted(resultado.latencias)
+    total = len(latencias) + resultado.erros + resultado.sem_resposta
+    return {
+        "pedidos": total,
+        "respostas": len(latencias),
+        "pedidos_por_s": round(len(latencias) / duracao, 1),
+        "mb_enviados_por_s": round(resultado.bytes_enviados / duracao / 1024 / 1024, 2),
+        "latencia_ms": {
+            "p50": percentil(latencias, 50),
+            "p95": percentil(latencias, 95),
+            "p99": percentil(latencias, 99),
+            "max": round(latencias[-1] * 1000, 3) if latencias else None,
+        },
+        "erros": resultado.erros,
+        "sem_resposta": resultado.sem_resposta,
+        "taxa_perda": round(resultado.sem_resposta / total, 4) if total else 0.0,
+    }
+
+
+# Percentil pelo método do posto mais próximo, em milissegundos
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    posicao = max(0, -(-len(ordenadas) * p // 100) - 1)
+    return round(ordenadas[int(posicao)] * 1000, 3)
+
+# ==========================
+# PROGRAMA PRINCIPAL
+# ==========================
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor MQTT (ida e volta dos arquivos)",
+                                     epilog="Argumentos após -- são repassados ao servidor.py "
+                                            "(ex: -- --workers 8 --cache-mb 0)")
+    parser.add_argument("--modo", nargs="+", default=["threads"], choices=["threads", "processos"],
+                        help="modo(s) do servidor a medir; vários são medidos em sequência")
+    parser.add_argument("--broker", metavar="HOST:PORTA",
+                        help="usa um broker e um servidor já em execução em vez de iniciar locais")
+    parser.add_argument("--sem-mosquitto", action="store_true",
+                        help="usa o broker_local.py mesmo com o Mosquitto instalado")
+    parser.add_argument("--perda", type=float, default=0.0,
+                        help="fração das publicações descartadas pelo broker_local.py (simula uma rede ruim)")
+    parser.add_argument("--clientes", type=int, default=10, help="clientes simulados, cada um com a sua conexão")
+    parser.add_argument("--taxa", type=float, default=0,
+                        help="pedidos por segundo de cada cliente (0 = um novo assim que uma resposta chega)")
+    parser.add_argument("--em-voo", type=int, default=1, help="pedidos aguardando resposta por cliente")
+    parser.add_argument("--tamanhos", type=interpretar_tamanhos, default=tamanhos_padrao,
+                        help=f"distribuição dos tamanhos dos arquivos, tamanho=peso (padrão: {tamanhos_padrao})")
+    parser.add_argument("--repetir", action="store_true",
+                        help="envia sempre o mesmo conteúdo para cada tamanho (mede o cache de resultados)")
+    parser.add_argument("--transformacao", choices=list(transformacoes.TRANSFORMACOES), default=transformacoes.PADRAO)
+    parser.add_argument("--compressao", choices=compressao.DISPONIVEIS,
+                        help="comprime os pedidos (e pede as respostas comprimidas) com este codec")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=0, help="QoS dos pedidos e da assinatura")
+    parser.add_argument("--duracao", type=float, default=10, help="segundos de medição")
+    parser.add_argument("--aquecimento", type=float, default=2, help="segundos iniciais descartados")
+    parser.add_argument("--tempo-limite", type=float, default=10,
+                        help="segundos sem resposta até o pedido ser contado como perdido")
+    parser.add_argument("--saida", help="grava o JSON neste arquivo (além de imprimir)")
+    args, extras = parser.parse_known_args()
+    extras = [arg for arg in extras if arg != "--"]
+
+    args.distribuicao = args.tamanhos
+    args.conteudos = gerar_conteudos(args.distribuicao)
+    args.prefixo = uuid.uuid4().hex[:6]     # client_ids diferentes a cada execução
+    args.em_voo = max(1, args.em_voo)
+
+    relatorios = []
+    if args.broker:
+        args.host, _, porta = args.broker.rpartition(":")
+        args.porta = int(porta)
+        relatorios.append(medir(args))
+    else:
+        descricao, args.porta, parar_broker = iniciar_broker(not args.sem_mosquitto, args.perda)
+        args.host = "127.0.0.1"
+        try:
+            for modo in args.modo:
+                print(f"⏱️ Medindo modo {modo} ({args.clientes} clientes, {args.duracao:g}s, {descricao})...",
+                      file=sys.stderr)
+                pasta = tempfile.mkdtemp(prefix="benchmark_mqtt_")
+                processo = iniciar_servidor(args.host, args.porta, modo, extras, pasta)
+                try:
+                    relatorio = medir(args)
+                finally:
+                    parar_servidor(processo)
+                    shutil.rmtree(pasta, ignore_errors=True)
+                relatorio["modo"] = modo
+                relatorio["broker_tipo"] = descricao
+                relatorios.append(relatorio)
+        finally:
+            parar_broker()
+
+    texto = json.dumps(relatorios if len(relatorios) > 1 else relatorios[0], indent=2, ensure_ascii=False)
+    print(texto)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as file:
+            file.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# broker_local.py
+# Broker MQTT mínimo para testes locais, usado pelo benchmark.py quando o Mosquitto não está
+# instalado. Implementa só o necessário para o servidor, o cliente e o app web deste projeto
+# (MQTT 3.1.1): CONNECT com last will, PUBLISH com QoS 0 e 1, mensagens retidas, SUBSCRIBE com
+# curingas + e #, assinaturas compartilhadas ($share/<grupo>/<filtro>, distribuídas em rodízio),
+# UNSUBSCRIBE, PINGREQ e DISCONNECT. Não guarda sessões: cada conexão começa do zero, e mensagens
+# QoS 1 para um assinante não são reenviadas (numa conexão local elas não se perdem).
+#
+# Com `perda` > 0, descarta essa fração das publicações recebidas (depois de confirmar o PUBACK
+# ao remetente), para simular uma rede ruim e medir perdas e reenvios.
+#
+# Uso: python broker_local.py [porta]   (padrão 1883)
+
+import asyncio
+import itertools
+import random
+import struct
+import sys
+import threading
+
+# Tipos de pacote MQTT (4 bits mais altos do primeiro byte)
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def ler_texto(dados, posicao):
+    tamanho = struct.unpack_from("!H", dados, posicao)[0]
+    inicio = posicao + 2
+    return dados[inicio:inicio + tamanho], inicio + tamanho
+
+
+def codificar_texto(texto):
+    if isinstance(texto, str):
+        texto = texto.encode("utf-8")
+    return struct.pack("!H", len(texto)) + texto
+
+
+# "Remaining length": 7 bits por byte, o bit mais alto indica que há mais bytes
+def codificar_tamanho(tamanho):
+    saida = bytearray()
+    while True:
+        digito = tamanho % 128
+        tamanho //= 128
+        saida.append(digito | (0x80 if tamanho else 0))
+        if not tamanho:
+            return bytes(saida)
+
+
+def pacote(tipo, corpo=b"", flags=0):
+    return bytes([tipo << 4 | flags]) + codificar_tamanho(len(corpo)) + corpo
+
+
+# O filtro de assinatura (com + e #) casa com o tópico? Tópicos $... não casam com curingas no início.
+def casa(filtro, topico):
+    partes_filtro = filtro.split("/")
+    partes_topico = topico.split("/")
+    if partes_topico[0].startswith("$") and partes_filtro[0] in ("#", "+"):
+        return False
+    for i, parte in enumerate(partes_filtro):
+        if parte == "#":
+            return True
+        if i >= len(partes_topico) or (parte != "+" and parte != partes_topico[i]):
+            return False
+    return len(partes_filtro) == len(partes_topico)
+
+
+class Sessao:
+
+    def __init__(self, escritor):
+        self.escritor = escritor
+        self.assinaturas = {}           # filtro -> QoS
+        self.ids_pacote = itertools.cycle(range(1, 65536))
+        self.testamento = None          # (tópico, payload, QoS, retida): publicado se a conexão cair
+
+
+class BrokerLocal:
+
+    def __init__(self, host="127.0.0.1", porta=0, perda=0.0):
+        self.host = host
+        self.porta = porta              # 0 = porta livre escolhida pelo sistema
+        self.perda = perda
+        self.sessoes = set()
+        self.retidas = {}               # tópico -> (payload, QoS)
+        self.rodizio = {}               # (grupo, filtro) -> próximo assinante do $share
+        self.publicacoes = 0            # Publicações recebidas (estatística)
+        self.descartadas = 0            # Publicações descartadas pela perda simulada
+        self._loop = None
+        self._servidor = None
+        self._thread = None
+
+    # ==========================
+    # EXECUÇÃO EM SEGUNDO PLANO
+    # ==========================
+
+    # Inicia o broker numa thread própria e devolve a porta em que ele está escutando
+    def iniciar(self):
+        pronto = threading.Event()
+        erro = []
+
+        def executar():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._servidor = self._loop.run_until_complete(
+                    asyncio.start_server(self._atender, self.host, self.porta))
+                self.porta = self._servidor.sockets[0].getsockname()[1]
+            except OSError as e:
+                erro.append(e)
+                pronto.set()
+                return
+            pronto.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=executar, daemon=True)
+        self._thread.start()
+        pronto.wait()
+        if erro:
+            raise erro[0]
+        return self.porta
+
+    def parar(self):
+        if self._loop is None:
+            return
+
+        async def encerrar():
+            self._servidor.close()
+            for sessao in list(self.sessoes):
+                sessao.escritor.close()
+            await self._servidor.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(encerrar(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    # ==========================
+    # CONEXÕES
+    # ==========================
+
+    async def _atender(self, leitor, escritor):
+        sessao = Sessao(escritor)
+        self.sessoes.add(sessao)
+        desconectou = False             # DISCONNECT recebido: o testamento não é publicado
+        try:
+            while True:
+                cabecalho = (await leitor.readexactly(1))[0]
+                multiplicador, tamanho = 1, 0
+                while True:
+                    digito = (await leitor.readexactly(1))[0]
+                    tamanho += (digito & 127) * multiplicador
+                    multiplicador *= 128
+                    if not digito & 128:
+                        break
+                corpo = await leitor.readexactly(tamanho) if tamanho else b""
+                tipo, flags = cabecalho >> 4, cabecalho & 15
+
+                if tipo == DISCONNECT:
+                    desconectou = True
+                    break
+                self._tratar(sessao, tipo, flags, corpo)
+                await escritor.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessoes.discard(sessao)
+            if not desconectou and sessao.testamento:
+                self.publicar(*sessao.testamento)
+            escritor.close()
+
+    def _tratar(self, sessao, tipo, flags, corpo):
+        escritor = sessao.escritor
+        if tipo == CONNECT:
+            _, posicao = ler_texto(corpo, 0)             # Nome do protocolo ("MQTT")
+            flags_conexao = corpo[posicao + 1]          # Depois do nível do protocolo
+            posicao += 4                                # Nível, flags e keep-alive
+            _, posicao = ler_texto(corpo, posicao)      # client_id
+            if flags_conexao & 0x04:
+                topico, posicao = ler_texto(corpo, posicao)
+                mensagem, posicao = ler_texto(corpo, posicao)
+                sessao.testamento = (topico.decode("utf-8"), mensagem, (flags_conexao >> 3) & 3,
+                                     bool(flags_conexao & 0x20))
+            escritor.write(pacote(CONNACK, b"\x00\x00"))
+
+        elif tipo == PUBLISH:
+            qos, retida = (flags >> 1) & 3, flags & 1
+            topico, posicao = ler_texto(corpo, 0)
+            if qos:
+                escritor.write(pacote(PUBACK, corpo[posicao:posicao + 2]))
+                posicao += 2
+            self.publicacoes += 1
+            if self.perda and random.random() < self.perda:
+                self.descartadas += 1
+                return
+            self.publicar(topico.decode("utf-8"), corpo[posicao:], qos, retida)
+
+        elif tipo == SUBSCRIBE:
+            id_pacote, posicao, codigos = corpo[:2], 2, []
+            while posicao < len(corpo):
+                filtro, posicao = ler_texto(corpo, posicao)
+                qos = min(corpo[posicao], 1)
+                posicao += 1
+                filtro = filtro.decode("utf-8")
+                sessao.assinaturas[filtro] = qos
+                codigos.append(qos)
+                # Mensagens retidas que casam com a nova assinatura
+                if not filtro.startswith("$share/"):
+                    for topico, (payload, qos_retida) in list(self.retidas.items()):
+                        if casa(filtro, topico):
+                            self._entregar(sessao, topico, payload, min(qos, qos_retida), True)
+            escritor.write(pacote(SUBACK, id_pacote + bytes(codigos)))
+
+        elif tipo == UNSUBSCRIBE:
+            posicao = 2
+            while posicao < len(corpo):
+                filtro, posicao = ler_texto(corpo, posicao)
+                sessao.assinaturas.pop(filtro.decode("utf-8"), None)
+            escritor.write(pacote(UNSUBACK, corpo[:2]))
+
+        elif tipo == PINGREQ:
+            escritor.write(pacote(PINGRESP))
+
+    # ==========================
+    # ROTEAMENTO
+    # ==========================
+
+    def publicar(self, topico, payload, qos, retida):
+        if retida:
+            if payload:
+                self.retidas[topico] = (payload, qos)
+            else:
+                self.retidas.pop(topico, None)
+
+        compartilhadas = {}             # (grupo, filtro) -> [(sessão, QoS)]
+        for sessao in list(self.sessoes):
+            maior_qos = None
+            for filtro, qos_assinatura in sessao.assinaturas.items():
+                if filtro.startswith("$share/"):
+                    _, grupo, filtro_real = filtro.split("/", 2)
+                    if casa(filtro_real, topico):
+                        compartilhadas.setdefault((grupo, filtro_real), []).append((sessao, qos_assinatura))
+                elif casa(filtro, topico):
+                    maior_qos = qos_assinatura if maior_qos is None else max(maior_qos, qos_assinatura)
+            if maior_qos is not None:
+                self._entregar(sessao, topico, payload, min(qos, maior_qos), False)
+
+        # Cada grupo compartilhado recebe a mensagem uma vez, num dos seus assinantes (rodízio)
+        for chave, membros in compartilhadas.items():
+            vez = self.rodizio.get(chave, 0)
+            self.rodizio[chave] = vez + 1
+            sessao, qos_assinatura = membros[vez % len(membros)]
+            self._entregar(sessao, topico, payload, min(qos, qos_assinatura), False)
+
+    def _entregar(self, sessao, topico, payload, qos, retida):
+        variavel = codificar_texto(topico)
+        if qos:
+            variavel += struct.pack("!H", next(sessao.ids_pacote))
+        sessao.escritor.write(bytes([PUBLISH << 4 | qos << 1 | int(retida)])
+                              + codificar_tamanho(len(variavel) + len(payload)) + variavel + payload)
+
+
+if __name__ == "__main__":
+    broker = BrokerLocal("0.0.0.0", int(sys.argv[1]) if len(sys.argv) > 1 else 1883)
+    print(f"📡 Broker local escutando na porta {broker.iniciar()} (Ctrl+C para encerrar)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.parar()
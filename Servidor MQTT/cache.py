@@ -0,0 +1,162 @@
+# cache.py
+# Cache dos resultados das transformações, para arquivos que os clientes enviam de novo.
+# A chave é o hash do conteúdo enviado (blake2b) junto com o nome da transformação: o mesmo
+# arquivo com o mesmo pedido tem sempre o mesmo resultado, não importa o nome, o cliente ou o
+# formato da mensagem. Num acerto o servidor responde sem decodificar, transformar nem gravar.
+#
+# Camada em memória: LRU limitado em bytes (os resultados usados há mais tempo saem primeiro).
+# Camada em disco (opcional): cada resultado também é gravado na pasta como um arquivo com o nome
+# da chave, com o seu próprio limite de bytes. Ela sobrevive a um reinício do servidor e guarda
+# resultados que não cabem mais na memória; um acerto no disco volta para a memória.
+
+import hashlib                          # Hash do conteúdo (chave do cache)
+import os
+import threading                        # O cache é compartilhado por todos os workers
+from collections import OrderedDict     # Mantém a ordem de uso para o descarte LRU
+
+
+# Chave do resultado: transformação + hash do conteúdo, calculado bloco a bloco
+def chave_resultado(blocos, transformacao):
+    resumo = hashlib.blake2b(digest_size=20)
+    for bloco in blocos:
+        resumo.update(bloco)
+    return f"{transformacao}-{resumo.hexdigest()}"
+
+
+class CacheResultados:
+
+    def __init__(self, limite_bytes, pasta=None, limite_disco=None):
+        self.limite_bytes = limite_bytes    # Orçamento de memória para os resultados
+        self.bytes_usados = 0
+        self._itens = OrderedDict()         # chave -> resultado (bytes); o mais recente fica no fim
+        self._lock = threading.Lock()
+
+        self.pasta = pasta                  # Camada em disco (None = só memória)
+        self.limite_disco = limite_disco
+        self.bytes_disco = 0
+        self._disco = OrderedDict()         # chave -> tamanho do arquivo, também em ordem de uso
+        if pasta:
+            self._carregar_disco()
+
+        # Contadores de desempenho
+        self.acertos_memoria = 0    # Resultados servidos da memória
+        self.acertos_disco = 0      # Resultados lidos da camada em disco
+        self.falhas = 0             # Conteúdo novo: precisou ser processado
+        self.despejos = 0           # Resultados removidos da memória para respeitar o limite
+        self.bytes_economizados = 0  # Bytes de resultado entregues sem processar de novo
+
+    # Resultado guardado para a chave, ou None
+    def obter(self, chave):
+        with self._lock:
+            resultado = self._itens.get(chave)
+            if resultado is not None:
+                self._itens.move_to_end(chave)
+                self.acertos_memoria += 1
+                self.bytes_economizados += len(resultado)
+                return resultado
+            no_disco = chave in self._disco
+
+        resultado = self._ler_disco(chave) if no_disco else None
+        with self._lock:
+            if resultado is None:
+                self.falhas += 1
+                return None
+            self.acertos_disco += 1
+            self.bytes_economizados += len(resultado)
+            self._disco.move_to_end(chave)
+            self._guardar_memoria(chave, resultado)
+        return resultado
+
+    # Guarda um resultado novo (na memória e, se houver, no disco)
+    def guardar(self, chave, resultado):
+        resultado = bytes(resultado)
+        with self._lock:
+            self._guardar_memoria(chave, resultado)
+            gravar = self.pasta is not None and chave not in self._disco and len(resultado) <= self.limite_disco
+        if gravar:
+            self._gravar_disco(chave, resultado)
+
+    # Resumo dos contadores (para logs e para o relatório de carga)
+    def estatisticas(self):
+        with self._lock:
+            acertos = self.acertos_memoria + self.acertos_disco
+            pedidos = acertos + self.falhas
+            return {
+                "itens": len(self._itens),
+                "bytes_usados": self.bytes_usados,
+                "limite_bytes": self.limite_bytes,
+                "itens_disco": len(self._disco),
+                "bytes_disco": self.bytes_disco,
+                "acertos_memoria": self.acertos_memoria,
+                "acertos_disco": self.acertos_disco,
+                "falhas": self.falhas,
+                "despejos": self.despejos,
+                "taxa_acertos": round(acertos / pedidos, 4) if pedidos else 0.0,
+                "bytes_economizados": self.bytes_economizados,
+            }
+
+    # Deve ser chamado com o lock adquirido
+    def _guardar_memoria(self, chave, resultado):
+        # Resultados maiores que o orçamento inteiro nunca ficam na memória (só no disco)
+        if len(resultado) > self.limite_bytes or chave in self._itens:
+            return
+        self._itens[chave] = resultado
+        self.bytes_usados += len(resultado)
+        while self.bytes_usados > self.limite_bytes:
+            _, antigo = self._itens.popitem(last=False)
+            self.bytes_usados -= len(antigo)
+            self.despejos += 1
+
+    # ==========================
+    # CAMADA EM DISCO
+    # ==========================
+
+    # Índice dos resultados já gravados (de execuções anteriores), do usado há mais tempo ao mais recente
+    def _carregar_disco(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        arquivos = []
+        for entrada in os.scandir(self.pasta):
+            if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                info = entrada.stat()
+                arquivos.append((info.st_mtime, entrada.name, info.st_size))
+        for _, chave, tamanho in sorted(arquivos):
+            self._disco[chave] = tamanho
+            self.bytes_disco += tamanho
+
+    def _ler_disco(self, chave):
+        caminho = os.path.join(self.pasta, chave)
+        try:
+            with open(caminho, "rb") as arquivo:
+                resultado = arquivo.read()
+            # A data de modificação marca o último uso (ordem do descarte depois de reiniciar)
+            os.utime(caminho)
+            return resultado
+        except OSError:
+            with self._lock:
+                tamanho = self._disco.pop(chave, None)
+                if tamanho is not None:
+                    self.bytes_disco -= tamanho
+            return None
+
+    # Grava fora do lock (temporário + troca: um arquivo pela metade nunca é lido como resultado)
+    def _gravar_disco(self, chave, resultado):
+        caminho = os.path.join(self.pasta, chave)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(resultado)
+        os.replace(temporario, caminho)
+
+        removidos = []
+        with self._lock:
+            if chave not in self._disco:
+                self._disco[chave] = len(resultado)
+                self.bytes_disco += len(resultado)
+            while self.bytes_disco > self.limite_disco:
+                antigo, tamanho = self._disco.popitem(last=False)
+                self.bytes_disco -= tamanho
+                removidos.append(antigo)
+        for antigo in removidos:
+            try:
+                os.remove(os.path.join(self.pasta, antigo))
+            except OSError:
+                pass
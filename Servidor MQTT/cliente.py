@@ -1,8 +1,16 @@
 import paho.mqtt.client as mqtt   # Biblioteca para comunicação MQTT
-import base64                    # Para codificação e decodificação dos dados dos arquivos
+import protocolo                 # Codificação e decodificação das mensagens (ver protocolo.py)
+import transferencia             # Envio e recebimento de arquivos grandes em blocos
+import transformacoes            # Transformações que o servidor sabe aplicar
+import compressao                # Compressão opcional das mensagens (zlib, zstd)
+from correlacao import Correlacionador, Lotado  # Associa cada resposta ao pedido pelo ID
+import concurrent.futures        # Espera pelas respostas (Futures) sem consultar em intervalos
 import time                      # Para medir o tempo de resposta
 import os                        # Para manipulação de arquivos locais
-import sys                       # Para ler argumentos da linha de comando
+import glob                      # Padrões de arquivo no modo em lote (ex: textos/*.txt)
+import threading                 # Espera pela inscrição no tópico de download
+import argparse                  # Para ler argumentos da linha de comando
+import json                      # Envios em blocos já concluídos (ARQUIVO_ENVIOS)
 
 # ================
 # CONFIGURAÇÃO
@@ -10,9 +18,46 @@ import sys                       # Para ler argumentos da linha de comando
 
 BROKER = "26.93.244.10"          # IP do broker MQTT (pode ser local ou remoto)
 PORT = 1883                      # Porta padrão do protocolo MQTT
+TENTATIVAS_RESPOSTA = 5          # Pedidos de reenvio dos blocos da resposta que não chegaram
+TEMPO_RESPOSTA = 20              # Segundos sem nenhuma mensagem do servidor até desistir de esperar
+MAX_EM_VOO = 8                   # Pedidos aguardando resposta ao mesmo tempo no modo em lote
+ARQUIVO_ENVIOS = ".envios_concluidos.json"  # Envios em blocos concluídos de cada arquivo (ver sequencia_envio)
+
+parser = argparse.ArgumentParser(description="Cliente MQTT que envia arquivos .txt para o servidor")
+parser.add_argument("client_id", nargs="?", default="cliente_default", help="identificação única do cliente")
+parser.add_argument("--broker", default=BROKER, help="endereço do broker MQTT")
+parser.add_argument("--porta", type=int, default=PORT, help="porta do broker MQTT")
+parser.add_argument("--legado", action="store_true",
+                    help="envia no formato antigo 'nome;base64' (para servidores ainda não atualizados)")
+parser.add_argument("--bloco", type=int, default=transferencia.TAMANHO_BLOCO // 1024,
+                    help="tamanho dos blocos (KB) para arquivos grandes")
+parser.add_argument("--janela", type=int, default=transferencia.JANELA,
+                    help="blocos enviados sem confirmação do servidor")
+parser.add_argument("--transformacao", choices=list(transformacoes.TRANSFORMACOES), default=transformacoes.PADRAO,
+                    help="transformação aplicada pelo servidor (não disponível com --legado)")
+parser.add_argument("--lote", nargs="+", metavar="ARQUIVO",
+                    help="envia todos estes arquivos (ou padrões, ex: textos/*.txt) sem esperar cada resposta; "
+                         "os arquivos grandes vão em blocos ao mesmo tempo, cada um com a sua janela")
+parser.add_argument("--max-em-voo", type=int, default=MAX_EM_VOO,
+                    help="pedidos aguardando resposta ao mesmo tempo no modo em lote (envios em blocos incluídos)")
+parser.add_argument("--compressao", nargs="?", const=compressao.PADRAO, choices=compressao.DISPONIVEIS,
+                    help="comprime os arquivos enviados (e pede a resposta comprimida); sem valor usa "
+                         f"{compressao.PADRAO}. Precisa de um servidor atualizado; não disponível com --legado")
+parser.add_argument("--tempos", action="store_true",
+                    help="pede ao servidor o tempo de cada etapa do processamento e mostra junto com o de ida e volta")
+args = parser.parse_args()
 
 # Identificação única do cliente (pode ser passada como argumento ao executar o script)
-client_id = sys.argv[1] if len(sys.argv) > 1 else "cliente_default"
+client_id = args.client_id
+
+# Metadados enviados em cada pedido (a transformação padrão não precisa ser informada)
+pedido_meta = {"transformacao": args.transformacao} if args.transformacao != transformacoes.PADRAO else {}
+# Com compressão o servidor responde com o mesmo codec, mesmo que o arquivo enviado seja pequeno
+# demais para ir comprimido
+if args.compressao:
+    pedido_meta["compressao"] = args.compressao
+if args.tempos:
+    pedido_meta["tempos"] = True
 
 # Tópicos de envio (upload) e recebimento (download) específicos para este cliente
 TOPIC_UPLOAD = f"arquivo/upload/{client_id}"
@@ -22,44 +67,151 @@ TOPIC_DOWNLOAD = f"arquivo/download/{client_id}"
 # VARIÁVEIS GLOBAIS
 # ================
 
-pending_filename = None          # Nome do arquivo que está aguardando resposta
-upload_time = None               # Timestamp do envio, para cálculo do tempo de resposta
+# Pedidos aguardando resposta: cada um leva um ID (metadados["id"]) que o servidor devolve.
+# No formato antigo não há ID; o pedido é identificado pelo nome do arquivo enviado.
+pedidos = Correlacionador(max(1, args.max_em_voo) if args.lote else 1)
+last_activity = time.monotonic()  # Última mensagem do servidor (o tempo limite conta a partir dela)
+envios = {}                      # transferencia -> transferencia.Envio dos arquivos grandes sendo enviados
+recepcoes = {}                   # transferencia -> [Remontagem, reenvios pedidos] das respostas em blocos
+inscrito = threading.Event()     # Inscrição no tópico de download confirmada pelo broker
+lock_envios = threading.Lock()   # Leitura e gravação de ARQUIVO_ENVIOS (envios do lote em paralelo)
 
 # ======================
 # CALLBACK DE DOWNLOAD
 # ======================
 
+# Subscrição feita a cada conexão: se a conexão cair, o paho reconecta e a subscrição é refeita
+def on_connect(client, userdata, flags, rc):
+    client.subscribe(TOPIC_DOWNLOAD, qos=1)
+
+def on_subscribe(client, userdata, mid, granted_qos):
+    inscrito.set()
+
 # Esta função é executada automaticamente quando uma mensagem chega no tópico de download
 def on_message(client, userdata, msg):
-    global upload_time, pending_filename
+    global last_activity
 
-    download_time = time.time()                       # Marca o tempo da chegada da resposta
-    payload = msg.payload.decode()                    # Decodifica a mensagem recebida
+    last_activity = time.monotonic()
 
     try:
-        # Espera-se que o payload esteja no formato: "nome_do_arquivo;base64_dos_dados"
-        filename, file_data = payload.split(";", 1)
+        # Decodifica a mensagem recebida (formato binário ou o antigo "nome_do_arquivo;base64_dos_dados")
+        resposta = protocolo.decodificar(msg.payload)
+    except Exception as e:
+        print(f"❌ Erro ao processar resposta: {e}")
+        return
+
+    # Confirmações do servidor para um arquivo que estamos enviando em blocos
+    envio = envios.get(resposta.meta.get("transferencia"))
+    if envio is not None and not envio.completa:
+        envio.tratar(resposta)
+        return
+
+    if resposta.tipo in protocolo.TIPOS_TRANSFERENCIA:
+        receber_bloco(resposta)
+    else:
+        receber_arquivo(resposta)
+
+# ID do pedido a que a resposta pertence. Respostas do formato antigo não têm ID: o arquivo
+# devolvido é "CAPS_<nome enviado>" e o pedido foi registrado com o nome enviado.
+def pedido_da_resposta(resposta):
+    ident = resposta.meta.get("id")
+    if ident is None:
+        prefixo = transformacoes.obter().prefixo
+        ident = resposta.nome[len(prefixo):] if resposta.nome.startswith(prefixo) else resposta.nome
+    return ident
+
+# Resposta numa única mensagem
+def receber_arquivo(resposta):
+    filename = resposta.nome
+    ident = pedido_da_resposta(resposta)
 
-        # Cria o arquivo com o conteúdo decodificado
-        with open(filename, "w") as f:
-            f.write(base64.b64decode(file_data).decode())
+    try:
+        if resposta.tipo == protocolo.TIPO_ERRO:
+            pedidos.falhar(ident, RuntimeError(resposta.meta.get("erro")))
+            return
+        # Cria o arquivo com o conteúdo recebido (os bytes vão direto para o disco)
+        with open(filename, "wb") as f:
+            f.write(resposta.conteudo)
+        guardar_tempos(ident, resposta)
+        pedidos.resolver(ident, filename)
 
-        print(f"✅ Arquivo recebido: {filename}")
+    except Exception as e:
+        pedidos.falhar(ident, e)
 
-        # Exibe estatísticas se estivermos esperando resposta deste arquivo
-        if upload_time and pending_filename == filename.replace("CAPS_", ""):
-            size = os.path.getsize(filename)
-            response_time = download_time - upload_time
-            print(f"\n📊 Estatísticas:")
-            print(f"📎 Tamanho: {size} bytes")
-            print(f"⏱️ Tempo de resposta: {response_time:.2f} segundos")
+# Tempos das etapas no servidor (--tempos), guardados no Future do pedido até ele ser concluído
+def guardar_tempos(ident, resposta):
+    futuro = pedidos.obter(ident)
+    if futuro is not None and "tempos" in resposta.meta:
+        futuro.tempos = resposta.meta["tempos"]
 
-    except Exception as e:
-        print(f"❌ Erro ao processar resposta: {e}")
+# "servidor 3.1 ms (fila 0.1 | decodificacao 0.4 | ...) + rede e broker 1.2 ms"
+def formatar_tempos(tempos, duracao):
+    no_servidor = sum(tempos.values())
+    etapas = " | ".join(f"{etapa} {ms:.1f}" for etapa, ms in tempos.items())
+    return f"servidor {no_servidor:.1f} ms ({etapas}) + rede e broker {max(0.0, duracao * 1000 - no_servidor):.1f} ms"
 
-    # Limpa os dados para próxima requisição
-    upload_time = None
-    pending_filename = None
+# Resposta em blocos: INICIO, BLOCO..., FIM (gravados direto no disco)
+def receber_bloco(resposta):
+    ident = resposta.meta.get("transferencia")
+    recepcao = recepcoes.get(ident)
+
+    try:
+        if resposta.tipo == protocolo.TIPO_INICIO:
+            recepcoes[ident] = [transferencia.Remontagem(resposta.nome, resposta.nome, resposta.meta["tamanho"],
+                                                         resposta.meta["tamanho_bloco"]), 0]
+            guardar_tempos(pedido_da_resposta(resposta), resposta)
+        elif recepcao is None:
+            return
+        elif resposta.tipo == protocolo.TIPO_BLOCO:
+            resposta.limite = recepcao[0].tamanho_bloco
+            recepcao[0].gravar(resposta.meta["indice"], resposta.conteudo)
+        elif resposta.tipo == protocolo.TIPO_FIM:
+            remontagem = recepcao[0]
+            faltantes = remontagem.faltantes()
+            if faltantes and recepcao[1] < TENTATIVAS_RESPOSTA:
+                # Pede ao servidor só os blocos que não chegaram (manda o mapa do que já temos)
+                recepcao[1] += 1
+                print(f"🔁 {resposta.nome}: {len(faltantes)} blocos da resposta não chegaram, pedindo reenvio...")
+                # No modo cluster o pedido vai para a instância que guardou a resposta
+                instancia = resposta.meta.get("instancia")
+                topico = transferencia.topico_direto(TOPIC_UPLOAD, instancia) if instancia else TOPIC_UPLOAD
+                client.publish(topico, protocolo.codificar(
+                    resposta.nome, remontagem.recebidos(), protocolo.TIPO_FALTANTES,
+                    {"transferencia": ident}), qos=1)
+                return
+            del recepcoes[ident]
+            if faltantes:
+                remontagem.fechar()
+                pedidos.falhar(pedido_da_resposta(resposta), RuntimeError(
+                    f"Resposta incompleta: {len(faltantes)} blocos não chegaram. Envie o arquivo de novo."))
+            else:
+                pedidos.resolver(pedido_da_resposta(resposta), remontagem.concluir())
+    except Exception as e:
+        recepcoes.pop(ident, None)
+        pedidos.falhar(pedido_da_resposta(resposta), e)
+
+# Espera as respostas dos pedidos. O prazo recomeça a cada mensagem do servidor (uma resposta
+# grande em blocos, ou muitas respostas seguidas, podem levar mais que o prazo para chegar).
+# Pedidos sem resposta dentro do prazo são cancelados; devolve os que foram cancelados.
+def aguardar(futuros):
+    pendentes = {f for f in futuros if not f.done()}
+    while pendentes:
+        prazo = last_activity + TEMPO_RESPOSTA - time.monotonic()
+        if prazo <= 0:
+            break
+        _, pendentes = concurrent.futures.wait(pendentes, timeout=prazo)
+    for futuro in pendentes:
+        pedidos.cancelar(futuro.ident)
+    return pendentes
+
+# Resultado de um pedido já concluído: (arquivo recebido ou None, mensagem de erro ou None)
+def resultado(futuro):
+    if futuro.cancelled():
+        return None, f"sem resposta em {TEMPO_RESPOSTA}s"
+    erro = futuro.exception()
+    if erro is not None:
+        return None, str(erro)
+    return futuro.result(), None
 
 # ==============================
 # SELEÇÃO DO ARQUIVO .TXT
@@ -74,9 +226,95 @@ def select_file():
         print("❌ Arquivo não encontrado.")
         return select_file()
     filename = os.path.basename(path)
-    with open(path, "r", encoding="utf-8") as f:
+    return path, filename
+
+# ==============================
+# ENVIO DO ARQUIVO
+# ==============================
+
+# Arquivo pequeno: uma única mensagem com o arquivo inteiro
+def send_message(path, filename, ident):
+    # Lê os bytes do arquivo (o servidor espera texto UTF-8)
+    with open(path, "rb") as f:
         content = f.read()
-    return filename, content
+
+    # Monta a mensagem: formato binário (bytes do arquivo sem base64) ou o formato antigo
+    if args.legado:
+        payload = protocolo.codificar_legado(filename, content)
+    else:
+        payload = protocolo.codificar(filename, content, meta=dict(pedido_meta, id=ident), codec=args.compressao)
+
+    # Publica a mensagem no tópico de upload do servidor
+    client.publish(TOPIC_UPLOAD, payload)
+
+# Quantos envios em blocos do arquivo `chave` já terminaram (entra no identificador da
+# transferência). Fica gravado em ARQUIVO_ENVIOS: o mesmo arquivo enviado de novo depois de
+# concluído recebe outro identificador, mesmo depois de reiniciar o cliente, enquanto um envio
+# interrompido mantém o seu e pode ser retomado.
+def sequencia_envio(chave, concluido=False):
+    with lock_envios:
+        try:
+            with open(ARQUIVO_ENVIOS, encoding="utf-8") as f:
+                concluidos = json.load(f)
+        except (OSError, ValueError):
+            concluidos = {}
+        if concluido:
+            concluidos[chave] = concluidos.get(chave, 0) + 1
+            # Grava num temporário e troca de uma vez (um arquivo pela metade nunca fica em disco)
+            with open(ARQUIVO_ENVIOS + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(concluidos, f)
+            os.replace(ARQUIVO_ENVIOS + ".tmp", ARQUIVO_ENVIOS)
+        return concluidos.get(chave, 0)
+
+# Arquivo grande: em blocos, lendo do disco só os blocos da janela. Cada arquivo tem o seu Envio,
+# registrado pelo identificador da transferência enquanto espera as confirmações do servidor.
+def send_chunked(path, filename, ident, progresso=None):
+    tamanho_bloco = args.bloco * 1024
+    chave = transferencia.identificador(client_id, path, tamanho_bloco)
+    while True:
+        envio = transferencia.Envio(client, TOPIC_UPLOAD, path, filename,
+                                    transferencia.identificador(client_id, path, tamanho_bloco, sequencia_envio(chave)),
+                                    tamanho_bloco, args.janela, dict(pedido_meta, id=ident), args.compressao)
+        envios[envio.transferencia] = envio
+        try:
+            envio.executar(progresso)
+            break
+        except transferencia.JaConcluida:
+            # O servidor já tinha concluído esta sequência (ex: ARQUIVO_ENVIOS foi apagado): vai a seguinte
+            sequencia_envio(chave, concluido=True)
+        finally:
+            envios.pop(envio.transferencia, None)
+    sequencia_envio(chave, concluido=True)
+    if envio.ja_tinha:
+        print(f"↩️ {filename}: transferência retomada, {envio.ja_tinha} blocos já estavam no servidor.")
+    if envio.reenvios:
+        print(f"🔁 {filename}: blocos reenviados: {envio.reenvios}")
+
+# Registra o pedido e envia o arquivo (em blocos se for grande; o formato antigo não tem blocos).
+# Sem vaga para mais um pedido, espera uma resposta até o prazo (Lotado se nenhuma chegar).
+# Com `paralelo`, um arquivo grande é enviado numa thread própria e send_file retorna logo: os
+# envios em blocos do lote andam ao mesmo tempo, limitados pelas vagas do Correlacionador.
+def send_file(path, filename, progresso=None, paralelo=False):
+    # No formato antigo a resposta não traz o ID: o pedido é identificado pelo nome do arquivo
+    espera = max(0, last_activity + TEMPO_RESPOSTA - time.monotonic())
+    ident, futuro = pedidos.novo(filename if args.legado else None, espera=espera)
+    futuro.tempos = None            # Tempos das etapas no servidor (com --tempos)
+    em_blocos = not args.legado and os.path.getsize(path) > transferencia.LIMITE_MENSAGEM_UNICA
+
+    def enviar():
+        try:
+            if em_blocos:
+                send_chunked(path, filename, ident, progresso)
+            else:
+                send_message(path, filename, ident)
+        except Exception as e:
+            pedidos.falhar(ident, RuntimeError(f"Falha no envio: {e}"))
+
+    if paralelo and em_blocos:
+        threading.Thread(target=enviar, daemon=True, name=f"envio-{ident}").start()
+    else:
+        enviar()
+    return futuro
 
 # ================
 # CONEXÃO AO BROKER
@@ -85,54 +323,143 @@ def select_file():
 # Cria o cliente MQTT com um ID único
 client = mqtt.Client(client_id=client_id)
 
-# Define a função que será chamada quando uma mensagem for recebida
+# Define as funções que serão chamadas na conexão e quando uma mensagem for recebida
+client.on_connect = on_connect
 client.on_message = on_message
+client.on_subscribe = on_subscribe
 
 # Conecta ao broker MQTT
 print("🔌 Conectando ao broker...")
-client.connect(BROKER, PORT, 60)
-
-# Inscreve-se no tópico de download exclusivo deste cliente
-client.subscribe(TOPIC_DOWNLOAD)
+client.connect(args.broker, args.porta, 60)
 
 # Inicia o loop em segundo plano para lidar com eventos MQTT
+# (a inscrição no tópico de download exclusivo deste cliente é feita em on_connect)
 client.loop_start()
+# Um pedido publicado antes da inscrição pode ter a resposta descartada pelo broker (no modo em
+# lote o primeiro arquivo sai logo em seguida, e uma resposta do cache volta em milissegundos)
+if not inscrito.wait(TEMPO_RESPOSTA):
+    print("⚠️ O broker não confirmou a inscrição no tópico de download.")
 print(f"✅ Cliente '{client_id}' conectado.\n")
 
 # ==============================
-# LOOP PRINCIPAL
+# MODO INTERATIVO
 # ==============================
 
-# Loop principal da aplicação (permite enviar arquivos até o usuário desejar sair)
-try:
+# Pergunta um arquivo por vez e espera a resposta antes de perguntar o próximo
+def modo_interativo():
     while True:
-        filename, content = select_file()
+        path, filename = select_file()
         if not filename:
             print("👋 Encerrando cliente.")
             break
 
-        # Codifica o conteúdo do arquivo em base64 para envio seguro via MQTT
-        encoded_data = base64.b64encode(content.encode()).decode()
+        def progresso(confirmados, total):
+            print(f"\r📦 Blocos confirmados: {confirmados}/{total}", end="" if confirmados < total else "\n",
+                  flush=True)
+
+        futuro = send_file(path, filename, progresso)
+        if not futuro.done():
+            print(f"📤 Arquivo '{filename}' enviado. Aguardando resposta...\n")
+        aguardar([futuro])
+
+        recebido, erro = resultado(futuro)
+        if futuro.cancelled():
+            print(f"⚠️ Tempo limite excedido ({TEMPO_RESPOSTA}s).\n")
+        elif erro:
+            print(f"❌ O servidor não conseguiu processar '{filename}': {erro}")
+        else:
+            print(f"✅ Arquivo recebido: {recebido}")
+            print(f"\n📊 Estatísticas:")
+            print(f"📎 Tamanho: {os.path.getsize(recebido)} bytes")
+            print(f"⏱️ Tempo de resposta: {futuro.duracao * 1000:.1f} ms")
+            if futuro.tempos:
+                print(f"🖥️ Divisão: {formatar_tempos(futuro.tempos, futuro.duracao)}")
 
-        # Armazena informações para estatísticas
-        pending_filename = filename
-        upload_time = time.time()
+# ==============================
+# MODO EM LOTE
+# ==============================
 
-        # Publica a mensagem no tópico de upload do servidor
-        client.publish(TOPIC_UPLOAD, f"{filename};{encoded_data}")
-        print(f"📤 Arquivo '{filename}' enviado. Aguardando resposta...\n")
+# Expande os padrões (o shell do Windows não expande *.txt) e ignora o que não for arquivo
+def arquivos_do_lote(padroes):
+    caminhos = []
+    for padrao in padroes:
+        for caminho in sorted(glob.glob(padrao)) or [padrao]:
+            if os.path.isfile(caminho):
+                caminhos.append(caminho)
+            else:
+                print(f"❌ Arquivo não encontrado: {caminho}")
+    return caminhos
+
+# Envia todos os arquivos sem esperar cada resposta (no máximo --max-em-voo aguardando ao mesmo
+# tempo) e mostra o tempo de ida e volta de cada um
+def modo_lote(caminhos):
+    inicio = time.perf_counter()
+    enviados = []                # (nome, futuro) na ordem de envio
+
+    # Mostra cada resultado assim que ele chega (roda na thread de rede do paho)
+    def ao_concluir(futuro, filename):
+        recebido, erro = resultado(futuro)
+        if not erro:
+            divisao = f" ({formatar_tempos(futuro.tempos, futuro.duracao)})" if futuro.tempos else ""
+            print(f"✅ {recebido}: {futuro.duracao * 1000:.1f} ms{divisao}")
+        elif not futuro.cancelled():
+            print(f"❌ {filename}: {erro}")
+
+    for path in caminhos:
+        filename = os.path.basename(path)
+        try:
+            try:
+                futuro = send_file(path, filename, paralelo=True)
+            except Lotado:
+                # Nenhuma resposta dentro do prazo: os pedidos pendentes são dados como perdidos
+                aguardar([f for _, f in enviados])
+                futuro = send_file(path, filename, paralelo=True)
+        except ValueError as e:
+            # Formato antigo: dois arquivos com o mesmo nome não podem aguardar resposta juntos
+            print(f"❌ {filename}: {e}")
+            continue
+        futuro.add_done_callback(lambda f, nome=filename: ao_concluir(f, nome))
+        enviados.append((filename, futuro))
+
+    aguardar([f for _, f in enviados])
+    exibir_relatorio(enviados, time.perf_counter() - inicio)
+
+# Tempo de ida e volta de cada arquivo (ms) e um resumo do lote
+def exibir_relatorio(enviados, duracao):
+    tempos = []
+    etapas = {}                  # etapa -> [ms no servidor de cada arquivo] (com --tempos)
+    print(f"\n📊 Relatório do lote ({len(enviados)} arquivos, até {args.max_em_voo} aguardando resposta):")
+    for filename, futuro in enviados:
+        recebido, erro = resultado(futuro)
+        if erro:
+            print(f"   {filename:<30} {'-':>12}  {erro}")
+        else:
+            tempos.append(futuro.duracao * 1000)
+            print(f"   {filename:<30} {tempos[-1]:>9.1f} ms  {os.path.getsize(recebido)} bytes")
+            for etapa, ms in (futuro.tempos or {}).items():
+                etapas.setdefault(etapa, []).append(ms)
+
+    print(f"\n✅ Respostas: {len(tempos)}/{len(enviados)} em {duracao:.2f} s "
+          f"({len(enviados) / duracao if duracao else 0:.1f} arquivos/s)")
+    if tempos:
+        tempos.sort()
+        p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+        print(f"⏱️ Ida e volta: mín {tempos[0]:.1f} ms | média {sum(tempos) / len(tempos):.1f} ms | "
+              f"p95 {p95:.1f} ms | máx {tempos[-1]:.1f} ms")
+    if etapas:
+        print("🖥️ No servidor (média por arquivo): " +
+              " | ".join(f"{etapa} {sum(valores) / len(valores):.1f} ms" for etapa, valores in etapas.items()))
 
-        # Aguarda a resposta do servidor por até 20 segundos
-        wait = 0
-        while upload_time and wait < 20:
-            time.sleep(1)
-            wait += 1
+# ==============================
+# LOOP PRINCIPAL
+# ==============================
 
-        # Caso não haja resposta dentro do tempo limite
-        if upload_time:
-            print("⚠️ Tempo limite excedido (20s).\n")
-            upload_time = None
-            pending_filename = None
+# Modo em lote (--lote) ou interativo (permite enviar arquivos até o usuário desejar sair)
+try:
+    if args.lote:
+        modo_lote(arquivos_do_lote(args.lote))
+    else:
+        modo_interativo()
 
 # Permite que o programa seja interrompido com Ctrl+C
 except KeyboardInterrupt:
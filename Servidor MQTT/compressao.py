@@ -0,0 +1,162 @@
+# compressao.py
+# Compressão do conteúdo das mensagens binárias de protocolo.py.
+# Arquivos de texto comprimem muito bem, e pela VPN cada byte a menos no broker conta. zlib vem
+# da biblioteca padrão; zstd (pip install zstandard) é usado quando estiver instalado.
+#
+# O codec vai nos 2 bits mais baixos das flags do cabeçalho (0 = sem compressão), então quem
+# recebe sabe como decodificar sem olhar os metadados. O crc32 do cabeçalho é calculado sobre os
+# bytes transmitidos (já comprimidos). Conteúdos menores que TAMANHO_MINIMO vão sem compressão,
+# e o servidor responde com o mesmo codec do pedido.
+
+import zlib
+
+try:
+    import zstandard                    # Dependência opcional: comprime e descomprime mais rápido
+except ImportError:
+    zstandard = None
+
+# Conteúdos menores que isso não compensam a compressão
+TAMANHO_MINIMO = 1024
+
+# Níveis de compressão (zlib: 1 a 9; zstd: 1 a 22). Valores baixos: pouca CPU, boa taxa para texto.
+NIVEL_ZLIB = 6
+NIVEL_ZSTD = 3
+
+# Um conteúdo que descomprimido passe disso é recusado (protege contra "bombas" de compressão).
+# É só o limite geral: quem sabe quanto espera receber passa um menor a descomprimir_blocos()
+# (o servidor usa o tamanho do bloco da transferência, ou o limite de uma mensagem única).
+LIMITE_DESCOMPRIMIDO = 64 * 1024 * 1024
+
+# Valor de cada codec nas flags do cabeçalho
+CODECS = {"zlib": 1, "zstd": 2}
+MASCARA = 0x03
+
+# Codecs disponíveis nesta instalação, na ordem de preferência
+DISPONIVEIS = [nome for nome, modulo in (("zstd", zstandard), ("zlib", zlib)) if modulo]
+PADRAO = DISPONIVEIS[0]
+
+
+def flag(codec):
+    return CODECS[codec] if codec else 0
+
+
+# Codec indicado nas flags do cabeçalho (None = sem compressão).
+# ValueError se for desconhecido ou não estiver instalado aqui.
+def codec_das_flags(flags):
+    valor = flags & MASCARA
+    if not valor:
+        return None
+    for nome, bits in CODECS.items():
+        if bits == valor:
+            if nome not in DISPONIVEIS:
+                raise ValueError(f"Compressão {nome} não disponível (pip install zstandard)")
+            return nome
+    raise ValueError(f"Compressão desconhecida nas flags: {valor}")
+
+
+# Comprime aos poucos: cada parte entregue a comprimir() devolve o que já estiver pronto
+class Compressor:
+
+    def __init__(self, codec):
+        if codec == "zstd":
+            self.objeto = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+        else:
+            self.objeto = zlib.compressobj(NIVEL_ZLIB)
+
+    def comprimir(self, dados):
+        return self.objeto.compress(dados)
+
+    def finalizar(self):
+        return self.objeto.flush()
+
+
+def comprimir(dados, codec):
+    compressor = Compressor(codec)
+    return compressor.comprimir(dados) + compressor.finalizar()
+
+
+# Descomprime em partes de até `tamanho` bytes, recusando um conteúdo que passe de `limite` bytes
+# (None = LIMITE_DESCOMPRIMIDO). Nenhum passo produz mais que `tamanho` (nem mais que `limite` + 1)
+# bytes e o total é conferido a cada passo, então uma "bomba" (poucos bytes que viram gigabytes) é
+# recusada antes de ocupar a memória. Erros do zlib e do zstd viram ValueError, para quem chama
+# tratar os dois do mesmo jeito.
+def descomprimir_blocos(dados, codec, tamanho, limite=None):
+    if limite is None:
+        limite = LIMITE_DESCOMPRIMIDO
+    tamanho = max(1, min(tamanho, limite + 1))
+    partes = _descomprimir_zstd(dados, tamanho) if codec == "zstd" else _descomprimir_zlib(dados, tamanho)
+    total = 0
+    try:
+        for saida in partes:
+            total += len(saida)
+            if total > limite:
+                raise ValueError(f"Conteúdo descomprimido passa de {limite} bytes")
+            yield saida
+    except zlib.error as e:
+        raise ValueError(str(e))
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise ValueError(str(e))
+        raise
+
+
+# zlib com max_length: a saída de cada chamada nunca passa de `tamanho`
+def _descomprimir_zlib(dados, tamanho):
+    objeto = zlib.decompressobj()
+    for inicio in range(0, len(dados), tamanho):
+        saida = objeto.decompress(dados[inicio:inicio + tamanho], tamanho)
+        while True:
+            if saida:
+                yield saida
+            if not objeto.unconsumed_tail:
+                break
+            saida = objeto.decompress(objeto.unconsumed_tail, tamanho)
+    # Confere se o conteúdo comprimido terminou (uma mensagem cortada não passa despercebida)
+    if not objeto.eof:
+        raise ValueError("Conteúdo comprimido incompleto")
+    if objeto.unused_data:
+        raise ValueError("Bytes extras depois do fim do conteúdo comprimido")
+
+
+# zstd: o decompressobj() do zstandard não tem limite de saída, então a leitura é feita com
+# stream_reader, que entrega no máximo `tamanho` bytes por read()
+def _descomprimir_zstd(dados, tamanho):
+    # O stream_reader não avisa quando o conteúdo acaba no meio do quadro: confere antes
+    _conferir_quadro_zstd(dados)
+    leitor = zstandard.ZstdDecompressor().stream_reader(dados, read_size=tamanho)
+    while True:
+        saida = leitor.read(tamanho)
+        if not saida:
+            break
+        yield saida
+
+
+# Percorre o cabeçalho e os cabeçalhos dos blocos de um quadro zstd (RFC 8878) sem descomprimir
+# nada. ValueError se o conteúdo terminar antes do último bloco ou tiver bytes sobrando depois dele.
+def _conferir_quadro_zstd(dados):
+    dados = memoryview(dados)
+    if len(dados) < 5 or bytes(dados[:4]) != b"\x28\xb5\x2f\xfd":
+        raise ValueError("Conteúdo zstd inválido")
+    descritor = dados[4]
+    unico_segmento = descritor & 0x20
+    posicao = 5 + (0 if unico_segmento else 1)              # Window_Descriptor
+    posicao += (0, 1, 2, 4)[descritor & 0x03]              # Dictionary_ID
+    posicao += (1 if unico_segmento else 0, 2, 4, 8)[descritor >> 6]  # Frame_Content_Size
+    while True:
+        if posicao + 3 > len(dados):
+            raise ValueError("Conteúdo comprimido incompleto")
+        bloco = int.from_bytes(dados[posicao:posicao + 3], "little")
+        # Bloco RLE (tipo 1) tem um só byte de dados; os outros têm o tamanho indicado
+        posicao += 3 + (1 if (bloco >> 1) & 0x03 == 1 else bloco >> 3)
+        if bloco & 0x01:                                    # Último bloco do quadro
+            break
+    if descritor & 0x04:                                    # Content_Checksum
+        posicao += 4
+    if posicao > len(dados):
+        raise ValueError("Conteúdo comprimido incompleto")
+    if posicao < len(dados):
+        raise ValueError("Bytes extras depois do fim do conteúdo comprimido")
+
+
+def descomprimir(dados, codec, limite=None):
+    return b"".join(descomprimir_blocos(dados, codec, 1024 * 1024, limite))
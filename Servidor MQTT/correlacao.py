@@ -0,0 +1,86 @@
+# correlacao.py
+# Correlação entre pedidos e respostas MQTT, usada por cliente.py e app_web_server.py.
+#
+# Cada pedido recebe um ID, enviado em metadados["id"] e devolvido pelo servidor na resposta
+# (protocolo.CAMPOS_ECO). O remetente guarda um Future por ID; quando a resposta chega, o
+# on_message resolve o Future certo e quem está esperando acorda na hora, sem ficar consultando
+# um dicionário em intervalos. Vários pedidos podem estar pendentes ao mesmo tempo, até um limite.
+
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+
+class Lotado(Exception):
+    pass
+
+
+class Correlacionador:
+
+    def __init__(self, max_pendentes=None):
+        self._pendentes = {}            # ID -> Future
+        self._lock = threading.Lock()
+        # Vagas para pedidos pendentes (None = sem limite)
+        self._vagas = threading.BoundedSemaphore(max_pendentes) if max_pendentes else None
+
+    # Registra um pedido novo e devolve (ID, Future). Sem vaga, espera até `espera` segundos
+    # (None = o tempo que for preciso, 0 = não espera) e então levanta Lotado.
+    # `ident` permite usar um ID já conhecido (ex: o nome do arquivo no formato antigo, que não tem ID);
+    # ValueError se já houver um pedido pendente com ele.
+    def novo(self, ident=None, espera=None):
+        if self._vagas is not None and not self._vagas.acquire(timeout=espera):
+            raise Lotado("Limite de pedidos pendentes atingido")
+        futuro = Future()
+        futuro.ident = ident or uuid.uuid4().hex[:16]
+        futuro.inicio = time.perf_counter()
+        futuro.duracao = None           # Segundos entre novo() e a resposta
+        with self._lock:
+            repetido = futuro.ident in self._pendentes
+            if not repetido:
+                self._pendentes[futuro.ident] = futuro
+        if repetido:
+            if self._vagas is not None:
+                self._vagas.release()
+            raise ValueError(f"Já existe um pedido pendente para {futuro.ident}")
+        return futuro.ident, futuro
+
+    # Futuro de um pedido ainda pendente (ou None)
+    def obter(self, ident):
+        with self._lock:
+            return self._pendentes.get(ident)
+
+    # Entrega a resposta ao pedido. Devolve False se o ID não estiver pendente (resposta atrasada,
+    # de outro remetente ou repetida).
+    def resolver(self, ident, valor):
+        futuro = self._retirar(ident)
+        if futuro is None:
+            return False
+        futuro.set_result(valor)
+        return True
+
+    def falhar(self, ident, erro):
+        futuro = self._retirar(ident)
+        if futuro is None:
+            return False
+        futuro.set_exception(erro)
+        return True
+
+    # Desiste de um pedido (tempo esgotado): libera a vaga e descarta uma resposta que chegue depois
+    def cancelar(self, ident):
+        futuro = self._retirar(ident)
+        if futuro is not None:
+            futuro.cancel()
+
+    def pendentes(self):
+        with self._lock:
+            return len(self._pendentes)
+
+    def _retirar(self, ident):
+        with self._lock:
+            futuro = self._pendentes.pop(ident, None)
+        if futuro is not None:
+            futuro.duracao = time.perf_counter() - futuro.inicio
+            if self._vagas is not None:
+                self._vagas.release()
+        return futuro
@@ -0,0 +1,203 @@
+# metricas.py
+# Instrumentação do servidor MQTT: cada mensagem tem as suas etapas cronometradas (relógio
+# monotônico, time.perf_counter) e os tempos são somados em histogramas por etapa, junto com
+# contadores de mensagens, bytes recebidos e enviados e erros.
+# As métricas ficam disponíveis de dois jeitos (ver servidor.py):
+#   - em /metrics, no formato texto do Prometheus, num servidor HTTP local (--metricas-porta);
+#   - resumidas (média e p95 de cada etapa) no relatório de carga publicado periodicamente em
+#     servidores/<instância>/carga, ao estilo dos tópicos $SYS do Mosquitto.
+#
+# Etapas de um pedido numa única mensagem:
+#   fila           da chegada em on_message até um worker retirar a mensagem da fila
+#   decodificacao  cabeçalho, crc32, base64 (formato antigo) e descompressão do conteúdo
+#   cache          cálculo da chave e consulta ao cache de resultados
+#   transformacao  conversão do texto (transformacoes.py)
+#   gravacao       escrita do arquivo CAPS_... em disco
+#   codificacao    montagem da resposta (compressão e base64 incluídas)
+#   publicacao     entrega da resposta ao paho
+# Nas transferências em blocos, "transformacao" inclui a leitura e a gravação do arquivo em disco.
+
+import bisect                           # Localiza o intervalo (bucket) do histograma de cada tempo
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Endpoint /metrics
+
+# Limites superiores (em segundos) dos intervalos do histograma de cada etapa
+INTERVALOS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Contadores do relatório de carga (mantidos com estes nomes por compatibilidade)
+CONTADORES = ("recebidas", "processadas", "rejeitadas", "erros")
+
+
+# Tempos das etapas de uma mensagem. Cada marcar() atribui à etapa o tempo desde a marcação
+# anterior; uma etapa marcada várias vezes (ex: a cada bloco do arquivo) acumula os tempos.
+# Só tem dicionários e números: pode voltar de um processo do pool (modo "processos").
+class Cronometro:
+
+    def __init__(self, inicio=None):
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.ultimo = self.inicio
+        self.etapas = {}                # etapa -> segundos
+
+    def marcar(self, etapa):
+        agora = time.perf_counter()
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + agora - self.ultimo
+        self.ultimo = agora
+
+    # Junta os tempos de outro cronômetro (ex: o do processo que transformou o arquivo)
+    def somar(self, etapas):
+        for etapa, segundos in etapas.items():
+            self.etapas[etapa] = self.etapas.get(etapa, 0.0) + segundos
+        self.ultimo = time.perf_counter()
+
+    def total(self):
+        return self.ultimo - self.inicio
+
+    # Tempos em milissegundos, como vão na resposta ao cliente (metadados["tempos"])
+    def em_ms(self):
+        return {etapa: round(segundos * 1000, 3) for etapa, segundos in self.etapas.items()}
+
+    # Gerador que repassa os blocos de `blocos` marcando `etapa` a cada um: o tempo gasto para
+    # produzir o bloco (ex: decodificar) fica separado do tempo de quem o consome
+    def medir(self, blocos, etapa):
+        for bloco in blocos:
+            self.marcar(etapa)
+            yield bloco
+        self.marcar(etapa)
+
+
+class Metricas:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = dict.fromkeys(CONTADORES, 0)
+        self._mensagens = {}            # (tipo, resultado) -> quantidade
+        self._histogramas = {}          # (tipo, etapa) -> [quantidade por intervalo..., acima do último]
+        self._somas = {}                # (tipo, etapa) -> soma dos tempos (segundos)
+        self._bytes_recebidos = 0
+        self._bytes_enviados = 0
+        self._inicio = time.time()
+
+    # Chamado por on_message para cada mensagem que chega (antes de entrar na fila)
+    def recebida(self, tamanho):
+        with self._lock:
+            self._contadores["recebidas"] += 1
+            self._bytes_recebidos += tamanho
+
+    def contar(self, nome):
+        with self._lock:
+            self._contadores[nome] += 1
+
+    # Chamado quando um worker termina uma mensagem. `tipo`: "arquivo" ou o tipo da mensagem de
+    # transferência; `resultado`: "ok", "cache" ou "erro"; `enviados`: bytes publicados em resposta.
+    def registrar(self, tipo, resultado, cronometro, enviados=0):
+        etapas = dict(cronometro.etapas, total=cronometro.total())
+        with self._lock:
+            chave = (tipo, resultado)
+            self._mensagens[chave] = self._mensagens.get(chave, 0) + 1
+            self._bytes_enviados += enviados
+            for etapa, segundos in etapas.items():
+                chave = (tipo, etapa)
+                histograma = self._histogramas.get(chave)
+                if histograma is None:
+                    histograma = self._histogramas[chave] = [0] * (len(INTERVALOS) + 1)
+                histograma[bisect.bisect_left(INTERVALOS, segundos)] += 1
+                self._somas[chave] = self._somas.get(chave, 0.0) + segundos
+
+    def contadores(self):
+        with self._lock:
+            return dict(self._contadores, bytes_recebidos=self._bytes_recebidos, bytes_enviados=self._bytes_enviados)
+
+    # Média e p95 (ms) de cada etapa, para o relatório de carga. O p95 é o limite superior do
+    # intervalo do histograma em que ele cai (uma estimativa por cima).
+    def resumo(self):
+        with self._lock:
+            histogramas = {chave: list(valores) for chave, valores in self._histogramas.items()}
+            somas = dict(self._somas)
+        resumo = {}
+        for (tipo, etapa), valores in sorted(histogramas.items()):
+            quantidade = sum(valores)
+            acumulado, p95 = 0, None
+            for limite, valor in zip(INTERVALOS + (None,), valores):
+                acumulado += valor
+                if acumulado >= 0.95 * quantidade:
+                    p95 = round(limite * 1000, 3) if limite is not None else None
+                    break
+            resumo.setdefault(tipo, {})[etapa] = {"quantidade": quantidade,
+                                                  "media_ms": round(somas[(tipo, etapa)] / quantidade * 1000, 3),
+                                                  "p95_ms": p95}
+        return resumo
+
+    # Texto no formato de exposição do Prometheus. `adicionais` é uma lista de
+    # (nome, tipo, ajuda, valor) com métricas de outros módulos (fila, cache...).
+    def exportar(self, adicionais=()):
+        with self._lock:
+            contadores = dict(self._contadores)
+            mensagens = sorted(self._mensagens.items())
+            histogramas = {chave: list(valores) for chave, valores in self._histogramas.items()}
+            somas = dict(self._somas)
+            recebidos, enviados = self._bytes_recebidos, self._bytes_enviados
+
+        linhas = [
+            "# HELP mqtt_mensagens_total Mensagens tratadas pelos workers, por tipo e resultado.",
+            "# TYPE mqtt_mensagens_total counter",
+        ]
+        linhas += [f'mqtt_mensagens_total{{tipo="{tipo}",resultado="{resultado}"}} {quantidade}'
+                   for (tipo, resultado), quantidade in mensagens]
+
+        linhas += [
+            "# HELP mqtt_duracao_etapa_segundos Tempo de cada etapa do tratamento de uma mensagem.",
+            "# TYPE mqtt_duracao_etapa_segundos histogram",
+        ]
+        for tipo, etapa in sorted(histogramas):
+            rotulos = f'tipo="{tipo}",etapa="{etapa}"'
+            # O formato do Prometheus usa contagens acumuladas: cada intervalo inclui os anteriores
+            acumulado = 0
+            for limite, quantidade in zip(INTERVALOS + ("+Inf",), histogramas[(tipo, etapa)]):
+                acumulado += quantidade
+                linhas.append(f'mqtt_duracao_etapa_segundos_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+            linhas.append(f"mqtt_duracao_etapa_segundos_sum{{{rotulos}}} {somas[(tipo, etapa)]:.6f}")
+            linhas.append(f"mqtt_duracao_etapa_segundos_count{{{rotulos}}} {acumulado}")
+
+        fixas = [
+            ("mqtt_recebidas_total", "counter", "Mensagens recebidas do broker.", contadores["recebidas"]),
+            ("mqtt_rejeitadas_total", "counter", "Mensagens descartadas com a fila cheia.", contadores["rejeitadas"]),
+            ("mqtt_erros_total", "counter", "Mensagens que terminaram em erro.", contadores["erros"]),
+            ("mqtt_bytes_recebidos_total", "counter", "Bytes de payload recebidos do broker.", recebidos),
+            ("mqtt_bytes_enviados_total", "counter", "Bytes de payload publicados em respostas.", enviados),
+            ("mqtt_inicio_segundos", "gauge", "Horário (epoch) em que o servidor foi iniciado.", self._inicio),
+        ]
+        for nome, tipo, ajuda, valor in fixas + list(adicionais):
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {valor}"]
+        return ("\n".join(linhas) + "\n").encode("utf-8")
+
+
+# ==========================
+# ENDPOINT HTTP
+# ==========================
+
+# Servidor HTTP mínimo numa thread própria, só com GET /metrics. `adicionais()` é chamada a cada
+# leitura e devolve as métricas de outros módulos no formato aceito por Metricas.exportar().
+def iniciar_http(metricas, host, porta, adicionais=lambda: ()):
+
+    class Atendente(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = metricas.exportar(adicionais())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        # Sem uma linha no terminal a cada leitura do Prometheus
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, porta), Atendente)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas").start()
+    return servidor
@@ -0,0 +1,326 @@
+# protocolo.py
+# Formato das mensagens trocadas entre cliente.py, app_web_server.py e servidor.py.
+#
+# Formato binário (versão 1): um cabeçalho fixo seguido do nome do arquivo, dos metadados e
+# do conteúdo, sem base64 (os bytes do arquivo vão como estão, sem os 33% a mais).
+#
+#   campo          tamanho   descrição
+#   mágico         2 bytes   0xFF 'M' (0xFF nunca aparece em texto UTF-8: não confunde com o formato antigo)
+#   versão         1 byte    versão do formato (1)
+#   tipo           1 byte    ARQUIVO (pedido), RESPOSTA, ERRO ou uma mensagem de transferência em blocos
+#   flags          1 byte    opções do conteúdo: bits 0-1 = compressão (ver compressao.py)
+#   nome           2 bytes   tamanho do nome do arquivo (UTF-8)
+#   metadados      4 bytes   tamanho dos metadados (JSON UTF-8, pode ser 0)
+#   conteúdo       4 bytes   tamanho do conteúdo
+#   crc32          4 bytes   soma de verificação do conteúdo (como transmitido, comprimido ou não)
+#   ... seguidos do nome, dos metadados e do conteúdo
+#
+# Formato antigo (texto): "nome;base64" ou "nome;base64;client_id". O decodificar() aceita os
+# dois, e o servidor responde sempre no mesmo formato do pedido, para que clientes antigos
+# continuem funcionando durante a troca.
+#
+# Arquivos grandes vão em blocos (ver transferencia.py), com os tipos INICIO, BLOCO, FIM,
+# CONFIRMACAO e FALTANTES. Todos levam o identificador da transferência em metadados["transferencia"].
+#
+# Um pedido com metadados["andamento"] recebe, antes da resposta, mensagens ANDAMENTO (sem conteúdo)
+# com cada etapa do processamento no servidor; o app web as repassa ao navegador.
+#
+# O conteúdo pode ir comprimido (codec nas flags). Quem recebe não precisa fazer nada: `conteudo`
+# e blocos() já devolvem os bytes descomprimidos. A resposta usa o codec do pedido (codec_resposta).
+
+import base64                   # Formato antigo
+import binascii                 # base64 em partes (formato antigo processado aos poucos)
+import json                     # Metadados (ID de correlação, opções do pedido...)
+import struct                   # Cabeçalho binário
+import zlib                     # crc32 do conteúdo
+
+import compressao               # Compressão opcional do conteúdo (zlib, zstd)
+
+MAGICO = b"\xffM"
+VERSAO = 1
+
+# Tipos de mensagem
+TIPO_ARQUIVO = 1                # Pedido: arquivo enviado para processamento
+TIPO_RESPOSTA = 2               # Arquivo processado devolvido pelo servidor
+TIPO_ERRO = 3                   # Falha no processamento (mensagem em metadados["erro"])
+TIPO_INICIO = 4                 # Início de uma transferência em blocos (tamanho e tamanho do bloco nos metadados)
+TIPO_BLOCO = 5                  # Um bloco do arquivo (metadados["indice"])
+TIPO_FIM = 6                    # Todos os blocos foram enviados
+TIPO_CONFIRMACAO = 7            # Blocos gravados pelo destino (metadados["indices"] ou metadados["completa"])
+TIPO_FALTANTES = 8              # Estado da transferência: conteúdo é o mapa de bits dos blocos já recebidos
+TIPO_ANDAMENTO = 9              # Etapa do processamento no servidor (metadados["etapa"], "feito" e "total" em bytes)
+
+# Tipos que fazem parte de uma transferência em blocos
+TIPOS_TRANSFERENCIA = (TIPO_INICIO, TIPO_BLOCO, TIPO_FIM, TIPO_CONFIRMACAO, TIPO_FALTANTES)
+
+# Nome de cada tipo (logs e métricas)
+NOMES_TIPOS = {TIPO_ARQUIVO: "arquivo", TIPO_RESPOSTA: "resposta", TIPO_ERRO: "erro", TIPO_INICIO: "inicio",
+               TIPO_BLOCO: "bloco", TIPO_FIM: "fim", TIPO_CONFIRMACAO: "confirmacao", TIPO_FALTANTES: "faltantes",
+               TIPO_ANDAMENTO: "andamento"}
+
+# mágico, versão, tipo, flags, tamanho do nome, dos metadados e do conteúdo, crc32 (big-endian)
+CABECALHO = struct.Struct("!2sBBBHIII")
+
+# Campos dos metadados do pedido que o servidor devolve na resposta (correlação pedido/resposta)
+CAMPOS_ECO = ("id", "transferencia")
+
+
+class ErroProtocolo(ValueError):
+    pass
+
+
+# Uma mensagem decodificada. `conteudo` é uma memoryview sobre o payload recebido (sem cópia):
+# pode ser gravada direto num arquivo, ou convertida com bytes(...) / str(..., "utf-8").
+# No formato antigo o base64 só é decodificado quando `conteudo` é usado; blocos() o decodifica
+# aos poucos, sem nunca ter o arquivo inteiro decodificado na memória. O mesmo vale para um
+# conteúdo comprimido, que é recusado se descomprimido passar de `limite` bytes (None = o limite
+# geral de compressao.py). Quem só descobre o tamanho esperado depois de ver o tipo da mensagem
+# (ex: o tamanho do bloco de uma transferência) ajusta `limite` antes de usar o conteúdo.
+class Quadro:
+
+    __slots__ = ("tipo", "nome", "_conteudo", "_base64", "_comprimido", "meta", "flags", "legado", "limite")
+
+    def __init__(self, tipo, nome, conteudo, meta=None, flags=0, legado=False, base64=None, comprimido=None,
+                 limite=None):
+        self.tipo = tipo
+        self.nome = nome
+        self._conteudo = conteudo
+        self._base64 = base64           # Formato antigo: o base64 ainda não decodificado
+        self._comprimido = comprimido   # Conteúdo comprimido ainda não descomprimido
+        self.meta = meta or {}
+        self.flags = flags
+        self.legado = legado            # True se veio no formato antigo "nome;base64"
+        self.limite = limite            # Máximo de bytes do conteúdo descomprimido
+
+    # Codec em que o conteúdo chegou (None = sem compressão)
+    @property
+    def codec(self):
+        return compressao.codec_das_flags(self.flags)
+
+    @property
+    def conteudo(self):
+        if self._conteudo is None:
+            if self._comprimido is not None:
+                self._conteudo = memoryview(b"".join(self.blocos(1024 * 1024)))
+            else:
+                self._conteudo = memoryview(binascii.a2b_base64(self._base64))
+        return self._conteudo
+
+    # Tamanho do conteúdo, se já for conhecido sem decodificar nada (None no formato antigo e com
+    # compressão, enquanto `conteudo` não tiver sido usado)
+    @property
+    def tamanho(self):
+        return len(self._conteudo) if self._conteudo is not None else None
+
+    # O conteúdo em partes de até `tamanho` bytes (no formato antigo, no mínimo 3)
+    def blocos(self, tamanho):
+        if self._conteudo is None and self._comprimido is not None:
+            try:
+                yield from compressao.descomprimir_blocos(self._comprimido, self.codec, tamanho, self.limite)
+            except ValueError as e:
+                raise ErroProtocolo(f"Conteúdo comprimido inválido: {e}")
+        elif self._conteudo is None:
+            # Cada grupo de 4 caracteres de base64 vira 3 bytes, então partes com um múltiplo
+            # de 4 caracteres podem ser decodificadas separadamente (arredondando para baixo,
+            # para nenhuma parte passar de `tamanho` bytes)
+            passo = max(1, tamanho // 3) * 4
+            for inicio in range(0, len(self._base64), passo):
+                yield binascii.a2b_base64(self._base64[inicio:inicio + passo])
+        else:
+            for inicio in range(0, len(self._conteudo), tamanho):
+                yield self._conteudo[inicio:inicio + tamanho]
+
+
+# Monta uma mensagem com o conteúdo escrito aos poucos (ex: conforme é transformado), sem guardar
+# as partes para juntar no final. No formato binário o tamanho e o crc32 do cabeçalho são
+# preenchidos em finalizar(); no antigo, o base64 é gerado a cada 3 bytes completos.
+# Com `codec`, o conteúdo é comprimido conforme é escrito, a partir do momento em que passar de
+# compressao.TAMANHO_MINIMO bytes (até lá fica guardado; um conteúdo menor vai sem compressão).
+class Escritor:
+
+    def __init__(self, nome, tipo=TIPO_ARQUIVO, meta=None, flags=0, legado=False, codec=None):
+        self.legado = legado
+        nome = nome.encode("utf-8")
+        if legado:
+            self.dados = bytearray(nome + b";")
+            self.resto = b""            # Bytes que ainda não completam um grupo de 3
+            return
+        self.meta = meta or {}
+        meta = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+        self.codec = codec
+        self.compressor = None
+        self.pendente = bytearray()     # Início do conteúdo, até decidir se vale comprimir
+        self.campos = (tipo, flags, len(nome), len(meta))
+        self.dados = bytearray(CABECALHO.size)
+        self.dados += nome
+        self.dados += meta
+        self.inicio = len(self.dados)
+        self.crc = 0
+
+    def escrever(self, dados):
+        if self.legado:
+            dados = self.resto + bytes(dados)
+            corte = len(dados) - len(dados) % 3
+            self.dados += binascii.b2a_base64(dados[:corte], newline=False)
+            self.resto = dados[corte:]
+        else:
+            if self.codec and self.compressor is None:
+                self.pendente += dados
+                if len(self.pendente) < compressao.TAMANHO_MINIMO:
+                    return
+                self.compressor = compressao.Compressor(self.codec)
+                tipo, flags, tam_nome, tam_meta = self.campos
+                self.campos = (tipo, flags | compressao.flag(self.codec), tam_nome, tam_meta)
+                dados, self.pendente = self.pendente, None
+            if self.compressor is not None:
+                dados = self.compressor.comprimir(dados)
+            self.dados += dados
+            self.crc = zlib.crc32(dados, self.crc)
+
+    # A mensagem completa (bytearray, aceito pelo publish do paho). `meta` acrescenta metadados que
+    # só se conhecem no fim (ex: os tempos de processamento); como eles vêm antes do conteúdo, o
+    # conteúdo é deslocado dentro do buffer (o formato antigo não tem metadados e os ignora).
+    def finalizar(self, meta=None):
+        if self.legado:
+            self.dados += binascii.b2a_base64(self.resto, newline=False)
+        else:
+            resto = self.compressor.finalizar() if self.compressor is not None else self.pendente
+            self.dados += resto
+            self.crc = zlib.crc32(resto, self.crc)
+            if meta:
+                tipo, flags, tam_nome, tam_meta = self.campos
+                novos = json.dumps(dict(self.meta, **meta), separators=(",", ":")).encode("utf-8")
+                self.dados[self.inicio - tam_meta:self.inicio] = novos
+                self.inicio += len(novos) - tam_meta
+                self.campos = (tipo, flags, tam_nome, len(novos))
+            CABECALHO.pack_into(self.dados, 0, MAGICO, VERSAO, *self.campos,
+                                len(self.dados) - self.inicio, self.crc)
+        return self.dados
+
+
+# Monta uma mensagem no formato binário. Com `codec`, o conteúdo vai comprimido se tiver pelo
+# menos compressao.TAMANHO_MINIMO bytes e a compressão realmente diminuir o tamanho.
+def codificar(nome, conteudo, tipo=TIPO_ARQUIVO, meta=None, flags=0, codec=None):
+    if codec and len(conteudo) >= compressao.TAMANHO_MINIMO:
+        comprimido = compressao.comprimir(conteudo, codec)
+        if len(comprimido) < len(conteudo):
+            conteudo = comprimido
+            flags |= compressao.flag(codec)
+    nome = nome.encode("utf-8")
+    meta = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+    cabecalho = CABECALHO.pack(MAGICO, VERSAO, tipo, flags, len(nome), len(meta), len(conteudo),
+                               zlib.crc32(conteudo))
+    return b"".join((cabecalho, nome, meta, conteudo))
+
+
+# Monta uma mensagem no formato antigo ("nome;base64" ou "nome;base64;client_id")
+def codificar_legado(nome, conteudo, client_id=None):
+    partes = [nome.encode("utf-8"), base64.b64encode(conteudo)]
+    if client_id:
+        partes.append(client_id.encode("utf-8"))
+    return b";".join(partes)
+
+
+# Interpreta uma mensagem recebida em qualquer um dos dois formatos.
+# verificar=False pula o crc32 (usado para ler o nome e o ID de um pedido corrompido e avisar o erro).
+# `limite`: máximo de bytes do conteúdo descomprimido (ver Quadro).
+def decodificar(payload, verificar=True, limite=None):
+    if payload[:len(MAGICO)] == MAGICO:
+        return _decodificar_binario(payload, verificar, limite)
+    return _decodificar_legado(payload)
+
+
+# Tipo de uma mensagem sem decodificá-la nem conferir o crc32 (o formato antigo é sempre um pedido)
+def tipo(payload):
+    if payload[:len(MAGICO)] == MAGICO and len(payload) >= CABECALHO.size:
+        return payload[3]
+    return TIPO_ARQUIVO
+
+
+# Resposta a um pedido, no mesmo formato (e com a mesma compressão) em que o pedido chegou
+def responder(pedido, nome, conteudo, meta=None):
+    if pedido.legado:
+        return codificar_legado(nome, conteudo)
+    return codificar(nome, conteudo, TIPO_RESPOSTA, meta_resposta(pedido, meta), codec=codec_resposta(pedido))
+
+
+# Escritor para a resposta a um pedido, no mesmo formato (e com a mesma compressão) em que o pedido chegou
+def escritor_resposta(pedido, nome, meta=None):
+    return Escritor(nome, TIPO_RESPOSTA, meta_resposta(pedido, meta), legado=pedido.legado,
+                    codec=codec_resposta(pedido))
+
+
+# Codec da resposta: o do conteúdo do pedido ou, para mensagens sem conteúdo comprimido (pedidos
+# pequenos, INICIO/FIM de uma transferência), o pedido em metadados["compressao"] se estiver disponível
+def codec_resposta(pedido):
+    if pedido.legado:
+        return None
+    codec = pedido.codec or pedido.meta.get("compressao")
+    return codec if codec in compressao.DISPONIVEIS else None
+
+
+# Mensagem de erro para um pedido (só existe no formato binário; None para pedidos antigos)
+def responder_erro(pedido, mensagem):
+    if pedido.legado:
+        return None
+    return codificar(pedido.nome, b"", TIPO_ERRO, meta_resposta(pedido, {"erro": mensagem}))
+
+
+# Metadados de uma resposta: os campos de CAMPOS_ECO do pedido mais `meta`
+def meta_resposta(pedido, meta=None):
+    resposta = {campo: pedido.meta[campo] for campo in CAMPOS_ECO if campo in pedido.meta}
+    resposta.update(meta or {})
+    return resposta
+
+
+def _decodificar_binario(payload, verificar, limite):
+    if len(payload) < CABECALHO.size:
+        raise ErroProtocolo("Mensagem menor que o cabeçalho")
+    _, versao, tipo, flags, tam_nome, tam_meta, tam_conteudo, crc = CABECALHO.unpack_from(payload)
+    if versao != VERSAO:
+        raise ErroProtocolo(f"Versão do formato não suportada: {versao}")
+    if CABECALHO.size + tam_nome + tam_meta + tam_conteudo != len(payload):
+        raise ErroProtocolo("Tamanhos do cabeçalho não conferem com a mensagem")
+
+    visao = memoryview(payload)
+    inicio = CABECALHO.size
+    try:
+        nome = str(visao[inicio:inicio + tam_nome], "utf-8")
+        inicio += tam_nome
+        meta = json.loads(str(visao[inicio:inicio + tam_meta], "utf-8")) if tam_meta else {}
+    except ValueError as e:             # UnicodeDecodeError e JSONDecodeError são ValueError
+        raise ErroProtocolo(f"Nome ou metadados inválidos: {e}")
+    if not isinstance(meta, dict):
+        raise ErroProtocolo("Metadados precisam ser um objeto JSON")
+    inicio += tam_meta
+    conteudo = visao[inicio:]
+    if verificar and zlib.crc32(conteudo) != crc:
+        raise ErroProtocolo("crc32 do conteúdo não confere (mensagem corrompida)")
+    try:
+        codec = compressao.codec_das_flags(flags)
+    except ValueError as e:
+        raise ErroProtocolo(str(e))
+    if codec:
+        return Quadro(tipo, nome, None, meta, flags, comprimido=conteudo, limite=limite)
+    return Quadro(tipo, nome, conteudo, meta, flags)
+
+
+def _decodificar_legado(payload):
+    # O alfabeto do base64 não tem ";", então o terceiro campo (client_id do app web) é separável.
+    # O base64 fica como uma fatia do payload (sem cópia) e só é decodificado quando for usado.
+    payload = bytes(payload)
+    fim_nome = payload.find(b";")
+    if fim_nome < 0:
+        raise ErroProtocolo("Mensagem fora do formato 'nome;base64'")
+    fim_base64 = payload.find(b";", fim_nome + 1)
+    if fim_base64 < 0:
+        fim_base64 = len(payload)
+    if (fim_base64 - fim_nome - 1) % 4:
+        raise ErroProtocolo("base64 com tamanho inválido")
+    try:
+        nome = payload[:fim_nome].decode("utf-8")
+        meta = {"client_id": payload[fim_base64 + 1:].decode("utf-8")} if fim_base64 < len(payload) else {}
+    except UnicodeDecodeError as e:
+        raise ErroProtocolo(f"Nome ou client_id inválido: {e}")
+    visao = memoryview(payload)[fim_nome + 1:fim_base64]
+    return Quadro(TIPO_ARQUIVO, nome, None, meta, legado=True, base64=visao)
@@ -1,68 +1,647 @@
 # servidor_mqtt.py
 # Este script implementa o lado servidor de uma aplicação baseada em MQTT.
-# O servidor recebe arquivos codificados em base64 de clientes,
-# converte o conteúdo para letras maiúsculas e devolve o novo arquivo ao respectivo cliente.
+# O servidor recebe arquivos de clientes (no formato binário de protocolo.py ou no formato
+# antigo "nome;base64"), converte o conteúdo para letras maiúsculas (ou aplica outra
+# transformação de transformacoes.py, escolhida no pedido) e devolve o novo arquivo ao
+# respectivo cliente, no mesmo formato em que o pedido chegou.
+#
+# O processamento não acontece na thread de rede do paho: on_message apenas coloca a mensagem
+# numa fila limitada, e um grupo de workers (threads ou processos) faz o trabalho pesado.
+# Assim um upload grande não atrasa os outros clientes nem os keepalives com o broker.
+# Se a fila estiver cheia, on_message descarta a mensagem na hora (nunca bloqueia a thread de rede):
+# um pedido recebe uma mensagem de erro, e o bloco de uma transferência é reenviado pelo cliente.
+#
+# Arquivos grandes chegam em blocos (ver transferencia.py): os blocos são gravados em disco na
+# pasta PASTA_TRANSFERENCIAS conforme chegam, o arquivo é processado aos poucos quando o último
+# bloco chega e a resposta volta também em blocos. Uma transferência interrompida é retomada.
+#
+# Modo cluster (--grupo): várias instâncias do servidor entram numa assinatura compartilhada
+# ($share/<grupo>/arquivo/upload/#) e o broker entrega cada pedido a só uma delas. Os blocos de
+# uma transferência precisam chegar à instância que tem o .part, então a instância que recebe o
+# INICIO informa o seu nome e o cliente manda o restante para arquivo/direto/<instância>/<id>.
+# Cada instância publica a sua carga (retida) em servidores/<instância>/carga.
+#
+# Arquivos já processados antes (mesmo conteúdo e mesma transformação) são respondidos direto
+# do cache de resultados (ver cache.py), em memória e opcionalmente em disco.
+#
+# Pedidos com o conteúdo comprimido (ver compressao.py) são respondidos com o mesmo codec.
+#
+# Cada mensagem tem as suas etapas cronometradas (fila, decodificação, transformação, gravação,
+# codificação, publicação) e os tempos vão para os histogramas de metricas.py, expostos em
+# /metrics (--metricas-porta) e resumidos no relatório de carga. Um pedido com
+# metadados["tempos"] recebe os tempos das etapas na resposta.
+#
+# Um pedido com metadados["andamento"] recebe mensagens ANDAMENTO no tópico de resposta a cada
+# etapa (e, durante a transformação, os bytes já processados), antes da resposta em si. No modo
+# "processos" a transformação roda em outro processo e só o início dela é avisado.
 
 import paho.mqtt.client as mqtt  # Biblioteca para comunicação MQTT
-import base64                    # Utilizada para codificar e decodificar os dados dos arquivos
-import time                      # (Não está sendo usada aqui, mas pode ser útil para medir tempos)
+import protocolo                 # Codificação e decodificação das mensagens (binário e formato antigo)
+import transferencia             # Arquivos grandes em blocos
+import transformacoes            # Transformações de texto aplicadas em blocos
+from cache import CacheResultados, chave_resultado  # Resultados de arquivos enviados de novo
+from metricas import Cronometro, Metricas, iniciar_http  # Tempos das etapas, contadores e /metrics
+import time                      # Medição do tempo de processamento de cada mensagem
+import os                        # Número de núcleos (quantidade padrão de workers)
+import queue                     # Fila entre a thread de rede do MQTT e os workers
+import threading                 # Workers e contadores compartilhados
+import argparse                  # Opções de linha de comando (broker, workers, fila...)
+import json                      # Relatório de carga
+import socket                    # Nome da máquina (nome padrão da instância)
+from concurrent.futures import ProcessPoolExecutor  # Modo "processos": usa todos os núcleos da CPU
 
 # Configurações de conexão
 BROKER = "localhost"             # Endereço do broker MQTT (neste caso, local)
 PORT = 1883                      # Porta padrão do protocolo MQTT
 TOPIC_BASE = "arquivo/upload/#" # Tópico base que o servidor irá escutar (sinal "#" permite receber de múltiplos clientes)
+TOPIC_DIRETO = "arquivo/direto/{}/#"  # Mensagens endereçadas a esta instância (blocos de uma transferência)
+TOPIC_CARGA = "servidores/{}/carga"   # Relatório de carga desta instância (mensagem retida)
+INTERVALO_CARGA = 5              # Segundos entre dois relatórios de carga
+METRICAS_HOST = "127.0.0.1"      # Endereço do endpoint /metrics (local: não fica exposto na rede)
+METRICAS_PORTA = None            # Porta do endpoint /metrics (None: desligado)
+INTERVALO_ANDAMENTO = 0.25       # Segundos mínimos entre dois avisos de progresso a um mesmo pedido
+
+# Modo cluster (preenchidos em main())
+GRUPO = None                     # Nome do grupo da assinatura compartilhada (None: recebe todos os pedidos)
+INSTANCIA = None                 # Nome desta instância (único no cluster)
+
+# Configurações do processamento
+MODO = "threads"                 # "threads" (arquivos pequenos) ou "processos" (muitos uploads grandes ao mesmo tempo)
+WORKERS = os.cpu_count() or 4    # Quantas mensagens são processadas ao mesmo tempo
+TAMANHO_FILA = 100               # Mensagens recebidas aguardando um worker livre
+# Máximo de bytes do conteúdo descomprimido de um pedido em mensagem única. Os clientes mandam em
+# blocos os arquivos maiores que LIMITE_MENSAGEM_UNICA; a folga é para benchmark.py e clientes antigos.
+LIMITE_PEDIDO = 4 * transferencia.LIMITE_MENSAGEM_UNICA
+
+# Cache de resultados
+CACHE_MB = 64                    # Memória para resultados já calculados (0 desliga o cache)
+CACHE_DISCO = None               # Pasta da camada em disco do cache (None: só memória)
+CACHE_DISCO_MB = 1024            # Espaço máximo da camada em disco
+# Resultados maiores que isso não vão para o cache: para guardá-los, o resultado inteiro ficaria na
+# memória junto com a resposta, e o processamento em blocos existe justamente para evitar isso
+CACHE_ITEM_MAXIMO = transferencia.LIMITE_MENSAGEM_UNICA
+
+# Transferências em blocos
+PASTA_TRANSFERENCIAS = "transferencias"  # Blocos recebidos (.part) e mapas dos blocos (.mapa)
+TEMPO_INATIVA = 600              # Segundos sem blocos até fechar o arquivo de uma transferência (continua retomável)
+
+# Fila entre on_message e os workers (criada em main() com o tamanho configurado)
+fila = None
+
+# Cache de resultados (criado em main(); None quando desligado)
+cache = None
+
+# Contadores e tempos das etapas (exibidos ao encerrar o servidor, no relatório de carga e em /metrics)
+metricas = Metricas()
+
+# Transferências em andamento (identificador -> transferencia.Remontagem) e as concluídas
+# recentemente (identificador -> instante), para um FIM repetido não processar o arquivo de novo
+transferencias = {}
+concluidas = {}
+# Respostas em blocos enviadas recentemente (identificador -> (arquivo, metadados, instante)),
+# para reenviar os blocos que o cliente não recebeu
+respostas = {}
+lock_transferencias = threading.Lock()
+
+
+def contar(nome):
+    metricas.contar(nome)
+
+
+# ==========================
+# PROCESSAMENTO DE UM ARQUIVO
+# ==========================
+
+# Tópico de resposta a partir do tópico do pedido ("arquivo/upload/<id>" -> "arquivo/download/<id>",
+# "arquivo/direto/<instância>/<id>" -> "arquivo/download/<id>")
+def topico_resposta(topico):
+    # Extrai o ID do cliente a partir do tópico
+    topic_parts = topico.split("/")
+    if topic_parts[1:2] == ["direto"]:
+        del topic_parts[2]
+    if len(topic_parts) < 3:
+        raise ValueError("Tópico malformado. client_id não encontrado.")
+    return f"arquivo/download/{topic_parts[2]}"
+
+
+# Avisos de andamento de um pedido, publicados no tópico de resposta como mensagens ANDAMENTO.
+# Cada chamada informa a etapa atual; com `feito`/`total` (bytes) é um aviso de progresso, limitado
+# a um a cada INTERVALO_ANDAMENTO segundos. Mudanças de etapa são sempre publicadas.
+class Andamento:
+
+    def __init__(self, client, topico, pedido):
+        self.client = client
+        self.topico = topico
+        self.pedido = pedido
+        self.ultimo = 0.0
+
+    # Andamento para o pedido, ou None se ele não pediu (ou é do formato antigo, que não tem esse tipo)
+    @classmethod
+    def do_pedido(cls, client, topico, pedido):
+        if pedido.legado or not pedido.meta.get("andamento"):
+            return None
+        return cls(client, topico, pedido)
+
+    def __call__(self, etapa, feito=None, total=None):
+        agora = time.monotonic()
+        if feito is not None and agora - self.ultimo < INTERVALO_ANDAMENTO:
+            return
+        self.ultimo = agora
+        meta = {"etapa": etapa}
+        if feito is not None:
+            meta.update(feito=feito, total=total)
+        self.client.publish(self.topico, protocolo.codificar(self.pedido.nome, b"", protocolo.TIPO_ANDAMENTO,
+                                                             protocolo.meta_resposta(self.pedido, meta)))
+
+
+# Faz todo o trabalho de uma mensagem e devolve (tópico de resposta, payload de resposta, tempos
+# das etapas em segundos, conteúdo transformado). Fica no nível do módulo para poder ser executada
+# num processo separado (modo "processos"). O conteúdo passa em blocos pela transformação: cada
+# bloco transformado é gravado no arquivo e escrito na resposta, sem cópias intermediárias do
+# arquivo inteiro.
+# `pedido`: o payload recebido ou, no modo threads, o protocolo.Quadro já decodificado por
+# atender_pedido (assim nada é decodificado duas vezes). `verificar=False` pula o crc32 de um
+# payload que já foi conferido. `anteriores`: tempos das etapas que já passaram (ex: fila),
+# incluídos na resposta se o pedido tiver metadados["tempos"]. Com `guardar`, os blocos
+# transformados também são juntados e devolvidos (para o cache) enquanto não passarem de
+# CACHE_ITEM_MAXIMO bytes; senão (ou se passarem) o último item é None.
+# `andamento`: Andamento do pedido (só no modo threads: não atravessa para outro processo).
+def processar_arquivo(topico, pedido, anteriores=None, guardar=False, verificar=True, andamento=None):
+    cronometro = Cronometro()
+    download_topic = topico_resposta(topico)
+
+    # Decodifica a mensagem (formato binário ou o antigo "nome_do_arquivo;base64_dos_dados")
+    if not isinstance(pedido, protocolo.Quadro):
+        pedido = protocolo.decodificar(pedido, verificar, LIMITE_PEDIDO)
+    cronometro.marcar("decodificacao")
+
+    # Transformação pedida (padrão: letras maiúsculas)
+    nome_transformacao = pedido.meta.get("transformacao")
+    transformacao = transformacoes.obter(nome_transformacao)
+
+    # Cria um novo nome para o arquivo processado
+    new_filename = f"{transformacao.prefixo}{pedido.nome}"
+
+    # Salva o novo conteúdo em um arquivo local enquanto monta a resposta no mesmo formato do pedido.
+    # O conteúdo é decodificado (base64, descompressão) aos poucos, conforme a transformação pede.
+    resposta = protocolo.escritor_resposta(pedido, new_filename)
+    blocos = cronometro.medir(pedido.blocos(transformacoes.TAMANHO_BLOCO), "decodificacao")
+    if andamento is not None:
+        blocos = contar_progresso(blocos, andamento, "transformacao", pedido.tamanho)
+    transformados = [] if guardar else None
+    guardados = 0
+    with open(new_filename, "wb") as f:
+        cronometro.marcar("gravacao")
+        for bloco in transformacoes.transformar(blocos, nome_transformacao):
+            cronometro.marcar("transformacao")
+            f.write(bloco)
+            cronometro.marcar("gravacao")
+            resposta.escrever(bloco)
+            if transformados is not None:
+                guardados += len(bloco)
+                if guardados <= CACHE_ITEM_MAXIMO:
+                    transformados.append(bloco)
+                else:
+                    # Grande demais para o cache: descarta o que já foi juntado e segue só com a resposta
+                    transformados = None
+            cronometro.marcar("codificacao")
+    cronometro.marcar("gravacao")
+
+    # Tempos pedidos pelo cliente: os das etapas anteriores mais os deste processamento
+    meta = None
+    if pedido.meta.get("tempos"):
+        tempos = Cronometro()
+        tempos.somar(anteriores or {})
+        tempos.somar(cronometro.etapas)
+        meta = {"tempos": tempos.em_ms()}
+    payload = resposta.finalizar(meta)
+    cronometro.marcar("codificacao")
+    return download_topic, payload, cronometro.etapas, b"".join(transformados) if transformados is not None else None
+
+
+# Repassa os blocos avisando o `andamento` dos bytes já lidos a cada um
+def contar_progresso(blocos, andamento, etapa, total):
+    feito = 0
+    for bloco in blocos:
+        yield bloco
+        feito += len(bloco)
+        andamento(etapa, feito, total)
+
+
+# Processa um arquivo recebido em blocos (transferência em blocos), lendo e gravando em disco aos poucos.
+# Também fica no nível do módulo para o modo "processos".
+def processar_em_blocos(origem, destino, nome_transformacao=None, andamento=None):
+    with open(origem, "rb") as entrada, open(destino, "wb") as saida:
+        blocos = iter(lambda: entrada.read(transformacoes.TAMANHO_BLOCO), b"")
+        if andamento is not None:
+            blocos = contar_progresso(blocos, andamento, "transformacao", os.path.getsize(origem))
+        for bloco in transformacoes.transformar(blocos, nome_transformacao):
+            saida.write(bloco)
+
+
+# Atende um pedido de mensagem única, pelo cache quando o mesmo conteúdo já foi transformado.
+# Devolve (tópico de resposta, payload de resposta, True se veio do cache); os tempos das etapas
+# vão para `cronometro`.
+def atender_pedido(client, executar, topico, payload, cronometro):
+    # Decodifica uma única vez, conferindo o crc32. No modo threads este mesmo Quadro segue para
+    # processar_arquivo; no modo processos só bytes atravessam para o outro processo, então vai o
+    # payload (com o crc32 já conferido aqui).
+    pedido = protocolo.decodificar(payload, limite=LIMITE_PEDIDO)
+    cronometro.marcar("decodificacao")
+    download_topic = topico_resposta(topico)
+    andamento = Andamento.do_pedido(client, download_topic, pedido)
+    transformacao = transformacoes.obter(pedido.meta.get("transformacao"))
+
+    chave = None
+    if cache is not None:
+        # O hash é calculado bloco a bloco: um conteúdo comprimido ou em base64 é decodificado aos
+        # poucos (de novo na transformação, se não estiver no cache) e nunca fica inteiro na memória;
+        # no formato binário sem compressão os blocos são só fatias do payload.
+        if andamento is not None:
+            andamento("cache")
+        chave = chave_resultado(pedido.blocos(transformacoes.TAMANHO_BLOCO), transformacao.nome)
+        resultado = cache.obter(chave)
+        cronometro.marcar("cache")
+        if resultado is not None:
+            return atender_do_cache(pedido, transformacao, resultado, download_topic, cronometro)
+
+    if andamento is not None:
+        andamento("transformacao")
+    guardar = chave is not None
+    if MODO == "threads":
+        argumentos = (topico, pedido, cronometro.etapas, guardar, True, andamento)
+    else:
+        argumentos = (topico, payload, cronometro.etapas, guardar, False)
+    download_topic, resposta, etapas, resultado = executar(processar_arquivo, *argumentos)
+    cronometro.somar(etapas)
+    if resultado is not None:
+        # O conteúdo transformado volta junto com a resposta: vai para o cache sem decodificar a resposta
+        cache.guardar(chave, resultado)
+        cronometro.marcar("cache")
+    return download_topic, resposta, False
+
+
+# Resposta a um pedido cujo resultado já estava no cache. Devolve o mesmo que atender_pedido.
+def atender_do_cache(pedido, transformacao, resultado, download_topic, cronometro):
+    # Acerto: o arquivo local só é gravado de novo se não estiver lá com o mesmo tamanho
+    new_filename = f"{transformacao.prefixo}{pedido.nome}"
+    if not os.path.isfile(new_filename) or os.path.getsize(new_filename) != len(resultado):
+        with open(new_filename, "wb") as f:
+            f.write(resultado)
+    cronometro.marcar("gravacao")
+    meta = {"tempos": cronometro.em_ms()} if pedido.meta.get("tempos") else None
+    resposta = protocolo.responder(pedido, new_filename, resultado, meta)
+    cronometro.marcar("codificacao")
+    return download_topic, resposta, True
+
+
+# Avisa o cliente que o pedido falhou (só para pedidos no formato binário: o antigo não tem mensagem de erro)
+def avisar_erro(client, topico, payload, erro):
+    try:
+        pedido = protocolo.decodificar(payload, verificar=False)
+        download_topic = topico_resposta(topico)
+    except (ValueError, UnicodeDecodeError):
+        return
+    resposta = protocolo.responder_erro(pedido, str(erro))
+    if resposta is not None:
+        client.publish(download_topic, resposta)
+
+
+# ==========================
+# TRANSFERÊNCIAS EM BLOCOS
+# ==========================
+
+# Transferência em andamento com este identificador (reaberta do disco se o servidor reiniciou)
+def obter_transferencia(ident, quadro=None):
+    with lock_transferencias:
+        remontagem = transferencias.get(ident)
+        if remontagem is None:
+            destino = os.path.join(PASTA_TRANSFERENCIAS, ident)
+            if quadro is not None:
+                # INICIO: cria (ou retoma, se o .mapa for do mesmo arquivo)
+                os.makedirs(PASTA_TRANSFERENCIAS, exist_ok=True)
+                remontagem = transferencia.Remontagem(destino, quadro.nome, quadro.meta["tamanho"],
+                                                      quadro.meta["tamanho_bloco"])
+            else:
+                remontagem = transferencia.Remontagem.reabrir(destino)
+                if remontagem is None:
+                    raise protocolo.ErroProtocolo(f"Transferência desconhecida: {ident}")
+            transferencias[ident] = remontagem
+        return remontagem
+
+
+# Fecha os arquivos de transferências abandonadas (os blocos ficam em disco para uma retomada)
+def fechar_inativas():
+    limite = time.monotonic() - TEMPO_INATIVA
+    with lock_transferencias:
+        for ident, remontagem in list(transferencias.items()):
+            if remontagem.ultimo_uso < limite:
+                remontagem.fechar()
+                del transferencias[ident]
+        for ident, instante in list(concluidas.items()):
+            if instante < limite:
+                del concluidas[ident]
+        for ident, (_, _, instante) in list(respostas.items()):
+            if instante < limite:
+                del respostas[ident]
+
+
+# Trata uma mensagem de transferência em blocos (INICIO, BLOCO ou FIM) e devolve os bytes publicados.
+# Roda na thread do worker: só a conversão do arquivo completo usa `executar` (pool de processos).
+def tratar_transferencia(client, executar, topico, payload, cronometro):
+    # Nenhuma mensagem de transferência tem conteúdo maior que um bloco (o BLOCO é limitado abaixo
+    # ao tamanho do bloco combinado no INICIO)
+    quadro = protocolo.decodificar(payload, limite=transferencia.TAMANHO_BLOCO_MAXIMO)
+    cronometro.marcar("decodificacao")
+    download_topic = topico_resposta(topico)
+    ident = quadro.meta.get("transferencia")
+    if not ident or not ident.isalnum():
+        raise protocolo.ErroProtocolo("Identificador de transferência ausente ou inválido")
+    publicados = 0
+
+    # As respostas levam o nome da instância: o cliente manda o resto da transferência direto para ela
+    def responder(tipo, conteudo=b"", meta=None):
+        nonlocal publicados
+        resposta = protocolo.codificar(quadro.nome, conteudo, tipo,
+                                       dict(meta or {}, transferencia=ident, instancia=INSTANCIA))
+        client.publish(download_topic, resposta)
+        publicados += len(resposta)
+        cronometro.marcar("publicacao")
+
+    if quadro.tipo == protocolo.TIPO_INICIO:
+        # Uma transformação inexistente é recusada antes de o arquivo ser enviado
+        transformacoes.obter(quadro.meta.get("transformacao"))
+        fechar_inativas()
+        # Um envio novo do mesmo arquivo vem com outro identificador (transferencia.identificador):
+        # um INICIO de uma transferência já concluída é uma repetição atrasada e só é confirmado
+        with lock_transferencias:
+            repetido = ident in concluidas
+        if repetido:
+            responder(protocolo.TIPO_CONFIRMACAO, meta={"completa": True})
+            return publicados
+        remontagem = obter_transferencia(ident, quadro)
+        ja_tinha = len(transferencia.blocos_recebidos(remontagem.recebidos(), remontagem.blocos))
+        print(f"\n📥 Transferência {ident} de {topico}: {quadro.nome} "
+              f"({remontagem.tamanho} bytes, {remontagem.blocos} blocos, {ja_tinha} já recebidos)")
+        cronometro.marcar("gravacao")
+        # Responde com o mapa dos blocos que já estão em disco (retomada)
+        responder(protocolo.TIPO_FALTANTES, remontagem.recebidos())
+
+    elif quadro.tipo == protocolo.TIPO_BLOCO:
+        with lock_transferencias:
+            repetido = ident in concluidas
+        # Um bloco reenviado depois do fim da transferência só é confirmado de novo
+        if not repetido:
+            remontagem = obter_transferencia(ident)
+            # Um bloco comprimido é recusado assim que passar do tamanho do bloco, antes de ocupar a memória
+            quadro.limite = remontagem.tamanho_bloco
+            remontagem.gravar(quadro.meta["indice"], quadro.conteudo)
+        cronometro.marcar("gravacao")
+        responder(protocolo.TIPO_CONFIRMACAO, meta={"indices": [quadro.meta["indice"]]})
+
+    elif quadro.tipo == protocolo.TIPO_FIM:
+        with lock_transferencias:
+            repetido = ident in concluidas
+        if repetido:
+            # FIM reenviado (a confirmação anterior se perdeu): só confirma de novo
+            responder(protocolo.TIPO_CONFIRMACAO, meta={"completa": True})
+            return publicados
+        remontagem = obter_transferencia(ident)
+        if not remontagem.completa():
+            responder(protocolo.TIPO_FALTANTES, remontagem.recebidos())
+            return publicados
+        with lock_transferencias:
+            transferencias.pop(ident, None)
+            concluidas[ident] = time.monotonic()
+        responder(protocolo.TIPO_CONFIRMACAO, meta={"completa": True})
+
+        inicio = time.perf_counter()
+        andamento = Andamento.do_pedido(client, download_topic, quadro)
+        recebido = remontagem.concluir()
+        nome_transformacao = quadro.meta.get("transformacao")
+        new_filename = f"{transformacoes.obter(nome_transformacao).prefixo}{remontagem.nome}"
+        if andamento is not None:
+            andamento("transformacao")
+        # O progresso da conversão só é avisado quando ela roda nesta mesma thread (modo threads)
+        argumentos = (andamento,) if MODO == "threads" else ()
+        try:
+            executar(processar_em_blocos, recebido, new_filename, nome_transformacao, *argumentos)
+        finally:
+            os.remove(recebido)
+        cronometro.marcar("transformacao")
+        if andamento is not None:
+            andamento("envio")
+        # A resposta volta em blocos, com o mesmo identificador (e a mesma compressão do pedido)
+        codec = protocolo.codec_resposta(quadro)
+        meta = protocolo.meta_resposta(quadro, {"instancia": INSTANCIA})
+        if codec:
+            meta["compressao"] = codec
+        if quadro.meta.get("tempos"):
+            meta["tempos"] = cronometro.em_ms()
+        with lock_transferencias:
+            respostas[ident] = (new_filename, meta, time.monotonic())
+        publicados += transferencia.enviar_arquivo(client, download_topic, new_filename, new_filename, ident, meta,
+                                                   codec=codec)
+        cronometro.marcar("publicacao")
+        contar("processadas")
+        print(f"📤 Transferência {ident} concluída: {new_filename} enviado via {download_topic} "
+              f"({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+
+    elif quadro.tipo == protocolo.TIPO_FALTANTES:
+        # O cliente não recebeu todos os blocos da resposta: reenvia só os que faltam
+        with lock_transferencias:
+            resposta = respostas.get(ident)
+        if resposta is None:
+            raise protocolo.ErroProtocolo(f"Resposta da transferência {ident} não está mais disponível")
+        new_filename, meta, _ = resposta
+        blocos = transferencia.quantidade_blocos(os.path.getsize(new_filename), transferencia.TAMANHO_BLOCO)
+        recebidos = set(transferencia.blocos_recebidos(quadro.conteudo, blocos))
+        faltantes = [i for i in range(blocos) if i not in recebidos]
+        print(f"🔁 Transferência {ident}: reenviando {len(faltantes)} blocos da resposta")
+        publicados += transferencia.enviar_arquivo(client, download_topic, new_filename, new_filename, ident, meta,
+                                                   indices=faltantes, codec=meta.get("compressao"))
+        cronometro.marcar("publicacao")
+
+    else:
+        raise protocolo.ErroProtocolo(f"Mensagem inesperada do cliente (tipo {quadro.tipo})")
+    return publicados
+
+# ==========================
+# WORKERS
+# ==========================
+
+# Laço de cada worker: retira mensagens da fila, processa e publica a resposta.
+# `executar(funcao, *args)` chama a função na própria thread (modo threads) ou no pool de processos.
+def trabalhador(client, executar):
+    while True:
+        item = fila.get()
+        if item is None:                # Sinal de encerramento
+            break
+        topico, payload, chegada = item
+        # O cronômetro começa na chegada da mensagem: a primeira etapa é a espera na fila
+        cronometro = Cronometro(chegada)
+        cronometro.marcar("fila")
+
+        # Mensagens de transferência em blocos (o tipo é lido do cabeçalho, sem decodificar)
+        tipo = protocolo.tipo(payload)
+        if tipo in protocolo.TIPOS_TRANSFERENCIA:
+            nome_tipo = protocolo.NOMES_TIPOS[tipo]
+            try:
+                publicados = tratar_transferencia(client, executar, topico, payload, cronometro)
+                metricas.registrar(nome_tipo, "ok", cronometro, publicados)
+            except Exception as e:
+                contar("erros")
+                print(f"❌ Erro na transferência: {e}")
+                avisar_erro(client, topico, payload, e)
+                metricas.registrar(nome_tipo, "erro", cronometro)
+            continue
+
+        print(f"\n📥 Mensagem recebida no tópico: {topico}")
+        try:
+            download_topic, resposta, do_cache = atender_pedido(client, executar, topico, payload, cronometro)
+            # Publica o novo arquivo no tópico do cliente (publish pode ser chamado de qualquer thread)
+            client.publish(download_topic, resposta)
+            cronometro.marcar("publicacao")
+            contar("processadas")
+            metricas.registrar("arquivo", "cache" if do_cache else "ok", cronometro, len(resposta))
+            print(f"📤 Arquivo enviado via {download_topic}{' (do cache)' if do_cache else ''} "
+                  f"({cronometro.total() * 1000:.1f} ms, {formatar_etapas(cronometro)})")
+        except Exception as e:
+            # Captura erros na manipulação da mensagem
+            contar("erros")
+            print(f"❌ Erro: {e}")
+            avisar_erro(client, topico, payload, e)
+            metricas.registrar("arquivo", "erro", cronometro)
+
+
+# "fila 0.1 | decodificacao 0.3 | ..." (ms), na ordem em que as etapas aconteceram
+def formatar_etapas(cronometro):
+    return " | ".join(f"{etapa} {segundos * 1000:.1f}" for etapa, segundos in cronometro.etapas.items())
+
+
+# ==========================
+# CALLBACKS DO MQTT
+# ==========================
 
 # Função chamada quando o cliente (servidor) conecta ao broker com sucesso
 def on_connect(client, userdata, flags, rc):
     print(f"🔌 Conectado ao broker. Código: {rc}")  # Código de retorno da conexão
-    client.subscribe(TOPIC_BASE)                   # Inscreve-se no tópico base
-    print(f"📡 Subscrito ao tópico base: {TOPIC_BASE}")
+    # No modo cluster a assinatura é compartilhada: o broker entrega cada pedido a uma só instância
+    topico = f"$share/{GRUPO}/{TOPIC_BASE}" if GRUPO else TOPIC_BASE
+    client.subscribe(topico, qos=1)                # Inscreve-se no tópico base (QoS 1: blocos não se perdem no broker)
+    client.subscribe(TOPIC_DIRETO.format(INSTANCIA), qos=1)
+    print(f"📡 Subscrito ao tópico base: {topico} (instância {INSTANCIA})")
+    publicar_carga(client)
 
 # Função chamada quando o cliente (servidor) se desconecta do broker
 def on_disconnect(client, userdata, rc):
     print("📴 Desconectado do broker.")
 
-# Função chamada sempre que uma mensagem chega no tópico inscrito
+# Função chamada sempre que uma mensagem chega no tópico inscrito.
+# Roda na thread de rede do paho: só enfileira, nunca processa.
 def on_message(client, userdata, msg):
-    print(f"\n📥 Mensagem recebida no tópico: {msg.topic}")
-
+    metricas.recebida(len(msg.payload))
     try:
-        # Decodifica o payload da mensagem (espera-se que esteja no formato: "nome_do_arquivo;base64_dos_dados")
-        payload = msg.payload.decode()
-        filename, file_data = payload.split(";", 1)
-
-        # Decodifica o conteúdo do arquivo, converte para letras maiúsculas
-        content = base64.b64decode(file_data).decode().upper()
-
-        # Cria um novo nome para o arquivo processado
-        new_filename = f"CAPS_{filename}"
-
-        # Salva o novo conteúdo em um arquivo local
-        with open(new_filename, "w") as f:
-            f.write(content)
-
-        # Codifica novamente o conteúdo para envio via MQTT
-        new_file_data = base64.b64encode(content.encode()).decode()
-
-        # Extrai o ID do cliente a partir do tópico
-        topic_parts = msg.topic.split("/")
-        if len(topic_parts) >= 3:
-            client_id = topic_parts[2]
-            # Define o tópico de resposta baseado no client_id
-            download_topic = f"arquivo/download/{client_id}"
-            # Publica o novo arquivo no tópico do cliente
-            client.publish(download_topic, f"{new_filename};{new_file_data}")
-            print(f"📤 Arquivo enviado ao cliente '{client_id}' via {download_topic}")
-        else:
-            print("⚠️ Tópico malformado. client_id não encontrado.")
-
-    except Exception as e:
-        # Captura erros na manipulação da mensagem
-        print(f"❌ Erro: {e}")
+        # Esta é a thread de rede do paho: esperar aqui seguraria os keepalives e todas as outras
+        # mensagens, então com a fila cheia a mensagem é descartada na hora. O instante da chegada
+        # vai junto para medir a espera na fila.
+        fila.put_nowait((msg.topic, msg.payload, time.perf_counter()))
+    except queue.Full:
+        contar("rejeitadas")
+        print(f"⚠️ Fila cheia: mensagem de {msg.topic} descartada.")
+        # Um pedido avisa o cliente na hora (sem esperar o tempo limite dele). As mensagens de uma
+        # transferência em blocos não: sem confirmação, o cliente as reenvia (ver transferencia.py).
+        if protocolo.tipo(msg.payload) == protocolo.TIPO_ARQUIVO:
+            avisar_erro(client, msg.topic, msg.payload, "Servidor ocupado (fila cheia): tente de novo")
+
+# ==========================
+# RELATÓRIO DE CARGA
+# ==========================
+
+# Publica (retida) a carga desta instância. Quem assina servidores/+/carga vê todas as instâncias;
+# se uma instância cair sem se despedir, o broker publica o testamento (online: false) no lugar.
+# Além dos contadores, leva a média e o p95 de cada etapa por tipo de mensagem (metricas.py).
+def publicar_carga(client, online=True):
+    with lock_transferencias:
+        ativas = len(transferencias)
+    carga = {"instancia": INSTANCIA, "grupo": GRUPO, "online": online, "instante": round(time.time(), 3),
+             "fila": fila.qsize(), "transferencias": ativas, **metricas.contadores(), "etapas": metricas.resumo()}
+    if cache is not None:
+        carga["cache"] = cache.estatisticas()
+    return client.publish(TOPIC_CARGA.format(INSTANCIA), json.dumps(carga), qos=1, retain=True)
+
+# Métricas de outros módulos para o /metrics: profundidade da fila, transferências e cache
+def metricas_adicionais():
+    with lock_transferencias:
+        ativas = len(transferencias)
+    adicionais = [
+        ("mqtt_fila_mensagens", "gauge", "Mensagens na fila aguardando um worker.", fila.qsize()),
+        ("mqtt_fila_capacidade", "gauge", "Tamanho máximo da fila.", fila.maxsize),
+        ("mqtt_transferencias_ativas", "gauge", "Transferências em blocos em andamento.", ativas),
+    ]
+    if cache is not None:
+        estatisticas = cache.estatisticas()
+        adicionais += [
+            ("mqtt_cache_itens", "gauge", "Resultados guardados no cache em memória.", estatisticas["itens"]),
+            ("mqtt_cache_bytes", "gauge", "Bytes usados pelo cache em memória.", estatisticas["bytes_usados"]),
+            ("mqtt_cache_acertos_total", "counter", "Pedidos respondidos pelo cache.",
+             estatisticas["acertos_memoria"] + estatisticas["acertos_disco"]),
+            ("mqtt_cache_falhas_total", "counter", "Pedidos que não estavam no cache.", estatisticas["falhas"]),
+        ]
+    return adicionais
 
 # Função principal que configura e inicia o servidor MQTT
 def main():
-    print("🚀 Servidor MQTT iniciando...")
+    global fila, GRUPO, INSTANCIA, MODO, cache
+
+    parser = argparse.ArgumentParser(description="Servidor MQTT que converte arquivos de texto para maiúsculas")
+    parser.add_argument("--broker", default=BROKER, help="endereço do broker MQTT")
+    parser.add_argument("--porta", type=int, default=PORT, help="porta do broker MQTT")
+    parser.add_argument("--modo", choices=["threads", "processos"], default=MODO,
+                        help="workers em threads ou em processos (processos aproveitam todos os núcleos)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="mensagens processadas ao mesmo tempo")
+    parser.add_argument("--tamanho-fila", type=int, default=TAMANHO_FILA,
+                        help="mensagens aguardando um worker livre")
+    parser.add_argument("--grupo", help="modo cluster: nome do grupo da assinatura compartilhada "
+                                        "(cada pedido vai para uma só instância do grupo)")
+    parser.add_argument("--instancia", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="nome desta instância no cluster (use um nome fixo para retomar transferências "
+                             "depois de reiniciar)")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_MB,
+                        help="memória (MB) para resultados de arquivos já processados (0 desliga o cache)")
+    parser.add_argument("--cache-disco", default=CACHE_DISCO, metavar="PASTA",
+                        help="guarda os resultados também nesta pasta (sobrevivem a um reinício)")
+    parser.add_argument("--cache-disco-mb", type=float, default=CACHE_DISCO_MB,
+                        help="espaço máximo (MB) da pasta do cache")
+    parser.add_argument("--metricas-porta", type=int, default=METRICAS_PORTA, metavar="PORTA",
+                        help="expõe contadores e histogramas das etapas em http://<host>:PORTA/metrics")
+    parser.add_argument("--metricas-host", default=METRICAS_HOST,
+                        help="endereço do endpoint /metrics (padrão: só a própria máquina)")
+    args = parser.parse_args()
+
+    MODO = args.modo
+    if args.cache_mb > 0:
+        cache = CacheResultados(int(args.cache_mb * 1024 * 1024), args.cache_disco,
+                                int(args.cache_disco_mb * 1024 * 1024))
+    GRUPO = args.grupo
+    # O nome vai em tópicos: sem "/", "+" e "#"
+    INSTANCIA = "".join(c if c.isalnum() or c in "-_." else "_" for c in args.instancia)
+    fila = queue.Queue(maxsize=args.tamanho_fila)
+
+    print(f"🚀 Servidor MQTT iniciando... ({args.workers} workers, modo {args.modo}"
+          f"{f', grupo {GRUPO}' if GRUPO else ''})")
+
+    servidor_metricas = None
+    if args.metricas_porta is not None:
+        servidor_metricas = iniciar_http(metricas, args.metricas_host, args.metricas_porta, metricas_adicionais)
+        print(f"📈 Métricas em http://{args.metricas_host}:{servidor_metricas.server_port}/metrics")
+
+    # No modo "processos" cada worker entrega a mensagem a um processo do pool e espera o resultado
+    pool = None
+    executar = lambda funcao, *argumentos: funcao(*argumentos)
+    if args.modo == "processos":
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        executar = lambda funcao, *argumentos: pool.submit(funcao, *argumentos).result()
 
     # Cria um cliente MQTT
     client = mqtt.Client()
@@ -72,11 +651,57 @@ def main():
     client.on_disconnect = on_disconnect
     client.on_message = on_message
 
+    # Testamento: se a conexão cair sem desconexão normal, o broker marca esta instância como offline
+    client.will_set(TOPIC_CARGA.format(INSTANCIA), json.dumps({"instancia": INSTANCIA, "grupo": GRUPO, "online": False}),
+                    qos=1, retain=True)
+
+    workers = [threading.Thread(target=trabalhador, args=(client, executar), daemon=True, name=f"worker-{i}")
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
     # Conecta-se ao broker
-    client.connect(BROKER, PORT, 60)
+    client.connect(args.broker, args.porta, 60)
 
-    # Entra em loop infinito para manter a escuta de mensagens
-    client.loop_forever()
+    # A rede roda numa thread própria do paho (loop_start). Com loop_forever() na thread principal,
+    # um publish() feito por um worker escreveria direto no socket, ao mesmo tempo que outros
+    # workers, embaralhando os bytes de respostas grandes.
+    client.loop_start()
+    try:
+        # Mantém o programa vivo até Ctrl+C (a espera com timeout deixa o Ctrl+C funcionar no Windows)
+        # A cada INTERVALO_CARGA segundos publica a carga desta instância
+        parar = threading.Event()
+        segundos = 0
+        while not parar.wait(1):
+            segundos += 1
+            if segundos % INTERVALO_CARGA == 0:
+                publicar_carga(client)
+    except KeyboardInterrupt:
+        print("\n🛑 Servidor encerrado.")
+    finally:
+        # Termina as mensagens já enfileiradas (com a rede ainda ativa para publicar as respostas)
+        # e encerra os workers
+        for _ in workers:
+            fila.put(None)
+        for worker in workers:
+            worker.join()
+        if pool is not None:
+            pool.shutdown()
+        # Grava o .mapa das transferências em andamento (a retomada pede só os blocos que faltam)
+        with lock_transferencias:
+            for remontagem in transferencias.values():
+                remontagem.fechar()
+        # Despedida: marca a instância como offline (a desconexão normal não dispara o testamento)
+        despedida = publicar_carga(client, online=False)
+        if despedida.rc == mqtt.MQTT_ERR_SUCCESS:
+            despedida.wait_for_publish(2)
+        client.disconnect()
+        client.loop_stop()
+        if servidor_metricas is not None:
+            servidor_metricas.shutdown()
+        print(f"📊 Mensagens: {metricas.contadores()}")
+        if cache is not None:
+            print(f"🗃️ Cache: {cache.estatisticas()}")
 
 # Execução do script como programa principal
 if __name__ == "__main__":
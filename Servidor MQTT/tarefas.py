@@ -0,0 +1,168 @@
+# tarefas.py
+# Uploads assíncronos do app web (app_web_server.py): o /upload devolve na hora o ID da tarefa e o
+# navegador acompanha o andamento por Server-Sent Events em /eventos/<id>.
+#
+# Cada tarefa guarda a lista dos seus eventos, na ordem em que aconteceram:
+#   etapa      {"etapa", "mensagem"}           recebido, enviando, processando, recebendo...
+#   progresso  {"fase", "feito", "total"}      blocos enviados ao servidor MQTT ("envio") / recebidos
+#                                              dele ("resposta"); bytes já transformados por ele
+#                                              ("servidor", total null se ele não souber)
+#   conteudo   {"texto"}                       um pedaço do arquivo transformado
+#   fim        {"filename", "bytes", "duration", "server_timings"}   tempos das etapas no servidor (ms)
+#   erro       {"error"}
+# Quem lê o fluxo percorre a lista a partir de uma posição e espera na Condition quando chega ao
+# fim dela. A posição é o "id" do evento SSE: um EventSource que reconectar manda o Last-Event-ID
+# e continua de onde parou, sem perder nem repetir pedaços do conteúdo.
+#
+# O conteúdo do arquivo transformado não fica na memória depois de entregue: quando o evento final
+# é lido (o navegador fecha o fluxo ao recebê-lo), a lista de eventos é descartada. Uma tarefa
+# terminada que ninguém leu é descartada TEMPO_GUARDADA segundos depois.
+
+import codecs
+import json
+import threading
+import time
+
+TAMANHO_PEDACO = 64 * 1024      # Bytes do conteúdo por evento
+TEMPO_GUARDADA = 300            # Segundos que uma tarefa terminada continua disponível
+FINAIS = ("fim", "erro")        # Eventos que encerram a tarefa
+
+# ID -> Tarefa (o ID é o mesmo usado para correlacionar a resposta do servidor MQTT)
+_tarefas = {}
+_lock = threading.Lock()
+
+
+class Tarefa:
+
+    def __init__(self, ident):
+        self.ident = ident
+        self.eventos = []               # (tipo, dados)
+        self.condicao = threading.Condition()
+        self.terminada = None           # Instante em que terminou (None = em andamento)
+        self.ultima_atividade = time.monotonic()
+        self.bytes = 0                  # Bytes do conteúdo já repassados
+
+        # O conteúdo chega em bytes e sai como texto: um caractere de vários bytes cortado entre
+        # dois blocos é completado com o bloco seguinte
+        self.decodificador = codecs.getincrementaldecoder("utf-8")()
+        # Resposta em blocos: repassados em ordem, mesmo que cheguem fora dela
+        self.blocos = None              # Total de blocos da resposta (INICIO)
+        self.proximo = 0                # Próximo bloco a repassar
+        self.fora_de_ordem = {}         # indice -> bytes, esperando os anteriores
+        self.tentativas = 0             # Pedidos de reenvio já feitos
+        self.descartados = 0            # Eventos já entregues e tirados da lista (posição do primeiro da lista)
+
+    def publicar(self, tipo, **dados):
+        with self.condicao:
+            if self.terminada is not None:
+                return
+            self.ultima_atividade = time.monotonic()
+            self.eventos.append((tipo, dados))
+            if tipo in FINAIS:
+                self.terminada = self.ultima_atividade
+            self.condicao.notify_all()
+
+    def etapa(self, etapa, mensagem):
+        self.publicar("etapa", etapa=etapa, mensagem=mensagem)
+
+    # Bytes do arquivo transformado, na ordem (repassados como texto em pedaços)
+    def dados(self, dados):
+        with self.condicao:
+            for i in range(0, len(dados), TAMANHO_PEDACO):
+                texto = self.decodificador.decode(dados[i:i + TAMANHO_PEDACO])
+                if texto:
+                    self.publicar("conteudo", texto=texto)
+            self.bytes += len(dados)
+
+    # ==========================
+    # RESPOSTA EM BLOCOS
+    # ==========================
+
+    def iniciar_blocos(self, blocos):
+        with self.condicao:
+            self.blocos = blocos
+
+    def bloco(self, indice, dados):
+        with self.condicao:
+            if self.blocos is None or not self.proximo <= indice < self.blocos or indice in self.fora_de_ordem:
+                return
+            self.fora_de_ordem[indice] = bytes(dados)
+            while self.proximo in self.fora_de_ordem:
+                self.dados(self.fora_de_ordem.pop(self.proximo))
+                self.proximo += 1
+            self.publicar("progresso", fase="resposta", feito=self.proximo, total=self.blocos)
+
+    def faltantes(self):
+        with self.condicao:
+            if self.blocos is None:
+                return None
+            return [i for i in range(self.proximo, self.blocos) if i not in self.fora_de_ordem]
+
+    # Mapa de bits dos blocos recebidos (formato de transferencia.blocos_recebidos), para pedir reenvio
+    def recebidos(self):
+        with self.condicao:
+            mapa = bytearray(-(-self.blocos // 8))
+            for indice in list(range(self.proximo)) + list(self.fora_de_ordem):
+                mapa[indice // 8] |= 1 << (indice % 8)
+            return bytes(mapa)
+
+    # ==========================
+    # FIM
+    # ==========================
+
+    def concluir(self, **info):
+        with self.condicao:
+            try:
+                texto = self.decodificador.decode(b"", final=True)
+            except UnicodeDecodeError:
+                self.falhar("Resposta do servidor não é texto UTF-8")
+                return
+            if texto:
+                self.publicar("conteudo", texto=texto)
+            self.publicar("fim", bytes=self.bytes, **info)
+
+    def falhar(self, mensagem):
+        self.publicar("erro", error=mensagem)
+
+    # Eventos a partir da posição `inicio`, esperando até `espera` segundos se ainda não houver.
+    # Devolve (eventos, terminada). Depois de entregar o evento final, descarta a lista.
+    def ler(self, inicio, espera):
+        with self.condicao:
+            if inicio < self.descartados:
+                return [("erro", {"error": "O resultado desta tarefa já foi entregue"})], True
+            inicio -= self.descartados
+            if len(self.eventos) <= inicio and self.terminada is None:
+                self.condicao.wait(espera)
+            eventos = self.eventos[inicio:]
+            if self.terminada is None:
+                return eventos, False
+            self.descartados += len(self.eventos)
+            self.eventos = []
+            return eventos, True
+
+
+# Evento no formato do Server-Sent Events
+def formatar(posicao, tipo, dados):
+    return f"id: {posicao}\nevent: {tipo}\ndata: {json.dumps(dados)}\n\n"
+
+
+def criar(ident):
+    tarefa = Tarefa(ident)
+    with _lock:
+        _descartar_antigas()
+        _tarefas[ident] = tarefa
+    return tarefa
+
+
+def obter(ident):
+    with _lock:
+        _descartar_antigas()
+        return _tarefas.get(ident)
+
+
+# Descarta as tarefas terminadas há muito tempo (ninguém mais vai ler os eventos). Chamada com o
+# lock adquirido a cada criar() e obter(): sem uploads novos, as respostas que chegam também limpam.
+def _descartar_antigas():
+    limite = time.monotonic() - TEMPO_GUARDADA
+    for antiga in [i for i, t in _tarefas.items() if t.terminada is not None and t.terminada < limite]:
+        del _tarefas[antiga]
@@ -0,0 +1,6 @@
+# Os módulos do servidor são scripts soltos na pasta de cima (import protocolo, import transferencia...):
+# os testes os importam do mesmo jeito. Rodar de dentro de "Servidor MQTT": python -m pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+# Testes do cache de resultados (cache.py)
+import os
+
+from cache import CacheResultados, chave_resultado
+
+
+def test_chave_por_conteudo_e_transformacao():
+    assert chave_resultado([b"ab", b"c"], "maiusculas") == chave_resultado([b"abc"], "maiusculas")
+    assert chave_resultado([b"abc"], "maiusculas") != chave_resultado([b"abc"], "minusculas")
+    assert chave_resultado([b"abc"], "maiusculas") != chave_resultado([b"abd"], "maiusculas")
+    assert chave_resultado([memoryview(b"abc")], "rot13").startswith("rot13-")
+
+
+def test_acerto_e_falha():
+    cache = CacheResultados(100)
+    assert cache.obter("k") is None
+    cache.guardar("k", bytearray(b"resultado"))
+    assert cache.obter("k") == b"resultado"
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["falhas"], estatisticas["acertos_memoria"]) == (1, 1)
+    assert estatisticas["taxa_acertos"] == 0.5
+    assert estatisticas["bytes_economizados"] == 9
+
+
+def test_descarte_do_menos_usado():
+    cache = CacheResultados(25)
+    cache.guardar("a", b"a" * 10)
+    cache.guardar("b", b"b" * 10)
+    cache.obter("a")                    # "a" passa a ser o usado mais recentemente
+    cache.guardar("c", b"c" * 10)       # não cabe: sai "b"
+    assert cache.obter("b") is None
+    assert cache.obter("a") == b"a" * 10
+    assert cache.obter("c") == b"c" * 10
+    assert cache.bytes_usados == 20
+    assert cache.despejos == 1
+
+
+def test_maior_que_a_memoria_so_no_disco(tmp_path):
+    cache = CacheResultados(5, str(tmp_path), 100)
+    cache.guardar("grande", b"g" * 50)
+    assert cache.estatisticas()["itens"] == 0
+    assert cache.obter("grande") == b"g" * 50
+    assert cache.acertos_disco == 1
+
+
+def test_disco_sobrevive_ao_reinicio(tmp_path):
+    CacheResultados(100, str(tmp_path), 100).guardar("k", b"resultado")
+    cache = CacheResultados(100, str(tmp_path), 100)
+    assert cache.obter("k") == b"resultado"
+    # O acerto no disco volta para a memória
+    assert cache.obter("k") == b"resultado"
+    assert (cache.acertos_disco, cache.acertos_memoria) == (1, 1)
+
+
+def test_limite_do_disco(tmp_path):
+    cache = CacheResultados(1000, str(tmp_path), 25)
+    for chave in "abc":
+        cache.guardar(chave, chave.encode() * 10)
+    assert sorted(os.listdir(tmp_path)) == ["b", "c"]
+    assert cache.bytes_disco == 20
+
+
+def test_arquivo_apagado_do_disco(tmp_path):
+    cache = CacheResultados(5, str(tmp_path), 100)
+    cache.guardar("k", b"k" * 10)
+    os.remove(tmp_path / "k")
+    assert cache.obter("k") is None
+    assert cache.bytes_disco == 0
@@ -0,0 +1,170 @@
+# Testes da compressão do conteúdo (compressao.py) e do seu uso nas mensagens (protocolo.py)
+import os
+
+import pytest
+
+import compressao
+import protocolo
+
+TEXTO = ("Linha de texto que se repete bastante. " * 2000).encode("utf-8")
+
+
+@pytest.fixture(params=compressao.DISPONIVEIS)
+def codec(request):
+    return request.param
+
+
+def test_ida_e_volta(codec):
+    comprimido = compressao.comprimir(TEXTO, codec)
+    assert len(comprimido) < len(TEXTO) // 10
+    assert compressao.descomprimir(comprimido, codec) == TEXTO
+
+
+def test_ida_e_volta_vazio_e_aleatorio(codec):
+    aleatorio = os.urandom(50000)
+    for dados in (b"", aleatorio):
+        assert compressao.descomprimir(compressao.comprimir(dados, codec), codec) == dados
+
+
+def test_compressor_em_partes(codec):
+    compressor = compressao.Compressor(codec)
+    partes = [compressor.comprimir(TEXTO[i:i + 1000]) for i in range(0, len(TEXTO), 1000)]
+    partes.append(compressor.finalizar())
+    assert compressao.descomprimir(b"".join(partes), codec) == TEXTO
+
+
+def test_blocos_nunca_passam_do_tamanho(codec):
+    comprimido = compressao.comprimir(TEXTO, codec)
+    partes = list(compressao.descomprimir_blocos(comprimido, codec, 4096))
+    assert all(0 < len(parte) <= 4096 for parte in partes)
+    assert b"".join(partes) == TEXTO
+
+
+# Poucos bytes comprimidos que viram muitos: recusados assim que passam do limite
+def test_bomba_de_compressao(codec, monkeypatch):
+    comprimido = compressao.comprimir(bytes(10 * 1024 * 1024), codec)
+    assert len(comprimido) < 64 * 1024
+    monkeypatch.setattr(compressao, "LIMITE_DESCOMPRIMIDO", 1024 * 1024)
+    lidos = 0
+    with pytest.raises(ValueError, match="passa de"):
+        for parte in compressao.descomprimir_blocos(comprimido, codec, 64 * 1024):
+            lidos += len(parte)
+    assert lidos <= 1024 * 1024
+
+
+# O limite de quem chama vale no lugar do geral
+def test_limite_por_chamada(codec):
+    comprimido = compressao.comprimir(TEXTO, codec)
+    partes = []
+    with pytest.raises(ValueError, match="passa de 1000 bytes"):
+        for parte in compressao.descomprimir_blocos(comprimido, codec, 64 * 1024, limite=1000):
+            partes.append(parte)
+    assert sum(map(len, partes)) <= 1000
+    assert compressao.descomprimir(comprimido, codec, limite=len(TEXTO)) == TEXTO
+
+
+def test_conteudo_cortado(codec):
+    comprimido = compressao.comprimir(TEXTO, codec)
+    with pytest.raises(ValueError):
+        compressao.descomprimir(comprimido[:len(comprimido) // 2], codec)
+    with pytest.raises(ValueError):
+        compressao.descomprimir(comprimido[:-1], codec)
+
+
+def test_bytes_extras_no_fim(codec):
+    comprimido = compressao.comprimir(TEXTO, codec)
+    with pytest.raises(ValueError, match="extras"):
+        compressao.descomprimir(comprimido + b"lixo", codec)
+
+
+def test_lixo(codec):
+    with pytest.raises(ValueError):
+        compressao.descomprimir(b"isto nao esta comprimido", codec)
+
+
+def test_codec_das_flags():
+    assert compressao.codec_das_flags(0) is None
+    assert compressao.codec_das_flags(0xF0) is None
+    assert compressao.codec_das_flags(compressao.flag("zlib")) == "zlib"
+    with pytest.raises(ValueError, match="desconhecida"):
+        compressao.codec_das_flags(0x03)
+
+
+def test_zstd_ausente(monkeypatch):
+    monkeypatch.setattr(compressao, "DISPONIVEIS", ["zlib"])
+    with pytest.raises(ValueError, match="não disponível"):
+        compressao.codec_das_flags(compressao.flag("zstd"))
+
+
+# ==========================
+# NAS MENSAGENS
+# ==========================
+
+def test_mensagem_comprimida(codec):
+    payload = protocolo.codificar("a.txt", TEXTO, meta={"id": "1"}, codec=codec)
+    assert len(payload) < len(TEXTO) // 10
+    quadro = protocolo.decodificar(payload)
+    assert quadro.codec == codec
+    assert quadro.tamanho is None
+    assert b"".join(quadro.blocos(1000)) == TEXTO
+    assert bytes(quadro.conteudo) == TEXTO
+
+
+def test_mensagem_pequena_vai_sem_compressao(codec):
+    conteudo = b"x" * (compressao.TAMANHO_MINIMO - 1)
+    quadro = protocolo.decodificar(protocolo.codificar("a.txt", conteudo, codec=codec))
+    assert quadro.codec is None
+    assert bytes(quadro.conteudo) == conteudo
+
+
+# Conteúdo que não diminui com a compressão vai como está
+def test_mensagem_incompressivel(codec):
+    conteudo = os.urandom(10000)
+    quadro = protocolo.decodificar(protocolo.codificar("a.bin", conteudo, codec=codec))
+    assert quadro.codec is None
+    assert bytes(quadro.conteudo) == conteudo
+
+
+def test_mensagem_acima_do_limite(codec):
+    payload = protocolo.codificar("a.txt", TEXTO, codec=codec)
+    with pytest.raises(protocolo.ErroProtocolo, match="passa de"):
+        bytes(protocolo.decodificar(payload, limite=len(TEXTO) - 1).conteudo)
+    # O limite pode ser ajustado depois de decodificar (ex: ao descobrir o tamanho do bloco)
+    quadro = protocolo.decodificar(payload)
+    quadro.limite = 1000
+    with pytest.raises(protocolo.ErroProtocolo):
+        list(quadro.blocos(4096))
+
+
+@pytest.mark.parametrize("tamanho", [10, compressao.TAMANHO_MINIMO, len(TEXTO)])
+def test_escritor_comprimido(codec, tamanho):
+    escritor = protocolo.Escritor("a.txt", meta={"id": "2"}, codec=codec)
+    for inicio in range(0, tamanho, 700):
+        escritor.escrever(TEXTO[inicio:min(inicio + 700, tamanho)])
+    quadro = protocolo.decodificar(bytes(escritor.finalizar({"tempos": {}})))
+    assert quadro.codec == (codec if tamanho >= compressao.TAMANHO_MINIMO else None)
+    assert quadro.meta == {"id": "2", "tempos": {}}
+    assert bytes(quadro.conteudo) == TEXTO[:tamanho]
+
+
+def test_conteudo_comprimido_corrompido(codec):
+    payload = bytearray(protocolo.codificar("a.txt", TEXTO, codec=codec))
+    # Estraga o cabeçalho do conteúdo comprimido (o primeiro byte depois do nome)
+    payload[protocolo.CABECALHO.size + len("a.txt")] ^= 0xFF
+    # O crc32 não é conferido aqui, para o erro vir da descompressão
+    quadro = protocolo.decodificar(bytes(payload), verificar=False)
+    with pytest.raises(protocolo.ErroProtocolo):
+        bytes(quadro.conteudo)
+
+
+def test_resposta_no_codec_do_pedido(codec):
+    comprimido = protocolo.decodificar(protocolo.codificar("a.txt", TEXTO, codec=codec))
+    assert protocolo.codec_resposta(comprimido) == codec
+    # Pedido pequeno (sem compressão) que pede a resposta comprimida nos metadados
+    pequeno = protocolo.decodificar(protocolo.codificar("a.txt", b"abc", meta={"compressao": codec}))
+    assert protocolo.codec_resposta(pequeno) == codec
+    desconhecido = protocolo.decodificar(protocolo.codificar("a.txt", b"abc", meta={"compressao": "lzma"}))
+    assert protocolo.codec_resposta(desconhecido) is None
+    resposta = protocolo.decodificar(protocolo.responder(comprimido, "CAPS_a.txt", TEXTO.upper()))
+    assert resposta.codec == codec
+    assert bytes(resposta.conteudo) == TEXTO.upper()
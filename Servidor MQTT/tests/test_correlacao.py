@@ -0,0 +1,92 @@
+# Testes do Correlacionador (correlacao.py): cada resposta acorda o pedido certo, e as vagas de
+# pedidos pendentes são sempre devolvidas
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from correlacao import Correlacionador, Lotado
+
+
+def test_respostas_fora_de_ordem():
+    pedidos = Correlacionador()
+    registrados = [pedidos.novo() for _ in range(3)]
+    assert len({ident for ident, _ in registrados}) == 3
+    for ident, _ in reversed(registrados):
+        assert pedidos.resolver(ident, f"resposta {ident}")
+    for ident, futuro in registrados:
+        assert futuro.result(0) == f"resposta {ident}"
+        assert futuro.duracao >= 0
+    assert pedidos.pendentes() == 0
+
+
+def test_resposta_desconhecida_ou_repetida():
+    pedidos = Correlacionador()
+    ident, futuro = pedidos.novo()
+    assert not pedidos.resolver("outro", 1)
+    assert pedidos.resolver(ident, 1)
+    assert not pedidos.resolver(ident, 2)
+    assert futuro.result(0) == 1
+
+
+def test_falha():
+    pedidos = Correlacionador()
+    ident, futuro = pedidos.novo()
+    assert pedidos.falhar(ident, RuntimeError("erro no servidor"))
+    with pytest.raises(RuntimeError, match="erro no servidor"):
+        futuro.result(0)
+    assert not pedidos.falhar(ident, RuntimeError())
+
+
+def test_cancelado_descarta_resposta_atrasada():
+    pedidos = Correlacionador(1)
+    ident, futuro = pedidos.novo()
+    pedidos.cancelar(ident)
+    assert futuro.cancelled()
+    with pytest.raises(CancelledError):
+        futuro.result(0)
+    assert not pedidos.resolver(ident, "tarde demais")
+    # A vaga voltou
+    pedidos.novo(espera=0)
+
+
+def test_id_conhecido_repetido():
+    # Formato antigo: o pedido é identificado pelo nome do arquivo
+    pedidos = Correlacionador(2)
+    pedidos.novo("a.txt")
+    with pytest.raises(ValueError):
+        pedidos.novo("a.txt")
+    # A vaga da tentativa recusada foi devolvida
+    pedidos.novo("b.txt", espera=0)
+    with pytest.raises(Lotado):
+        pedidos.novo(espera=0)
+
+
+def test_lotado_espera_uma_vaga():
+    pedidos = Correlacionador(1)
+    ident, _ = pedidos.novo()
+    with pytest.raises(Lotado):
+        pedidos.novo(espera=0.01)
+    # Uma resposta que chega durante a espera libera a vaga
+    threading.Timer(0.05, pedidos.resolver, (ident, "ok")).start()
+    _, futuro = pedidos.novo(espera=5)
+    assert not futuro.done()
+
+
+def test_muitas_threads():
+    pedidos = Correlacionador(8)
+    resultados = []
+
+    def trabalhar():
+        for _ in range(200):
+            ident, futuro = pedidos.novo()
+            pedidos.resolver(ident, ident)
+            resultados.append(futuro.result(0) == ident)
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(resultados) == 1600 and all(resultados)
+    assert pedidos.pendentes() == 0
@@ -0,0 +1,58 @@
+# Testes da instrumentação (metricas.py): cronômetro por etapa, resumo e formato do Prometheus
+import pytest
+
+import metricas
+
+
+def test_cronometro_acumula_etapas(monkeypatch):
+    instantes = iter([1.0, 1.5, 2.0, 2.25])
+    monkeypatch.setattr(metricas.time, "perf_counter", lambda: next(instantes))
+    cronometro = metricas.Cronometro(inicio=0.0)
+    cronometro.marcar("fila")               # 1.0
+    cronometro.marcar("transformacao")      # 0.5
+    cronometro.marcar("fila")               # 0.5 (acumula)
+    cronometro.somar({"transformacao": 0.1})
+    assert cronometro.etapas == pytest.approx({"fila": 1.5, "transformacao": 0.6})
+    assert cronometro.total() == 2.25
+    assert cronometro.em_ms() == {"fila": 1500.0, "transformacao": 600.0}
+
+
+def test_medir_repassa_os_blocos():
+    cronometro = metricas.Cronometro()
+    assert list(cronometro.medir(iter([b"a", b"b"]), "decodificacao")) == [b"a", b"b"]
+    assert set(cronometro.etapas) == {"decodificacao"}
+
+
+def test_resumo_media_e_p95():
+    registro = metricas.Metricas()
+    for segundos in [0.0002] * 19 + [0.3]:
+        cronometro = metricas.Cronometro(inicio=0.0)
+        cronometro.etapas = {"transformacao": segundos}
+        cronometro.ultimo = segundos
+        registro.registrar("arquivo", "ok", cronometro, enviados=10)
+    resumo = registro.resumo()["arquivo"]["transformacao"]
+    assert resumo["quantidade"] == 20
+    assert resumo["media_ms"] == pytest.approx((0.0002 * 19 + 0.3) / 20 * 1000, abs=0.001)
+    # 19 de 20 (95%) caem no intervalo de até 0,25 ms
+    assert resumo["p95_ms"] == 0.25
+    assert registro.contadores()["bytes_enviados"] == 200
+
+
+def test_exportar_prometheus():
+    registro = metricas.Metricas()
+    registro.recebida(100)
+    registro.contar("erros")
+    cronometro = metricas.Cronometro(inicio=0.0)
+    cronometro.etapas = {"fila": 20.0}      # Acima do último intervalo
+    cronometro.ultimo = 20.0
+    registro.registrar("bloco", "erro", cronometro)
+    texto = registro.exportar([("mqtt_fila", "gauge", "Mensagens na fila.", 3)]).decode("utf-8")
+    linhas = texto.splitlines()
+    assert 'mqtt_mensagens_total{tipo="bloco",resultado="erro"} 1' in linhas
+    assert 'mqtt_duracao_etapa_segundos_bucket{tipo="bloco",etapa="fila",le="10.0"} 0' in linhas
+    assert 'mqtt_duracao_etapa_segundos_bucket{tipo="bloco",etapa="fila",le="+Inf"} 1' in linhas
+    assert 'mqtt_duracao_etapa_segundos_count{tipo="bloco",etapa="total"} 1' in linhas
+    assert "mqtt_bytes_recebidos_total 100" in linhas
+    assert "mqtt_erros_total 1" in linhas
+    assert "mqtt_fila 3" in linhas
+    assert texto.endswith("\n")
@@ -0,0 +1,185 @@
+# Testes do formato das mensagens (protocolo.py): ida e volta nos formatos binário e antigo,
+# escrita aos poucos com o Escritor e mensagens malformadas ou corrompidas
+import struct
+import zlib
+
+import pytest
+
+import protocolo
+from protocolo import ErroProtocolo, Escritor, codificar, codificar_legado, decodificar
+
+CONTEUDOS = [b"", b"x", "Olá, mundo!\n".encode("utf-8") * 1000, bytes(range(256)) * 300]
+
+
+@pytest.mark.parametrize("conteudo", CONTEUDOS)
+def test_ida_e_volta_binario(conteudo):
+    meta = {"id": "abc", "tempos": True, "nomes": ["ç", "ü"]}
+    quadro = decodificar(codificar("relatório ção.txt", conteudo, protocolo.TIPO_RESPOSTA, meta))
+    assert quadro.tipo == protocolo.TIPO_RESPOSTA
+    assert quadro.nome == "relatório ção.txt"
+    assert quadro.meta == meta
+    assert bytes(quadro.conteudo) == conteudo
+    assert quadro.tamanho == len(conteudo)
+    assert not quadro.legado
+    assert quadro.codec is None
+
+
+def test_sem_metadados():
+    payload = codificar("a.txt", b"abc")
+    assert protocolo.CABECALHO.unpack_from(payload)[5] == 0
+    assert decodificar(payload).meta == {}
+
+
+@pytest.mark.parametrize("conteudo", CONTEUDOS)
+@pytest.mark.parametrize("client_id", [None, "web_123abc"])
+def test_ida_e_volta_legado(conteudo, client_id):
+    quadro = decodificar(codificar_legado("a;b.txt".replace(";", "_"), conteudo, client_id))
+    assert quadro.legado
+    assert quadro.tipo == protocolo.TIPO_ARQUIVO
+    assert quadro.nome == "a_b.txt"
+    assert quadro.meta == ({"client_id": client_id} if client_id else {})
+    # O tamanho só é conhecido depois de decodificar o base64
+    assert quadro.tamanho is None
+    assert bytes(quadro.conteudo) == conteudo
+    assert quadro.tamanho == len(conteudo)
+
+
+@pytest.mark.parametrize("legado", [False, True])
+@pytest.mark.parametrize("tamanho", [1, 3, 4, 1000, 64 * 1024])
+def test_blocos(legado, tamanho):
+    conteudo = bytes(range(256)) * 100
+    payload = codificar_legado("a.txt", conteudo) if legado else codificar("a.txt", conteudo)
+    blocos = [bytes(bloco) for bloco in decodificar(payload).blocos(tamanho)]
+    assert b"".join(blocos) == conteudo
+    assert all(len(bloco) <= max(tamanho, 3 if legado else 1) for bloco in blocos)
+
+
+@pytest.mark.parametrize("legado", [False, True])
+def test_escritor_igual_a_codificar(legado):
+    conteudo = "linha ç\n".encode("utf-8") * 500
+    escritor = Escritor("saída.txt", protocolo.TIPO_RESPOSTA, {"id": "1"}, legado=legado)
+    # Partes de tamanhos que não são múltiplos de 3 (base64 do formato antigo)
+    for inicio in range(0, len(conteudo), 7):
+        escritor.escrever(conteudo[inicio:inicio + 7])
+    payload = bytes(escritor.finalizar())
+    if legado:
+        assert payload == codificar_legado("saída.txt", conteudo)
+    else:
+        assert payload == codificar("saída.txt", conteudo, protocolo.TIPO_RESPOSTA, {"id": "1"})
+
+
+def test_escritor_metadados_no_fim():
+    escritor = Escritor("a.txt", protocolo.TIPO_RESPOSTA, {"id": "1"})
+    escritor.escrever(b"conteudo")
+    quadro = decodificar(bytes(escritor.finalizar({"tempos": {"transformacao": 1.5}})))
+    assert quadro.meta == {"id": "1", "tempos": {"transformacao": 1.5}}
+    assert bytes(quadro.conteudo) == b"conteudo"
+
+
+def test_escritor_sem_conteudo():
+    assert decodificar(bytes(Escritor("vazio.txt").finalizar())).conteudo == b""
+
+
+def test_tipo_sem_decodificar():
+    assert protocolo.tipo(codificar("a", b"", protocolo.TIPO_BLOCO)) == protocolo.TIPO_BLOCO
+    assert protocolo.tipo(codificar_legado("a", b"x")) == protocolo.TIPO_ARQUIVO
+    assert protocolo.tipo(protocolo.MAGICO) == protocolo.TIPO_ARQUIVO
+
+
+def test_resposta_no_formato_do_pedido():
+    binario = decodificar(codificar("a.txt", b"x", meta={"id": "7", "transferencia": "t1", "outro": 1}))
+    resposta = decodificar(protocolo.responder(binario, "CAPS_a.txt", b"X", {"tempos": {}}))
+    assert resposta.tipo == protocolo.TIPO_RESPOSTA
+    # Só os campos de correlação voltam
+    assert resposta.meta == {"id": "7", "transferencia": "t1", "tempos": {}}
+
+    legado = decodificar(codificar_legado("a.txt", b"x"))
+    assert protocolo.responder(legado, "CAPS_a.txt", b"X") == codificar_legado("CAPS_a.txt", b"X")
+    assert protocolo.responder_erro(legado, "falhou") is None
+    erro = decodificar(protocolo.responder_erro(binario, "falhou"))
+    assert (erro.tipo, erro.meta) == (protocolo.TIPO_ERRO, {"id": "7", "transferencia": "t1", "erro": "falhou"})
+
+
+# ==========================
+# MENSAGENS INVÁLIDAS
+# ==========================
+
+def test_menor_que_o_cabecalho():
+    with pytest.raises(ErroProtocolo):
+        decodificar(codificar("a.txt", b"abc")[:protocolo.CABECALHO.size - 1])
+
+
+@pytest.mark.parametrize("corte", [1, 2, 5])
+def test_mensagem_cortada(corte):
+    with pytest.raises(ErroProtocolo):
+        decodificar(codificar("a.txt", b"abcdef", meta={"id": "1"})[:-corte])
+
+
+def test_bytes_sobrando():
+    with pytest.raises(ErroProtocolo):
+        decodificar(codificar("a.txt", b"abc") + b"\0")
+
+
+def test_versao_desconhecida():
+    payload = bytearray(codificar("a.txt", b"abc"))
+    payload[2] = protocolo.VERSAO + 1
+    with pytest.raises(ErroProtocolo, match="Versão"):
+        decodificar(bytes(payload))
+
+
+def test_crc_nao_confere():
+    payload = bytearray(codificar("a.txt", b"abcdef", meta={"id": "9"}))
+    payload[-1] ^= 0x01
+    with pytest.raises(ErroProtocolo, match="crc32"):
+        decodificar(bytes(payload))
+    # Sem a verificação ainda dá para ler o nome e o ID (para avisar o erro ao cliente)
+    quadro = decodificar(bytes(payload), verificar=False)
+    assert (quadro.nome, quadro.meta) == ("a.txt", {"id": "9"})
+
+
+def test_flags_com_codec_desconhecido():
+    payload = bytearray(codificar("a.txt", b"abc"))
+    payload[4] = 0x03
+    with pytest.raises(ErroProtocolo):
+        decodificar(bytes(payload))
+
+
+def test_tamanho_do_nome_inconsistente():
+    payload = bytearray(codificar("a.txt", b"abc"))
+    struct.pack_into("!H", payload, 5, 200)
+    with pytest.raises(ErroProtocolo):
+        decodificar(bytes(payload))
+
+
+# Monta uma mensagem binária com o nome e os metadados exatamente como dados (sem validar nada)
+def montar(nome, meta, conteudo=b"abc"):
+    cabecalho = protocolo.CABECALHO.pack(protocolo.MAGICO, protocolo.VERSAO, protocolo.TIPO_ARQUIVO, 0,
+                                         len(nome), len(meta), len(conteudo), zlib.crc32(conteudo))
+    return cabecalho + nome + meta + conteudo
+
+
+def test_montar_igual_a_codificar():
+    assert montar(b"a.txt", b'{"id":"1"}') == codificar("a.txt", b"abc", meta={"id": "1"})
+
+
+@pytest.mark.parametrize("nome, meta", [
+    (b"a\xff.txt", b""),                # Nome que não é UTF-8
+    (b"a.txt", b'{"id": '),              # JSON cortado
+    (b"a.txt", b"\xff"),                 # Metadados que não são UTF-8
+])
+def test_nome_ou_metadados_invalidos(nome, meta):
+    with pytest.raises(ErroProtocolo):
+        decodificar(montar(nome, meta))
+
+
+@pytest.mark.parametrize("meta", [b"[]", b"null", b"1", b'"id"'])
+def test_metadados_que_nao_sao_objeto(meta):
+    with pytest.raises(ErroProtocolo, match="objeto"):
+        decodificar(montar(b"a.txt", meta))
+
+
+@pytest.mark.parametrize("payload", [b"sem separador", b"a.txt;abc", b"a.txt;ab=="[:-1], b"a\xff.txt;YWJj",
+                                     b"a.txt;YWJj;\xff"])
+def test_legado_malformado(payload):
+    with pytest.raises(ErroProtocolo):
+        decodificar(payload)
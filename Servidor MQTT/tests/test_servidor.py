@@ -0,0 +1,131 @@
+# Testes do atendimento de um pedido numa única mensagem (servidor.atender_pedido), com um
+# cliente MQTT falso que só guarda o que foi publicado
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+# servidor.py importa o paho (pip install paho-mqtt): sem ele, só estes testes são pulados
+pytest.importorskip("paho")
+
+import metricas
+import protocolo
+import servidor
+from cache import CacheResultados
+
+
+class ClienteFalso:
+
+    def __init__(self):
+        self.publicados = []
+
+    def publish(self, topico, payload, qos=0):
+        self.publicados.append((topico, protocolo.decodificar(payload)))
+
+
+@pytest.fixture
+def servidor_com_cache(tmp_path, monkeypatch):
+    # O servidor grava o arquivo transformado na pasta atual
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(servidor, "cache", CacheResultados(1024 * 1024))
+    monkeypatch.setattr(servidor, "MODO", "threads")
+    return servidor
+
+
+def atender(modulo, payload, cliente=None):
+    executar = lambda funcao, *argumentos: funcao(*argumentos)
+    topico, resposta, do_cache = modulo.atender_pedido(cliente or ClienteFalso(), executar, "arquivo/upload/c1",
+                                                       payload, metricas.Cronometro())
+    return topico, protocolo.decodificar(resposta), do_cache
+
+
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_segundo_pedido_vem_do_cache(servidor_com_cache, codec):
+    conteudo = "texto de teste ç\n".encode("utf-8") * 100
+    payload = protocolo.codificar("a.txt", conteudo, meta={"id": "1"}, codec=codec)
+    topico, primeira, do_cache = atender(servidor_com_cache, payload)
+    assert topico == "arquivo/download/c1"
+    assert not do_cache
+    assert bytes(primeira.conteudo) == conteudo.decode("utf-8").upper().encode("utf-8")
+
+    # Outro nome, mesmo conteúdo: acerto, com a mesma resposta
+    _, segunda, do_cache = atender(servidor_com_cache, protocolo.codificar("b.txt", conteudo, meta={"id": "2"}))
+    assert do_cache
+    assert bytes(segunda.conteudo) == bytes(primeira.conteudo)
+    assert (segunda.nome, segunda.meta["id"]) == ("CAPS_b.txt", "2")
+    assert open("CAPS_b.txt", "rb").read() == bytes(primeira.conteudo)
+
+
+def test_outra_transformacao_nao_acerta(servidor_com_cache):
+    atender(servidor_com_cache, protocolo.codificar("a.txt", b"Abc"))
+    _, resposta, do_cache = atender(servidor_com_cache,
+                                    protocolo.codificar("a.txt", b"Abc", meta={"transformacao": "inverter"}))
+    assert not do_cache
+    assert (resposta.nome, bytes(resposta.conteudo)) == ("SWAP_a.txt", b"aBC")
+
+
+# Resultado maior que CACHE_ITEM_MAXIMO: respondido normalmente, mas não fica no cache
+def test_resultado_grande_nao_entra_no_cache(servidor_com_cache, monkeypatch):
+    monkeypatch.setattr(servidor, "CACHE_ITEM_MAXIMO", 1000)
+    conteudo = b"abc\n" * 1000
+    _, resposta, _ = atender(servidor_com_cache, protocolo.codificar("a.txt", conteudo, codec="zlib"))
+    assert bytes(resposta.conteudo) == conteudo.upper()
+    assert servidor_com_cache.cache.estatisticas()["itens"] == 0
+    _, _, do_cache = atender(servidor_com_cache, protocolo.codificar("a.txt", conteudo))
+    assert not do_cache
+
+
+def test_pedido_corrompido_nao_entra_no_cache(servidor_com_cache):
+    payload = bytearray(protocolo.codificar("a.txt", b"abc"))
+    payload[-1] ^= 1
+    with pytest.raises(protocolo.ErroProtocolo):
+        atender(servidor_com_cache, bytes(payload))
+    assert servidor_com_cache.cache.estatisticas()["itens"] == 0
+
+
+# Um pedido comprimido que descomprimido passa de LIMITE_PEDIDO é recusado (não vai inteiro para a memória)
+def test_pedido_comprimido_acima_do_limite(servidor_com_cache, monkeypatch):
+    monkeypatch.setattr(servidor, "LIMITE_PEDIDO", 64 * 1024)
+    payload = protocolo.codificar("a.txt", bytes(1024 * 1024), codec="zlib")
+    with pytest.raises(protocolo.ErroProtocolo, match="passa de"):
+        atender(servidor_com_cache, payload)
+    assert servidor_com_cache.cache.estatisticas()["itens"] == 0
+
+
+# Um BLOCO comprimido maior que o bloco combinado no INICIO é recusado
+def test_bloco_comprimido_acima_do_bloco(servidor_com_cache, monkeypatch):
+    monkeypatch.setattr(servidor, "transferencias", {})
+    executar = lambda funcao, *argumentos: funcao(*argumentos)
+    meta = {"transferencia": "t1", "tamanho": 2048, "tamanho_bloco": 1024}
+    servidor.tratar_transferencia(ClienteFalso(), executar, "arquivo/upload/c1",
+                                  protocolo.codificar("a.txt", b"", protocolo.TIPO_INICIO, meta),
+                                  metricas.Cronometro())
+    bloco = protocolo.codificar("a.txt", bytes(1024 * 1024), protocolo.TIPO_BLOCO,
+                                {"transferencia": "t1", "indice": 0}, codec="zlib")
+    with pytest.raises(protocolo.ErroProtocolo, match="passa de 1024 bytes"):
+        servidor.tratar_transferencia(ClienteFalso(), executar, "arquivo/upload/c1", bloco, metricas.Cronometro())
+    servidor.transferencias["t1"].fechar()
+
+
+# Pedido com meta["andamento"]: as etapas vão sendo publicadas com o mesmo id da resposta
+def test_andamento_do_pedido(servidor_com_cache):
+    cliente = ClienteFalso()
+    atender(servidor_com_cache, protocolo.codificar("a.txt", b"abc", meta={"id": "9", "andamento": True}), cliente)
+    etapas = [quadro.meta["etapa"] for _, quadro in cliente.publicados if quadro.tipo == protocolo.TIPO_ANDAMENTO]
+    assert etapas[:2] == ["cache", "transformacao"]
+    assert all(quadro.meta["id"] == "9" for _, quadro in cliente.publicados)
+
+
+# Fila cheia: on_message não espera; o pedido recebe um erro e o bloco de transferência é só descartado
+def test_fila_cheia_nao_bloqueia(monkeypatch):
+    monkeypatch.setattr(servidor, "fila", queue.Queue(1))
+    monkeypatch.setattr(servidor, "metricas", metricas.Metricas())
+    servidor.fila.put_nowait(None)
+    cliente = ClienteFalso()
+    pedido = protocolo.codificar("a.txt", b"abc", meta={"id": "7"})
+    bloco = protocolo.codificar("a.txt", b"abc", protocolo.TIPO_BLOCO, {"transferencia": "t1", "indice": 0})
+    for payload in (pedido, bloco):
+        servidor.on_message(cliente, None, SimpleNamespace(topic="arquivo/upload/c1", payload=payload))
+    assert [(topico, quadro.tipo, quadro.meta["id"]) for topico, quadro in cliente.publicados] == \
+        [("arquivo/download/c1", protocolo.TIPO_ERRO, "7")]
+    assert servidor.metricas.contadores()["rejeitadas"] == 2
@@ -0,0 +1,106 @@
+# Testes das tarefas do app web (tarefas.py): ordem dos blocos da resposta, texto UTF-8 cortado
+# entre blocos e leitura dos eventos a partir de uma posição (Last-Event-ID)
+import json
+
+import tarefas
+
+
+def textos(tarefa):
+    return "".join(dados["texto"] for tipo, dados in tarefa.eventos if tipo == "conteudo")
+
+
+def test_blocos_fora_de_ordem():
+    tarefa = tarefas.Tarefa("t1")
+    tarefa.iniciar_blocos(3)
+    tarefa.bloco(2, b"C")
+    tarefa.bloco(0, b"A")
+    assert textos(tarefa) == "A"
+    assert tarefa.faltantes() == [1]
+    tarefa.bloco(1, b"B")
+    # Repetidos e fora do intervalo são ignorados
+    tarefa.bloco(1, b"X")
+    tarefa.bloco(7, b"X")
+    assert textos(tarefa) == "ABC"
+    assert tarefa.faltantes() == []
+
+
+def test_mapa_de_recebidos():
+    tarefa = tarefas.Tarefa("t2")
+    tarefa.iniciar_blocos(10)
+    for indice in (0, 1, 9):
+        tarefa.bloco(indice, b"x")
+    assert tarefa.recebidos() == bytes([0b00000011, 0b00000010])
+
+
+def test_caractere_cortado_entre_blocos():
+    tarefa = tarefas.Tarefa("t3")
+    codificado = "maçã".encode("utf-8")
+    tarefa.dados(codificado[:3])
+    tarefa.dados(codificado[3:])
+    tarefa.concluir(filename="CAPS_a.txt")
+    assert textos(tarefa) == "maçã"
+    tipo, dados = tarefa.eventos[-1]
+    assert tipo == "fim" and dados["bytes"] == len(codificado)
+
+
+def test_resposta_que_nao_e_texto():
+    tarefa = tarefas.Tarefa("t4")
+    tarefa.dados("ç".encode("utf-8")[:1])
+    tarefa.concluir()
+    assert tarefa.eventos[-1][0] == "erro"
+
+
+def test_nada_depois_do_fim():
+    tarefa = tarefas.Tarefa("t5")
+    tarefa.falhar("sem resposta")
+    tarefa.etapa("recebendo", "tarde demais")
+    assert [tipo for tipo, _ in tarefa.eventos] == ["erro"]
+    eventos, terminada = tarefa.ler(0, 0)
+    assert terminada and len(eventos) == 1
+
+
+def test_ler_a_partir_da_posicao():
+    tarefa = tarefas.Tarefa("t6")
+    tarefa.etapa("recebido", "ok")
+    tarefa.publicar("progresso", fase="envio", feito=1, total=2)
+    eventos, terminada = tarefa.ler(1, 0)
+    assert eventos == [("progresso", {"fase": "envio", "feito": 1, "total": 2})]
+    assert not terminada
+    # Nada novo: devolve vazio depois da espera
+    assert tarefa.ler(2, 0.01) == ([], False)
+
+
+def test_formatar_evento_sse():
+    texto = tarefas.formatar(4, "conteudo", {"texto": "a\nb"})
+    linhas = texto.split("\n")
+    assert linhas[:2] == ["id: 4", "event: conteudo"]
+    assert json.loads(linhas[2][len("data: "):]) == {"texto": "a\nb"}
+    assert texto.endswith("\n\n")
+
+
+def test_criar_e_obter():
+    tarefa = tarefas.criar("t7")
+    assert tarefas.obter("t7") is tarefa
+    assert tarefas.obter("inexistente") is None
+
+
+# Depois de entregar o evento final, o conteúdo não fica mais guardado
+def test_conteudo_descartado_depois_do_fim():
+    tarefa = tarefas.Tarefa("t8")
+    tarefa.dados(b"x" * 1000)
+    tarefa.concluir()
+    eventos, terminada = tarefa.ler(0, 0)
+    assert terminada and [tipo for tipo, _ in eventos] == ["conteudo", "fim"]
+    assert tarefa.eventos == []
+    # Reconexão depois do fim (Last-Event-ID do último evento): nada mais a enviar
+    assert tarefa.ler(2, 0) == ([], True)
+    # Quem pedir o conteúdo de novo recebe um erro, não um arquivo pela metade
+    eventos, terminada = tarefa.ler(0, 0)
+    assert terminada and eventos[0][0] == "erro"
+
+
+def test_tarefa_terminada_expira():
+    antiga = tarefas.criar("t9")
+    antiga.falhar("sem resposta")
+    antiga.terminada -= tarefas.TEMPO_GUARDADA + 1
+    assert tarefas.obter("t9") is None
@@ -0,0 +1,244 @@
+# Testes da transferência em blocos (transferencia.py): remontagem do arquivo no destino, retomada
+# a partir do .mapa e o Envio com janela contra um destino simulado em memória
+import os
+
+import pytest
+
+import protocolo
+import transferencia
+from transferencia import Envio, JaConcluida, Remontagem
+
+
+def dados_de_teste(tamanho):
+    return bytes((i * 7) % 251 for i in range(tamanho))
+
+
+def test_quantidade_blocos():
+    assert transferencia.quantidade_blocos(0, 10) == 1      # arquivo vazio: um bloco vazio
+    assert transferencia.quantidade_blocos(10, 10) == 1
+    assert transferencia.quantidade_blocos(11, 10) == 2
+
+
+def test_mapa_de_bits():
+    assert transferencia.blocos_recebidos(bytes([0b00000101, 0b10000000]), 16) == [0, 2, 15]
+    # Bits além do último bloco são ignorados
+    assert transferencia.blocos_recebidos(bytes([0xFF]), 3) == [0, 1, 2]
+
+
+def test_identificador(tmp_path):
+    caminho = tmp_path / "a.txt"
+    caminho.write_bytes(b"abc")
+    base = transferencia.identificador("c1", str(caminho))
+    assert base.isalnum() and len(base) == 16
+    assert transferencia.identificador("c1", str(caminho), sequencia=0) == base
+    assert transferencia.identificador("c2", str(caminho)) != base
+    # Cada envio concluído leva a um identificador novo
+    seguintes = {transferencia.identificador("c1", str(caminho), sequencia=n) for n in range(1, 4)}
+    assert len(seguintes) == 3 and base not in seguintes
+    # O arquivo mudou: outra transferência
+    os.utime(caminho, ns=(1, 1))
+    assert transferencia.identificador("c1", str(caminho)) != base
+
+
+# ==========================
+# REMONTAGEM
+# ==========================
+
+def test_remontagem_fora_de_ordem(tmp_path):
+    dados = dados_de_teste(1000)
+    destino = str(tmp_path / "saida.txt")
+    remontagem = Remontagem(destino, "saida.txt", len(dados), 64)
+    ordem = list(range(remontagem.blocos))[::-1]
+    for indice in ordem:
+        assert remontagem.gravar(indice, dados[indice * 64:(indice + 1) * 64])
+        assert not remontagem.completa() or indice == ordem[-1]
+    assert remontagem.faltantes() == []
+    assert remontagem.concluir() == destino
+    assert open(destino, "rb").read() == dados
+    assert sorted(os.listdir(tmp_path)) == ["saida.txt"]
+
+
+def test_bloco_repetido(tmp_path):
+    remontagem = Remontagem(str(tmp_path / "a"), "a", 10, 4)
+    assert remontagem.gravar(1, b"bbbb")
+    assert not remontagem.gravar(1, b"xxxx")
+    assert remontagem.faltantes() == [0, 2]
+
+
+def test_arquivo_vazio(tmp_path):
+    remontagem = Remontagem(str(tmp_path / "vazio"), "vazio", 0, 4)
+    assert remontagem.faltantes() == [0]
+    remontagem.gravar(0, b"")
+    assert open(remontagem.concluir(), "rb").read() == b""
+
+
+@pytest.mark.parametrize("indice, dados", [(-1, b"aaaa"), (3, b"aa"), (0, b"aaa"), (2, b"aaaa"), (2, b"a")])
+def test_bloco_invalido(tmp_path, indice, dados):
+    # 10 bytes em blocos de 4: 0 e 1 com 4 bytes, o último com 2
+    remontagem = Remontagem(str(tmp_path / "a"), "a", 10, 4)
+    with pytest.raises(protocolo.ErroProtocolo):
+        remontagem.gravar(indice, dados)
+
+
+@pytest.mark.parametrize("tamanho, tamanho_bloco", [(-1, 4), (10, 0), (10, transferencia.TAMANHO_BLOCO_MAXIMO + 1)])
+def test_transferencia_invalida(tmp_path, tamanho, tamanho_bloco):
+    with pytest.raises(protocolo.ErroProtocolo):
+        Remontagem(str(tmp_path / "a"), "a", tamanho, tamanho_bloco)
+
+
+def test_retomada_depois_de_fechar(tmp_path):
+    dados = dados_de_teste(100)
+    destino = str(tmp_path / "a")
+    remontagem = Remontagem(destino, "a", 100, 10)
+    for indice in (0, 3, 9):
+        remontagem.gravar(indice, dados[indice * 10:(indice + 1) * 10])
+    remontagem.fechar()
+
+    retomada = Remontagem.reabrir(destino)
+    assert (retomada.nome, retomada.tamanho, retomada.tamanho_bloco) == ("a", 100, 10)
+    assert transferencia.blocos_recebidos(retomada.recebidos(), retomada.blocos) == [0, 3, 9]
+    for indice in retomada.faltantes():
+        retomada.gravar(indice, dados[indice * 10:(indice + 1) * 10])
+    assert open(retomada.concluir(), "rb").read() == dados
+
+
+def test_mapa_gravado_em_lotes(tmp_path, monkeypatch):
+    monkeypatch.setattr(transferencia, "MAPA_BLOCOS", 4)
+    monkeypatch.setattr(transferencia, "MAPA_SEGUNDOS", 3600)
+    destino = str(tmp_path / "a")
+    remontagem = Remontagem(destino, "a", 100, 10)
+    for indice in range(6):
+        remontagem.gravar(indice, bytes(10))
+    # Queda sem fechar: o .mapa em disco tem os 4 primeiros (os outros 2 seriam pedidos de novo)
+    depois_da_queda = Remontagem.reabrir(destino)
+    assert transferencia.blocos_recebidos(depois_da_queda.recebidos(), 10) == [0, 1, 2, 3]
+    depois_da_queda.fechar()
+    # Fechar grava o que faltava
+    remontagem.fechar()
+    assert transferencia.blocos_recebidos(Remontagem.reabrir(destino).recebidos(), 10) == list(range(6))
+
+
+def test_mapa_de_outro_arquivo_e_descartado(tmp_path):
+    destino = str(tmp_path / "a")
+    antiga = Remontagem(destino, "a", 100, 10)
+    antiga.gravar(0, bytes(10))
+    antiga.fechar()
+    # Mesmo destino, outro tamanho de bloco: começa do zero
+    nova = Remontagem(destino, "a", 100, 20)
+    assert nova.faltantes() == list(range(5))
+
+
+def test_reabrir_sem_mapa(tmp_path):
+    assert Remontagem.reabrir(str(tmp_path / "nao_existe")) is None
+
+
+# ==========================
+# ENVIO
+# ==========================
+
+# Destino simulado: responde na hora, como o servidor.py, gravando numa Remontagem.
+# `perder` são índices de blocos descartados na primeira vez que chegam.
+class DestinoFalso:
+
+    def __init__(self, pasta, perder=(), concluidas=()):
+        self.pasta = pasta
+        self.perder = set(perder)
+        self.concluidas = set(concluidas)
+        self.remontagens = {}
+        self.envio = None
+        self.recebidos = []             # tipos das mensagens recebidas
+
+    def is_connected(self):
+        return True
+
+    def responder(self, quadro, tipo, conteudo=b"", meta=None):
+        self.envio.tratar(protocolo.decodificar(protocolo.codificar(
+            quadro.nome, conteudo, tipo, dict(meta or {}, transferencia=quadro.meta["transferencia"]))))
+
+    def publish(self, topico, payload, qos=0):
+        quadro = protocolo.decodificar(payload)
+        ident = quadro.meta["transferencia"]
+        self.recebidos.append(quadro.tipo)
+        if ident in self.concluidas:
+            self.responder(quadro, protocolo.TIPO_CONFIRMACAO, meta={"completa": True})
+        elif quadro.tipo == protocolo.TIPO_INICIO:
+            remontagem = self.remontagens.get(ident)
+            if remontagem is None:
+                remontagem = self.remontagens[ident] = Remontagem(
+                    os.path.join(self.pasta, ident), quadro.nome, quadro.meta["tamanho"], quadro.meta["tamanho_bloco"])
+            self.responder(quadro, protocolo.TIPO_FALTANTES, remontagem.recebidos())
+        elif quadro.tipo == protocolo.TIPO_BLOCO:
+            indice = quadro.meta["indice"]
+            if indice in self.perder:
+                self.perder.discard(indice)
+                return
+            self.remontagens[ident].gravar(indice, quadro.conteudo)
+            self.responder(quadro, protocolo.TIPO_CONFIRMACAO, meta={"indices": [indice]})
+        elif quadro.tipo == protocolo.TIPO_FIM:
+            remontagem = self.remontagens[ident]
+            if not remontagem.completa():
+                self.responder(quadro, protocolo.TIPO_FALTANTES, remontagem.recebidos())
+                return
+            self.concluidas.add(ident)
+            remontagem.concluir()
+            self.responder(quadro, protocolo.TIPO_CONFIRMACAO, meta={"completa": True})
+
+
+@pytest.fixture
+def origem(tmp_path):
+    caminho = tmp_path / "origem.txt"
+    caminho.write_bytes(dados_de_teste(10_000))
+    return str(caminho)
+
+
+def enviar(destino, origem, ident="t1", progresso=None, **opcoes):
+    envio = Envio(destino, "arquivo/upload/c1", origem, "origem.txt", ident, tamanho_bloco=1000, **opcoes)
+    destino.envio = envio
+    envio.executar(progresso)
+    return envio
+
+
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_envio_completo(tmp_path, origem, codec):
+    destino = DestinoFalso(str(tmp_path))
+    avisos = []
+    envio = enviar(destino, origem, progresso=lambda feito, total: avisos.append((feito, total)), janela=3, codec=codec)
+    assert envio.completa and envio.ja_tinha == 0
+    assert open(tmp_path / "t1", "rb").read() == open(origem, "rb").read()
+    assert avisos[-1] == (10, 10)
+    assert destino.recebidos.count(protocolo.TIPO_BLOCO) == 10
+
+
+def test_envio_com_blocos_perdidos(tmp_path, origem, monkeypatch):
+    monkeypatch.setattr(transferencia, "TEMPO_CONFIRMACAO", 0.05)
+    destino = DestinoFalso(str(tmp_path), perder={2, 7})
+    envio = enviar(destino, origem)
+    assert envio.reenvios == 2
+    assert open(tmp_path / "t1", "rb").read() == open(origem, "rb").read()
+
+
+def test_envio_retomado(tmp_path, origem):
+    destino = DestinoFalso(str(tmp_path))
+    remontagem = destino.remontagens["t1"] = Remontagem(str(tmp_path / "t1"), "origem.txt", 10_000, 1000)
+    dados = open(origem, "rb").read()
+    for indice in (0, 1, 5):
+        remontagem.gravar(indice, dados[indice * 1000:(indice + 1) * 1000])
+    envio = enviar(destino, origem)
+    assert envio.ja_tinha == 3
+    assert destino.recebidos.count(protocolo.TIPO_BLOCO) == 7
+    assert open(tmp_path / "t1", "rb").read() == dados
+
+
+def test_envio_ja_concluido(tmp_path, origem):
+    with pytest.raises(JaConcluida):
+        enviar(DestinoFalso(str(tmp_path), concluidas={"t1"}), origem)
+
+
+def test_erro_do_destino(tmp_path, origem):
+    class Recusa(DestinoFalso):
+        def publish(self, topico, payload, qos=0):
+            quadro = protocolo.decodificar(payload)
+            self.responder(quadro, protocolo.TIPO_ERRO, meta={"erro": "transformação desconhecida"})
+
+    with pytest.raises(RuntimeError, match="transformação desconhecida"):
+        enviar(Recusa(str(tmp_path)), origem)
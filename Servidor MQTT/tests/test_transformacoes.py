@@ -0,0 +1,116 @@
+# Testes das transformações (transformacoes.py): o resultado processado em blocos tem que ser
+# igual ao do texto inteiro, qualquer que seja o ponto de corte (inclusive no meio de um
+# caractere UTF-8 ou de uma palavra com Σ)
+import random
+
+import pytest
+
+import transformacoes
+from transformacoes import transformar
+
+TEXTO = "Olá, ΟΔΥΣΣΕΥΣ e ΣΟΦΙΑ!\nÇãO\n\nlinha 4 com ß e 日本語\nΣ fim ΣΣ\nΑΣ"
+
+REFERENCIA = {
+    "maiusculas": str.upper,
+    "minusculas": str.lower,
+    "inverter": str.swapcase,
+    "rot13": lambda texto: __import__("codecs").encode(texto, "rot13"),
+}
+
+
+def em_blocos(dados, cortes):
+    inicio = 0
+    for corte in sorted(cortes) + [len(dados)]:
+        yield dados[inicio:corte]
+        inicio = corte
+
+
+def aplicar(nome, texto, cortes):
+    return b"".join(transformar(em_blocos(texto.encode("utf-8"), cortes), nome)).decode("utf-8")
+
+
+def numerar(texto):
+    linhas = texto.split("\n")
+    if linhas[-1] == "":
+        linhas.pop()
+        return "".join(f"{i:6d}  {linha}\n" for i, linha in enumerate(linhas, 1))
+    return "\n".join(f"{i:6d}  {linha}" for i, linha in enumerate(linhas, 1))
+
+
+@pytest.mark.parametrize("nome", sorted(REFERENCIA))
+def test_texto_inteiro(nome):
+    assert aplicar(nome, TEXTO, []) == REFERENCIA[nome](TEXTO)
+
+
+@pytest.mark.parametrize("nome", sorted(REFERENCIA) + ["numerar"])
+def test_qualquer_corte_igual_ao_texto_inteiro(nome):
+    referencia = numerar if nome == "numerar" else REFERENCIA[nome]
+    tamanho = len(TEXTO.encode("utf-8"))
+    # Um corte em cada posição (inclusive no meio dos caracteres de vários bytes)
+    for corte in range(tamanho + 1):
+        assert aplicar(nome, TEXTO, [corte]) == referencia(TEXTO), corte
+    # Vários cortes ao mesmo tempo, inclusive blocos de 1 byte e vazios
+    sorteio = random.Random(1234)
+    for _ in range(300):
+        cortes = [sorteio.randint(0, tamanho) for _ in range(sorteio.randint(1, 12))]
+        assert aplicar(nome, TEXTO, cortes) == referencia(TEXTO), cortes
+
+
+@pytest.mark.parametrize("nome", ["minusculas", "inverter"])
+def test_sigma_final_na_divisa(nome):
+    # "ΟΔΥΣΣΕΥΣ": os dois primeiros Σ estão no meio da palavra, o último no fim
+    texto = "ΟΔΥΣΣΕΥΣ ΣΟΦΙΑ"
+    posicao = len("ΟΔΥΣ".encode("utf-8"))
+    assert aplicar(nome, texto, [posicao]) == REFERENCIA[nome](texto)
+    assert "ς" not in aplicar(nome, texto, [posicao]).split()[0][:-1]
+
+
+@pytest.mark.parametrize("texto", ["", "\n", "a", "\n\n", "sem quebra no fim", "com quebra\n"])
+def test_numerar_casos_simples(texto):
+    assert aplicar("numerar", texto, []) == numerar(texto)
+
+
+def test_arquivo_vazio():
+    for nome in transformacoes.TRANSFORMACOES:
+        assert b"".join(transformar([], nome)) == b""
+
+
+def test_utf8_invalido():
+    with pytest.raises(UnicodeDecodeError):
+        b"".join(transformar([b"abc\xff"]))
+
+
+def test_caractere_cortado_no_fim_do_arquivo():
+    with pytest.raises(UnicodeDecodeError):
+        b"".join(transformar(["maçã".encode("utf-8")[:-1]]))
+
+
+# ==========================
+# REGISTRO
+# ==========================
+
+def test_obter():
+    assert transformacoes.obter() is transformacoes.Maiusculas
+    assert transformacoes.obter("rot13").prefixo == "ROT13_"
+    with pytest.raises(ValueError, match="desconhecida"):
+        transformacoes.obter("nao_existe")
+
+
+def test_base_abstrata():
+    with pytest.raises(TypeError):
+        transformacoes.Transformacao()
+    with pytest.raises(TypeError):
+        transformacoes.ConversaoCaixa()
+
+
+def test_registrar(monkeypatch):
+    monkeypatch.setattr(transformacoes, "TRANSFORMACOES", dict(transformacoes.TRANSFORMACOES))
+
+    @transformacoes.registrar("inverter_texto", "REV_")
+    class Inverter(transformacoes.Transformacao):
+        def processar(self, texto):
+            return texto[::-1]
+
+    assert transformacoes.obter("inverter_texto") is Inverter
+    assert Inverter.nome == "inverter_texto"
+    assert b"".join(transformar([b"abc"], "inverter_texto")) == b"cba"
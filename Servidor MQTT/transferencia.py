@@ -0,0 +1,390 @@
+# transferencia.py
+# Transferência de arquivos grandes em blocos, usada por cliente.py e servidor.py.
+#
+# Um arquivo grande não cabe bem numa única mensagem MQTT (o broker tem limite de tamanho de
+# payload e os dois lados precisariam do arquivo inteiro na memória). Então ele é dividido em
+# blocos numerados, enviados com as mensagens de protocolo.py:
+#
+#   remetente                                   destino
+#   INICIO (tamanho, tamanho do bloco)  ----->  abre/retoma o arquivo .part
+#                                       <-----  FALTANTES (mapa de bits dos blocos que já tem)
+#   BLOCO i (no máximo JANELA sem confirmação)  grava o bloco na posição certa do .part
+#                                       <-----  CONFIRMACAO (indices: [i])
+#   FIM                                 ----->  confere se todos os blocos chegaram
+#                                       <-----  CONFIRMACAO (completa) ou FALTANTES (reenviar)
+#
+# O destino guarda ao lado do .part um arquivo .mapa com os blocos já gravados, então uma
+# transferência interrompida (queda de conexão ou do programa) continua de onde parou: o
+# identificador da transferência é derivado do arquivo, e o INICIO repetido recebe de volta o
+# mapa com o que já chegou. A memória usada fica limitada a JANELA blocos dos dois lados.
+# Um INICIO de uma transferência que o destino já concluiu recebe só CONFIRMACAO (completa): o
+# remetente levanta JaConcluida e deve mandar o arquivo de novo com a sequência seguinte
+# (ver identificador()).
+#
+# A resposta do servidor (arquivo processado) também vai em blocos, mas sem confirmações por
+# bloco: é publicada com QoS 1 e a janela é controlada esperando a confirmação do broker
+# (wait_for_publish). Se no FIM faltar algum bloco, o cliente manda FALTANTES com o seu mapa e
+# o servidor reenvia só os blocos que faltam.
+#
+# Com vários servidores numa assinatura compartilhada (modo cluster), as respostas do servidor
+# levam metadados["instancia"]; dali em diante o remetente publica em topico_direto(), para que
+# todos os blocos cheguem à instância que está remontando o arquivo.
+#
+# Com compressão (ver compressao.py), cada BLOCO vai comprimido separadamente e o codec escolhido
+# vai em metadados["compressao"] do INICIO e do FIM: a resposta do servidor usa o mesmo codec.
+# Os índices, tamanhos e mapas de blocos se referem sempre aos bytes descomprimidos.
+
+import collections              # Fila de blocos a enviar
+import hashlib                  # Identificador da transferência
+import json                     # Cabeçalho do arquivo .mapa
+import os
+import threading
+import time
+
+import protocolo
+
+TAMANHO_BLOCO = 256 * 1024      # Bytes por bloco
+TAMANHO_BLOCO_MAXIMO = 4 * 1024 * 1024  # Blocos maiores são recusados (limita a memória do destino)
+JANELA = 8                      # Blocos enviados e ainda não confirmados
+LIMITE_MENSAGEM_UNICA = 1024 * 1024  # Arquivos maiores que isso vão em blocos
+TEMPO_CONFIRMACAO = 5.0         # Segundos sem confirmação antes de reenviar um bloco (ou o INICIO/FIM)
+TEMPO_LIMITE = 120.0            # Segundos sem nenhum progresso antes de desistir da transferência
+MAPA_BLOCOS = 16                # O .mapa é gravado a cada tantos blocos novos...
+MAPA_SEGUNDOS = 1.0             # ...ou quando a última gravação dele tiver mais que isso
+
+
+# O destino já concluiu a transferência com este identificador (resposta ao INICIO)
+class JaConcluida(RuntimeError):
+    pass
+
+
+# Identificador de uma transferência: o mesmo arquivo (caminho, tamanho e data de modificação)
+# enviado de novo pelo mesmo cliente gera o mesmo identificador, o que permite retomar o envio.
+# `sequencia` conta os envios desse arquivo que já terminaram: um envio novo depois de um concluído
+# precisa de outro identificador (o destino trata as mensagens de uma transferência concluída como
+# repetições).
+def identificador(client_id, caminho, tamanho_bloco=TAMANHO_BLOCO, sequencia=0):
+    info = os.stat(caminho)
+    chave = f"{client_id}|{os.path.abspath(caminho)}|{info.st_size}|{info.st_mtime_ns}|{tamanho_bloco}"
+    if sequencia:
+        chave += f"|{sequencia}"
+    return hashlib.sha1(chave.encode("utf-8")).hexdigest()[:16]
+
+
+# Tópico que chega só à instância `instancia` do servidor ("arquivo/upload/<id>" -> "arquivo/direto/<instancia>/<id>")
+def topico_direto(topico, instancia):
+    return f"arquivo/direto/{instancia}/{topico.rsplit('/', 1)[-1]}"
+
+
+def quantidade_blocos(tamanho, tamanho_bloco):
+    # Um arquivo vazio ainda tem um bloco (vazio), para o FIM ter o que conferir
+    return max(1, -(-tamanho // tamanho_bloco))
+
+
+def blocos_recebidos(mapa, blocos):
+    return [i for i in range(blocos) if mapa[i // 8] & (1 << (i % 8))]
+
+
+# ==========================
+# REMONTAGEM (DESTINO)
+# ==========================
+
+# Arquivo sendo recebido em blocos. Os blocos são gravados direto na posição final do arquivo
+# `destino`.part, e o mapa de bits dos blocos gravados é mantido em `destino`.mapa.
+# O .mapa não é regravado a cada bloco: só a cada MAPA_BLOCOS blocos novos, MAPA_SEGUNDOS segundos
+# ou ao fechar. Depois de uma queda ele pode estar um pouco atrás do .part (esses blocos são pedidos
+# de novo na retomada), mas nunca à frente: o .part vai para o disco (fsync) antes de cada .mapa.
+# Pode ser usada por várias threads ao mesmo tempo (cada bloco é gravado sob um lock).
+class Remontagem:
+
+    def __init__(self, destino, nome, tamanho, tamanho_bloco):
+        if tamanho < 0 or not 0 < tamanho_bloco <= TAMANHO_BLOCO_MAXIMO:
+            raise protocolo.ErroProtocolo(f"Transferência inválida: tamanho {tamanho}, bloco {tamanho_bloco}")
+        self.destino = destino
+        self.nome = nome
+        self.tamanho = tamanho
+        self.tamanho_bloco = tamanho_bloco
+        self.blocos = quantidade_blocos(tamanho, tamanho_bloco)
+        self.parcial = destino + ".part"
+        self.arquivo_mapa = destino + ".mapa"
+        self.lock = threading.Lock()
+        self.ultimo_uso = time.monotonic()
+        self.nao_salvos = 0             # Blocos gravados que o .mapa em disco ainda não registra
+        self.mapa_salvo = time.monotonic()
+
+        # Retoma uma transferência anterior se o .mapa for do mesmo arquivo
+        self.mapa = self._carregar_mapa()
+        if self.mapa is None:
+            self.mapa = bytearray(-(-self.blocos // 8))
+            self.arquivo = open(self.parcial, "w+b")
+            self.arquivo.truncate(tamanho)
+            self._salvar_mapa()
+        else:
+            self.arquivo = open(self.parcial, "r+b")
+
+    # Reabre uma transferência a partir do .mapa deixado em disco (ex: depois de reiniciar o servidor)
+    @classmethod
+    def reabrir(cls, destino):
+        try:
+            with open(destino + ".mapa", "rb") as arquivo:
+                cabecalho = json.loads(arquivo.readline())
+        except (OSError, ValueError):
+            return None
+        return cls(destino, cabecalho["nome"], cabecalho["tamanho"], cabecalho["tamanho_bloco"])
+
+    def _cabecalho(self):
+        return {"nome": self.nome, "tamanho": self.tamanho, "tamanho_bloco": self.tamanho_bloco}
+
+    def _carregar_mapa(self):
+        try:
+            if os.path.getsize(self.parcial) != self.tamanho:
+                return None
+            with open(self.arquivo_mapa, "rb") as arquivo:
+                cabecalho = json.loads(arquivo.readline())
+                mapa = bytearray(arquivo.read())
+        except (OSError, ValueError):
+            return None
+        if cabecalho != self._cabecalho() or len(mapa) != -(-self.blocos // 8):
+            return None
+        return mapa
+
+    # Grava o mapa num arquivo temporário e troca de uma vez (um .mapa pela metade nunca fica em disco).
+    # Os blocos do .part e o temporário vão para o disco antes da troca.
+    def _salvar_mapa(self):
+        self.arquivo.flush()
+        os.fsync(self.arquivo.fileno())
+        temporario = self.arquivo_mapa + ".tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(json.dumps(self._cabecalho()).encode("utf-8") + b"\n")
+            arquivo.write(self.mapa)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self.arquivo_mapa)
+        self.nao_salvos = 0
+        self.mapa_salvo = time.monotonic()
+
+    # Grava o bloco `indice`. Devolve False se ele já tinha sido recebido (reenvio).
+    def gravar(self, indice, dados):
+        if not 0 <= indice < self.blocos:
+            raise protocolo.ErroProtocolo(f"Bloco {indice} fora da transferência ({self.blocos} blocos)")
+        esperado = min(self.tamanho_bloco, self.tamanho - indice * self.tamanho_bloco)
+        if len(dados) != esperado:
+            raise protocolo.ErroProtocolo(f"Bloco {indice} com {len(dados)} bytes (esperado {esperado})")
+
+        bit = 1 << (indice % 8)
+        with self.lock:
+            self.ultimo_uso = time.monotonic()
+            if self.mapa[indice // 8] & bit:
+                return False
+            self.arquivo.seek(indice * self.tamanho_bloco)
+            self.arquivo.write(dados)
+            self.mapa[indice // 8] |= bit
+            self.nao_salvos += 1
+            if self.nao_salvos >= MAPA_BLOCOS or self.ultimo_uso - self.mapa_salvo >= MAPA_SEGUNDOS:
+                self._salvar_mapa()
+            return True
+
+    # Mapa de bits dos blocos recebidos (bit i do byte i // 8)
+    def recebidos(self):
+        with self.lock:
+            return bytes(self.mapa)
+
+    def faltantes(self):
+        recebidos = set(blocos_recebidos(self.recebidos(), self.blocos))
+        return [i for i in range(self.blocos) if i not in recebidos]
+
+    def completa(self):
+        return not self.faltantes()
+
+    # Fecha o arquivo mantendo .part e .mapa (a transferência pode ser retomada depois)
+    def fechar(self, salvar=True):
+        with self.lock:
+            if self.arquivo.closed:
+                return
+            if salvar and self.nao_salvos:
+                self._salvar_mapa()
+            self.arquivo.close()
+
+    # Todos os blocos chegaram: o .part vira o arquivo final e o .mapa é apagado
+    def concluir(self):
+        self.fechar(salvar=False)
+        os.replace(self.parcial, self.destino)
+        os.remove(self.arquivo_mapa)
+        return self.destino
+
+# ==========================
+# ENVIO COM CONFIRMAÇÃO (REMETENTE)
+# ==========================
+
+# Envia um arquivo em blocos para `topico`, com no máximo `janela` blocos sem confirmação.
+# As respostas do destino (CONFIRMACAO, FALTANTES, ERRO com este identificador) devem ser
+# repassadas a tratar() pelo on_message de quem usa a classe.
+# Com `codec`, os blocos vão comprimidos.
+class Envio:
+
+    def __init__(self, client, topico, caminho, nome, transferencia, tamanho_bloco=TAMANHO_BLOCO,
+                 janela=JANELA, meta=None, codec=None):
+        self.client = client
+        self.topico = topico
+        self.caminho = caminho
+        self.nome = nome
+        self.transferencia = transferencia
+        self.tamanho = os.path.getsize(caminho)
+        self.tamanho_bloco = tamanho_bloco
+        self.blocos = quantidade_blocos(self.tamanho, tamanho_bloco)
+        self.janela = janela
+        self.meta = dict(meta or {}, compressao=codec) if codec else (meta or {})
+        self.codec = codec
+
+        self.condicao = threading.Condition()
+        self.estado = None              # Blocos que o destino já tem (resposta ao INICIO/FIM)
+        self.confirmados = set()
+        self.completa = False
+        self.erro = None
+        self.ultimo_progresso = time.monotonic()
+        self.reenvios = 0
+        self.ja_tinha = 0               # Blocos que o destino já tinha de um envio anterior (retomada)
+
+    # Chamado pelo on_message (thread de rede do paho)
+    def tratar(self, quadro):
+        with self.condicao:
+            # Modo cluster: o resto da transferência vai direto para a instância que respondeu
+            instancia = quadro.meta.get("instancia")
+            if instancia:
+                self.topico = topico_direto(self.topico, instancia)
+            if quadro.tipo == protocolo.TIPO_FALTANTES:
+                if len(quadro.conteudo) < -(-self.blocos // 8):
+                    self.erro = "Mapa de blocos recebidos inválido"
+                else:
+                    # O mapa do destino é a referência: o que não está nele precisa ser (re)enviado
+                    self.estado = blocos_recebidos(quadro.conteudo, self.blocos)
+                    self.confirmados = set(self.estado)
+            elif quadro.tipo == protocolo.TIPO_CONFIRMACAO:
+                if quadro.meta.get("completa"):
+                    self.completa = True
+                self.confirmados.update(quadro.meta.get("indices", ()))
+            elif quadro.tipo == protocolo.TIPO_ERRO:
+                self.erro = quadro.meta.get("erro", "erro no destino")
+            self.ultimo_progresso = time.monotonic()
+            self.condicao.notify_all()
+
+    def _publicar(self, tipo, conteudo=b"", meta=None):
+        meta = dict(meta or {}, transferencia=self.transferencia)
+        # Enquanto a conexão está caída, não acumula reenvios na fila de saída do paho
+        if self.client.is_connected():
+            self.client.publish(self.topico, protocolo.codificar(self.nome, conteudo, tipo, meta, codec=self.codec),
+                                qos=1)
+
+    # Espera até condicao() ser verdadeira, repetindo `repetir` a cada TEMPO_CONFIRMACAO
+    def _esperar(self, condicao, repetir):
+        with self.condicao:
+            while True:
+                self._conferir()
+                if condicao():
+                    return
+                if not self.condicao.wait(TEMPO_CONFIRMACAO):
+                    repetir()
+
+    def _conferir(self):
+        if self.erro:
+            raise RuntimeError(self.erro)
+        if time.monotonic() - self.ultimo_progresso > TEMPO_LIMITE:
+            raise TimeoutError(f"Sem resposta do destino há {TEMPO_LIMITE:.0f}s")
+
+    def _enviar_bloco(self, arquivo, indice):
+        arquivo.seek(indice * self.tamanho_bloco)
+        self._publicar(protocolo.TIPO_BLOCO, arquivo.read(self.tamanho_bloco), {"indice": indice})
+
+    # Envia o arquivo inteiro (ou o que falta dele) e espera a confirmação final.
+    # `progresso(enviados, total)` é chamada a cada bloco confirmado.
+    def executar(self, progresso=None):
+        inicio = dict(self.meta, tamanho=self.tamanho, tamanho_bloco=self.tamanho_bloco)
+        enviar_inicio = lambda: self._publicar(protocolo.TIPO_INICIO, meta=inicio)
+        enviar_inicio()
+        self._esperar(lambda: self.estado is not None or self.completa, enviar_inicio)
+        if self.estado is None:
+            raise JaConcluida(f"Transferência {self.transferencia} já concluída no destino")
+        self.ja_tinha = len(self.estado)
+
+        with open(self.caminho, "rb") as arquivo:
+            while True:
+                with self.condicao:
+                    pendentes = collections.deque(i for i in range(self.blocos) if i not in self.confirmados)
+                    self.estado = None
+                self._enviar_janela(arquivo, pendentes, progresso)
+
+                # Todos confirmados: FIM. O destino responde "completa" ou o mapa do que falta.
+                enviar_fim = lambda: self._publicar(protocolo.TIPO_FIM, meta=self.meta)
+                enviar_fim()
+                self._esperar(lambda: self.completa or self.estado is not None, enviar_fim)
+                if self.completa:
+                    return
+
+    def _enviar_janela(self, arquivo, pendentes, progresso):
+        em_voo = {}                     # indice -> instante do último envio
+        while pendentes or em_voo:
+            with self.condicao:
+                self._conferir()
+                for indice in [i for i in em_voo if i in self.confirmados]:
+                    del em_voo[indice]
+                    if progresso:
+                        progresso(len(self.confirmados), self.blocos)
+                agora = time.monotonic()
+                atrasados = [i for i, instante in em_voo.items() if agora - instante > TEMPO_CONFIRMACAO]
+
+            # Blocos sem confirmação há muito tempo são reenviados (mensagem ou confirmação perdida)
+            for indice in atrasados:
+                self.reenvios += 1
+                self._enviar_bloco(arquivo, indice)
+                em_voo[indice] = time.monotonic()
+
+            while pendentes and len(em_voo) < self.janela:
+                indice = pendentes.popleft()
+                if indice not in self.confirmados:
+                    self._enviar_bloco(arquivo, indice)
+                    em_voo[indice] = time.monotonic()
+
+            with self.condicao:
+                if em_voo and not any(i in self.confirmados for i in em_voo):
+                    self.condicao.wait(0.5)
+
+# ==========================
+# ENVIO SEM CONFIRMAÇÃO (RESPOSTA DO SERVIDOR)
+# ==========================
+
+# Publica o arquivo `caminho` em blocos (INICIO, BLOCO..., FIM) com QoS 1, mantendo no máximo
+# `janela` blocos sem confirmação do broker. O destino remonta com Remontagem.
+# Com `indices`, reenvia só esses blocos (e o FIM), sem o INICIO. Com `codec`, os blocos vão comprimidos.
+# Devolve o total de bytes publicados.
+def enviar_arquivo(client, topico, caminho, nome, transferencia, meta=None, tamanho_bloco=TAMANHO_BLOCO,
+                   janela=JANELA, indices=None, codec=None):
+    tamanho = os.path.getsize(caminho)
+    meta = dict(meta or {}, transferencia=transferencia)
+    em_voo = collections.deque()
+    publicados = 0
+
+    def publicar(tipo, conteudo=b"", extra=None):
+        nonlocal publicados
+        payload = protocolo.codificar(nome, conteudo, tipo, dict(meta, **(extra or {})), codec=codec)
+        publicados += len(payload)
+        info = client.publish(topico, payload, qos=1)
+        em_voo.append(info)
+        while len(em_voo) > janela:
+            aguardar(em_voo.popleft())
+
+    def aguardar(info):
+        info.wait_for_publish(TEMPO_LIMITE)
+        if not info.is_published():
+            raise TimeoutError(f"Broker não confirmou a publicação em {TEMPO_LIMITE:.0f}s")
+
+    if indices is None:
+        publicar(protocolo.TIPO_INICIO, extra={"tamanho": tamanho, "tamanho_bloco": tamanho_bloco})
+        indices = range(quantidade_blocos(tamanho, tamanho_bloco))
+    with open(caminho, "rb") as arquivo:
+        for indice in indices:
+            arquivo.seek(indice * tamanho_bloco)
+            publicar(protocolo.TIPO_BLOCO, arquivo.read(tamanho_bloco), {"indice": indice})
+    publicar(protocolo.TIPO_FIM)
+    while em_voo:
+        aguardar(em_voo.popleft())
+    return publicados
@@ -0,0 +1,159 @@
+# transformacoes.py
+# Transformações de texto que o servidor sabe aplicar, e o pipeline que as executa aos poucos.
+#
+# O pedido escolhe a transformação em metadados["transformacao"] (padrão: "maiusculas", o
+# comportamento original do servidor). Para criar uma nova, basta uma classe com o decorador
+# @registrar: processar(texto) recebe o texto em partes e devolve a parte transformada;
+# finalizar() devolve o que ainda tiver guardado no fim do arquivo (para transformações com estado).
+#
+# transformar() recebe o arquivo em blocos de bytes e devolve blocos de bytes já transformados,
+# decodificando o UTF-8 de forma incremental: um caractere de vários bytes cortado na divisa entre
+# dois blocos é completado com o bloco seguinte. Assim o arquivo nunca precisa estar inteiro na
+# memória como bytes e como texto ao mesmo tempo.
+
+import abc
+import codecs
+
+PADRAO = "maiusculas"
+TAMANHO_BLOCO = 64 * 1024       # Bytes processados por vez
+
+# nome -> classe da transformação
+TRANSFORMACOES = {}
+
+
+# Registra a classe com o nome usado nos pedidos e o prefixo do arquivo gerado
+def registrar(nome, prefixo):
+    def decorar(classe):
+        classe.nome = nome
+        classe.prefixo = prefixo
+        TRANSFORMACOES[nome] = classe
+        return classe
+    return decorar
+
+
+# Classe da transformação pedida (ValueError se não existir)
+def obter(nome=None):
+    try:
+        return TRANSFORMACOES[nome or PADRAO]
+    except KeyError:
+        raise ValueError(f"Transformação desconhecida: {nome} (disponíveis: {', '.join(TRANSFORMACOES)})")
+
+
+class Transformacao(abc.ABC):
+
+    nome = None
+    prefixo = ""
+
+    @abc.abstractmethod
+    def processar(self, texto):
+        ...
+
+    def finalizar(self):
+        return ""
+
+
+# Base das transformações de caixa que dependem do contexto. Em lower() e swapcase() o sigma
+# maiúsculo "Σ" vira "ς" no fim de uma palavra e "σ" no meio dela, e o Python decide isso olhando
+# os caracteres vizinhos. Processando bloco a bloco, uma palavra cortada na divisa teria o Σ
+# tratado como fim de palavra. Por isso o último caractere de cada bloco só é entregue com o bloco
+# seguinte, e cada conversão inclui um caractere de contexto de cada lado, que sai do resultado.
+# Limitação: só um caractere de contexto. Se na divisa houver, junto do Σ, um sinal que o Unicode
+# ignora na caixa (apóstrofo, ponto, acento combinante), ele ainda pode sair diferente do texto inteiro.
+class ConversaoCaixa(Transformacao):
+
+    def __init__(self):
+        self.anterior = ""              # Último caractere já entregue (contexto à esquerda)
+        self.pendente = ""              # Último caractere recebido, ainda não entregue
+
+    # Conversão do texto inteiro (ex: str.lower)
+    @abc.abstractmethod
+    def converter(self, texto):
+        ...
+
+    def processar(self, texto):
+        texto = self.pendente + texto
+        if len(texto) < 2:
+            self.pendente = texto
+            return ""
+        corpo, self.pendente = texto[:-1], texto[-1]
+        # O pendente entra como contexto à direita. Fora do Σ, a conversão de um caractere não depende
+        # dos vizinhos, então os caracteres de contexto ocupam no resultado o mesmo que sozinhos.
+        convertido = self.converter(self.anterior + texto)
+        inicio = len(self.converter(self.anterior))
+        fim = len(convertido) - len(self.converter(self.pendente))
+        self.anterior = corpo[-1]
+        return convertido[inicio:fim]
+
+    def finalizar(self):
+        convertido = self.converter(self.anterior + self.pendente)[len(self.converter(self.anterior)):]
+        self.pendente = ""
+        return convertido
+
+
+@registrar("maiusculas", "CAPS_")
+class Maiusculas(Transformacao):
+
+    def processar(self, texto):
+        return texto.upper()
+
+
+@registrar("minusculas", "LOWER_")
+class Minusculas(ConversaoCaixa):
+
+    def converter(self, texto):
+        return texto.lower()
+
+
+@registrar("inverter", "SWAP_")
+class InverterCaixa(ConversaoCaixa):
+
+    def converter(self, texto):
+        return texto.swapcase()
+
+
+@registrar("rot13", "ROT13_")
+class Rot13(Transformacao):
+
+    def processar(self, texto):
+        return codecs.encode(texto, "rot13")
+
+
+# Numera as linhas. Tem estado: o número da linha e se o bloco anterior terminou no meio de uma linha.
+@registrar("numerar", "NUM_")
+class NumerarLinhas(Transformacao):
+
+    def __init__(self):
+        self.linha = 0
+        self.inicio_linha = True
+
+    def processar(self, texto):
+        partes = []
+        pedacos = texto.split("\n")
+        for i, pedaco in enumerate(pedacos):
+            ultimo = i == len(pedacos) - 1
+            # O último pedaço vazio é só o fim do bloco, não uma linha nova
+            if pedaco or not ultimo:
+                if self.inicio_linha:
+                    self.linha += 1
+                    partes.append(f"{self.linha:6d}  ")
+                partes.append(pedaco)
+                self.inicio_linha = False
+            if not ultimo:
+                partes.append("\n")
+                self.inicio_linha = True
+        return "".join(partes)
+
+
+# Aplica a transformação `nome` a um arquivo UTF-8 recebido em blocos de bytes (qualquer iterável),
+# devolvendo os blocos transformados, também em UTF-8
+def transformar(blocos, nome=None):
+    transformacao = obter(nome)()
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    for bloco in blocos:
+        texto = decodificador.decode(bloco)
+        if texto:
+            yield transformacao.processar(texto).encode("utf-8")
+    # final=True: bytes de um caractere incompleto no fim do arquivo são um erro de UTF-8
+    resto = transformacao.processar(decodificador.decode(b"", final=True)) + transformacao.finalizar()
+    if resto:
+        yield resto.encode("utf-8")